@@ -1,14 +1,23 @@
+import os
+import time
 import streamlit as st
 import requests
-import base64
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 import pandas as pd
 import json
 
 # Configurações de URL
-FNN_URL = "http://127.0.0.1:5001"
-CNN_URL = "http://127.0.0.1:5002"
-RNN_URL = "http://127.0.0.1:5003"
+FNN_URL = os.environ.get("FNN_URL", "http://127.0.0.1:5001")
+CNN_URL = os.environ.get("CNN_URL", "http://127.0.0.1:5002")
+RNN_URL = os.environ.get("RNN_URL", "http://127.0.0.1:5003")
+# Gateway unificado (opcional): a Análise Combinada vira uma única chamada a /predict/field_visit
+GATEWAY_URL = os.environ.get("GATEWAY_URL", "")
+
+# Timeouts (s): conexão curta para detectar serviço fora do ar; leitura cobre a inferência
+CONNECT_TIMEOUT = float(os.environ.get("DASHBOARD_CONNECT_TIMEOUT_S", "2"))
+READ_TIMEOUT = float(os.environ.get("DASHBOARD_READ_TIMEOUT_S", "30"))
 
 st.set_page_config(layout="wide")
 st.title("🌱 Agrointeligência MVP - Plataforma de Predição")
@@ -16,17 +25,46 @@ st.title("🌱 Agrointeligência MVP - Plataforma de Predição")
 # ---------------------------------------------------------
 # UTILS
 # ---------------------------------------------------------
-def call_api(url, endpoint, data):
-    """Função genérica para chamar os endpoints de predição."""
+@st.cache_resource
+def get_session(url):
+    """Sessão HTTP por serviço, compartilhada entre execuções do script (conexões keep-alive)."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=8, max_retries=0)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def call_api(url, endpoint, data, content_type=None, session=None, files=None):
+    """Função genérica para chamar os endpoints de predição.
+
+    Com `content_type`, `data` é enviado como corpo binário (ex.: image/jpeg) em vez de JSON;
+    com `files`, vai como multipart (campos de formulário em `data`).
+    Retorna (resposta, erro, latência de ida e volta em ms). Chamadas feitas fora da thread
+    do Streamlit recebem a `session` já resolvida.
+    """
     full_url = f"{url}{endpoint}"
+    session = session or get_session(url)
+    timeout = (CONNECT_TIMEOUT, READ_TIMEOUT)
+    started_at = time.perf_counter()
     try:
-        response = requests.post(full_url, json=data)
+        if files:
+            response = session.post(full_url, data=data, files=files, timeout=timeout)
+        elif content_type:
+            response = session.post(full_url, data=data, headers={"Content-Type": content_type}, timeout=timeout)
+        else:
+            response = session.post(full_url, json=data, timeout=timeout)
         response.raise_for_status() # Levanta erro para status 4xx/5xx
-        return response.json(), None
+        return response.json(), None, (time.perf_counter() - started_at) * 1000
     except requests.exceptions.ConnectionError:
-        return None, f"Erro de Conexão: O serviço Flask em {url} não está rodando."
+        error = f"Erro de Conexão: O serviço Flask em {url} não está rodando."
+    except requests.exceptions.Timeout:
+        error = f"Tempo esgotado: o serviço em {url} não respondeu em {READ_TIMEOUT:g}s."
     except requests.exceptions.RequestException as e:
-        return None, f"Erro da API ({response.status_code}): {response.text}"
+        error = f"Erro da API ({e.response.status_code}): {e.response.text}" if e.response is not None else f"Erro da API: {e}"
+    return None, error, (time.perf_counter() - started_at) * 1000
+
+def show_latency(latency_ms):
+    st.caption(f"⏱️ Latência (ida e volta): {latency_ms:.0f} ms")
 
 # ---------------------------------------------------------
 # FNN - Predição de Rendimento
@@ -59,7 +97,8 @@ def fnn_tab():
     with col2:
         if st.button("PREDIZER RENDIMENTO (FNN)", key="fnn_predict"):
             with st.spinner('Aguardando resposta do modelo...'):
-                response_data, error = call_api(FNN_URL, "/predict/soil_data", input_data)
+                response_data, error, latency_ms = call_api(FNN_URL, "/predict/soil_data", input_data)
+                show_latency(latency_ms)
                 
                 if error:
                     st.error(error)
@@ -93,14 +132,13 @@ def cnn_tab():
         
         if st.button("PREDIZER DOENÇA (CNN)", key="cnn_predict"):
             with st.spinner('Aguardando resposta do modelo...'):
-                # 1. Conversão para Base64
+                # 1. Envio binário (sem Base64): o corpo da requisição é a própria imagem
                 file_bytes = uploaded_file.getvalue()
-                image_base64 = base64.b64encode(file_bytes).decode('utf-8')
-                
-                input_data = {"image_base64": image_base64}
+                content_type = uploaded_file.type or "application/octet-stream"
 
                 # 2. Chamada à API
-                response_data, error = call_api(CNN_URL, "/predict/leaf_image", input_data)
+                response_data, error, latency_ms = call_api(CNN_URL, "/predict/leaf_image", file_bytes, content_type=content_type)
+                show_latency(latency_ms)
                 
                 if error:
                     st.error(error)
@@ -141,7 +179,8 @@ def rnn_tab():
     
     if st.button("PREDIZER URGÊNCIA (RNN)", key="rnn_predict"):
         with st.spinner('Aguardando resposta do modelo...'):
-            response_data, error = call_api(RNN_URL, "/predict/note", input_data)
+            response_data, error, latency_ms = call_api(RNN_URL, "/predict/note", input_data)
+            show_latency(latency_ms)
             
             if error:
                 st.error(error)
@@ -166,10 +205,102 @@ def rnn_tab():
                 st.error("Erro desconhecido na predição.")
 
 
+# ---------------------------------------------------------
+# Análise Combinada - FNN, CNN e RNN em paralelo
+# ---------------------------------------------------------
+# Nome exibido -> chave do resultado no gateway
+GATEWAY_KEYS = {"Solo (FNN)": "soil", "Imagem (CNN)": "leaf", "Nota (RNN)": "note"}
+
+def call_gateway(calls):
+    """Mesmas chamadas da Análise Combinada numa única requisição multipart ao gateway.
+
+    Retorna {nome: (resposta, erro, latência em ms)} como as chamadas diretas; a latência
+    de cada modelo é a medida pelo gateway.
+    """
+    payload = {"soil": calls["Solo (FNN)"][2]}
+    if "Nota (RNN)" in calls:
+        payload["note"] = calls["Nota (RNN)"][2]["nota"]
+    files = None
+    if "Imagem (CNN)" in calls:
+        # Com imagem: multipart (a imagem segue binária, sem Base64)
+        _, _, image, content_type = calls["Imagem (CNN)"]
+        files = {"image": ("leaf", image, content_type)}
+        payload["soil"] = json.dumps(payload["soil"])
+    response_data, error, latency_ms = call_api(GATEWAY_URL, "/predict/field_visit", payload, files=files)
+    if error:
+        return {name: (None, error, latency_ms) for name in calls}
+    results = {}
+    for name in calls:
+        result = response_data["results"][GATEWAY_KEYS[name]]
+        if result["http_status"] == 200:
+            results[name] = (result, None, result["latency_ms"])
+        else:
+            results[name] = (None, f"Erro da API ({result['http_status']}): {result.get('message')}", result["latency_ms"])
+    return results
+
+def combined_tab():
+    st.header("Análise Combinada (FNN + CNN + RNN)")
+    st.subheader("Solo, imagem e nota de campo avaliados ao mesmo tempo")
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.markdown("**Solo/Clima**")
+        soil_data = {
+            "temperatura": st.slider("Temperatura (°C)", 15.0, 35.0, 25.0, 0.1, key="combined_temperatura"),
+            "umidade": st.slider("Umidade do Ar (%)", 40, 95, 65, key="combined_umidade"),
+            "chuva": st.slider("Chuva (mm)", 0, 200, 100, key="combined_chuva"),
+            "ph": st.slider("PH do Solo", 5.0, 7.5, 6.5, 0.1, key="combined_ph"),
+        }
+    with col2:
+        st.markdown("**Imagem Foliar**")
+        uploaded_file = st.file_uploader("Imagem da folha (opcional):", type=['png', 'jpg', 'jpeg'], key="combined_image")
+        if uploaded_file is not None:
+            st.image(uploaded_file, width=180)
+    with col3:
+        st.markdown("**Nota de Campo**")
+        note_text = st.text_area("Nota (opcional):", "Folhas amareladas no talhão 3. Verificar irrigação.", key="combined_note")
+
+    if not st.button("ANALISAR TUDO", key="combined_predict"):
+        return
+
+    # Cada chamada usa a sessão do seu serviço, resolvida aqui na thread do Streamlit
+    calls = {"Solo (FNN)": (FNN_URL, "/predict/soil_data", soil_data, None)}
+    if uploaded_file is not None:
+        calls["Imagem (CNN)"] = (CNN_URL, "/predict/leaf_image", uploaded_file.getvalue(),
+                                 uploaded_file.type or "application/octet-stream")
+    if note_text.strip():
+        calls["Nota (RNN)"] = (RNN_URL, "/predict/note", {"nota": note_text}, None)
+
+    with st.spinner('Consultando os modelos em paralelo...'):
+        started_at = time.perf_counter()
+        if GATEWAY_URL:
+            results = call_gateway(calls)
+        else:
+            with ThreadPoolExecutor(max_workers=len(calls)) as executor:
+                futures = {name: executor.submit(call_api, url, endpoint, data, content_type, get_session(url))
+                           for name, (url, endpoint, data, content_type) in calls.items()}
+                results = {name: future.result() for name, future in futures.items()}
+        total_ms = (time.perf_counter() - started_at) * 1000
+
+    for column, (name, (response_data, error, latency_ms)) in zip(st.columns(len(results)), results.items()):
+        with column:
+            st.markdown(f"**{name}**")
+            if error:
+                st.error(error)
+            elif response_data and response_data.get('status') == 'success':
+                st.metric(label=response_data['prediction_label'], value=f"{response_data['confidence_score']*100:.2f}%")
+            else:
+                st.error("Erro desconhecido na predição.")
+            show_latency(latency_ms)
+
+    sequential_ms = sum(latency_ms for _, _, latency_ms in results.values())
+    st.info(f"Tempo total em paralelo: {total_ms:.0f} ms (soma das chamadas: {sequential_ms:.0f} ms)")
+
+
 # ---------------------------------------------------------
 # NAVEGAÇÃO PRINCIPAL
 # ---------------------------------------------------------
-tab1, tab2, tab3 = st.tabs(["FNN - Solo", "CNN - Imagem", "RNN - Texto"])
+tab1, tab2, tab3, tab4 = st.tabs(["FNN - Solo", "CNN - Imagem", "RNN - Texto", "Análise Combinada"])
 
 with tab1:
     fnn_tab()
@@ -180,6 +311,9 @@ with tab2:
 with tab3:
     rnn_tab()
 
+with tab4:
+    combined_tab()
+
 st.sidebar.title("Instruções de Execução")
 st.sidebar.markdown("""
 1.  **Iniciar os 3 Serviços Flask:**
@@ -187,6 +321,8 @@ st.sidebar.markdown("""
     - `python fnn_service/api.py` (Porta 5001)
     - `python cnn_service/api.py` (Porta 5002)
     - `python rnn_service/api.py` (Porta 5003)
+    - Opcional: `python gateway_service/api.py` (Porta 5000) e `GATEWAY_URL=http://127.0.0.1:5000`
+      para a Análise Combinada usar o gateway
 
 2.  **Iniciar o Dashboard Streamlit:**
     No quarto terminal (na pasta raiz), execute:
@@ -1,137 +1,324 @@
 import os
-import time
+import sys
 import base64
+from io import BytesIO
 import numpy as np # Novo: Para manipular arrays
 from flask import Flask, request, jsonify
-from tensorflow.keras.models import load_model # Novo: Para carregar o modelo Keras
-from tensorflow.keras.preprocessing.image import img_to_array, load_img # Novo: Para processar a imagem
+from micro_batcher import MicroBatcher
+from leaf_preprocessing import IMG_SIZE, preprocess_leaf_image
+from tflite_engine import TFLiteCNN, tflite_filename
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Raiz do projeto (pacote common)
+from common.startup import StartupState, register_ready_endpoint, warmup_batch_sizes
+from common.metrics import ServiceMetrics, register_metrics_endpoint
+from common.hot_reload import ModelBundle, ModelReloader, register_reload_endpoints
+from common.registry import ArtifactSource
+from leaf_store import LeafImageStore, UnsupportedImage
+from prediction_cache import LRUCache, content_key
 
 app = Flask(__name__)
-UPLOAD_FOLDER = 'uploads' 
+startup = StartupState('cnn')
+register_ready_endpoint(app, startup)
+metrics = ServiceMetrics('cnn') # Contagens e latência por etapa em GET /metrics (METRICS_ENABLED=0 desliga)
+register_metrics_endpoint(app)
+UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads') # Independe do diretório de trabalho
+# Imagens ingeridas por conteúdo (uploads/objects/..) + índice uploads/index.jsonl
+leaf_store = LeafImageStore(UPLOAD_FOLDER, fsync=os.environ.get('CNN_STORE_FSYNC', '0') == '1')
+
+# Modelo + versão (hash do artefato) ativos, trocados juntos na recarga a quente
+cnn_bundle = None
+MODEL_DIR = os.environ.get('CNN_MODEL_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model_artifacts'))
+
+# Backend de inferência: Keras (cnn_model.h5) ou interpretador TFLite (export_tflite.py)
+CNN_BACKEND = os.environ.get('CNN_BACKEND', 'keras') # keras | tflite
+CNN_TFLITE_VARIANT = os.environ.get('CNN_TFLITE_VARIANT', 'int8') # int8 | float16
+CNN_TFLITE_THREADS = int(os.environ.get('CNN_TFLITE_THREADS', '0')) or None # 0: padrão do interpretador
+MODEL_FILE = tflite_filename(CNN_TFLITE_VARIANT) if CNN_BACKEND == 'tflite' else 'cnn_model.h5'
+ARTIFACTS = (MODEL_FILE,)
+# Versão do registro (common/registry.py): latest, vNNNN ou vazio (só MODEL_DIR); sem registro usa MODEL_DIR
+MODEL_VERSION = os.environ.get('CNN_MODEL_VERSION', 'latest')
+model_source = ArtifactSource('cnn', MODEL_VERSION, MODEL_DIR, ARTIFACTS)
 
-# Variáveis globais para armazenar o modelo
-cnn_model = None
-IMG_SIZE = (64, 64) # Tamanho que o modelo foi treinado
-MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model_artifacts')
+# Micro-batching (opcional): agrupa requisições concorrentes em um único predict
+BATCHING_ENABLED = os.environ.get('CNN_BATCHING', '0') == '1'
+BATCH_MAX_SIZE = int(os.environ.get('CNN_BATCH_MAX_SIZE', '16'))
+BATCH_MAX_WAIT_MS = float(os.environ.get('CNN_BATCH_MAX_WAIT_MS', '5'))
+BATCH_TIMEOUT_S = float(os.environ.get('CNN_BATCH_TIMEOUT_S', '30')) # Espera máxima pelo lote antes de responder 503
+leaf_batcher = None
+
+# Cache LRU de predições por conteúdo da imagem (CNN_CACHE_MAX_ENTRIES=0 desabilita)
+CACHE_MAX_ENTRIES = int(os.environ.get('CNN_CACHE_MAX_ENTRIES', '10000'))
+CACHE_MAX_BYTES = int(os.environ.get('CNN_CACHE_MAX_BYTES', str(16 * 1024 * 1024)))
+CACHE_TTL_S = float(os.environ.get('CNN_CACHE_TTL_S', '3600'))
+prediction_cache = LRUCache(CACHE_MAX_ENTRIES, CACHE_MAX_BYTES, CACHE_TTL_S) if CACHE_MAX_ENTRIES > 0 else None
 
 # ----------------------------------------------------
 # Função de Carga (Nova)
 # ----------------------------------------------------
+def build_cnn_bundle(phase):
+    """Carrega o modelo CNN (registro ou MODEL_DIR) num bundle novo."""
+    with phase('verify'):
+        entry, version = model_source.open()
+    model_path = model_source.path(entry, MODEL_FILE)
+    if CNN_BACKEND == 'tflite':
+        # Só o interpretador: o TensorFlow não é importado. O .tflite é mapeado
+        # em memória pelo interpretador, então os workers compartilham os pesos.
+        with phase('load'):
+            model = TFLiteCNN(model_path, num_threads=CNN_TFLITE_THREADS)
+    else:
+        # Import tardio do TensorFlow: o servidor HTTP sobe antes desta etapa
+        with phase('import'):
+            from tensorflow.keras.models import load_model
+
+        with phase('load'):
+            model = load_model(model_path)
+    print(f"Modelo CNN ({CNN_BACKEND}) carregado com sucesso de: {model_path} (versão {version})")
+    return ModelBundle(model, version)
+
 def load_cnn_artifact():
-    """Carrega o modelo CNN na memória."""
-    global cnn_model
+    """Carrega o modelo CNN na memória (inicialização)."""
+    global cnn_bundle
     try:
-        model_path = os.path.join(MODEL_DIR, 'cnn_model.h5')
-        cnn_model = load_model(model_path)
-        print(f"Modelo CNN carregado com sucesso de: {model_path}")
+        cnn_bundle = build_cnn_bundle(startup.phase)
+        return True
         
     except Exception as e:
         print(f"ERRO ao carregar artefatos CNN. Execute Etapa 3: {e}")
-        cnn_model = None
+        cnn_bundle = None
+        return False
+
+def _predict_batch(img_batch, bundle=None):
+    """Executa o forward pass da CNN sobre um lote (N, 64, 64, 3).
+
+    Chamada direta (`model(x, training=False)`): evita o overhead por chamada e a
+    barra de progresso do `predict`. O TFLiteCNN expõe a mesma interface.
+    """
+    return np.asarray((bundle or cnn_bundle).model(img_batch, training=False))
+
+def warmup_cnn(batch_size, bundle=None):
+    """Roda um lote fictício para que a primeira requisição real não pague o tracing do grafo."""
+    _predict_batch(np.zeros((batch_size, IMG_SIZE[0], IMG_SIZE[1], 3), dtype=np.float32), bundle)
+
+def swap_cnn_bundle(bundle):
+    global cnn_bundle
+    cnn_bundle = bundle
+    # Predições em cache pertencem ao modelo anterior (as chaves já incluem a versão; libera a memória)
+    if prediction_cache is not None:
+        prediction_cache.clear()
+
+reloader = ModelReloader(startup, MODEL_DIR, ARTIFACTS, build_cnn_bundle, warmup_cnn,
+                         warmup_batch_sizes(f"1,{BATCH_MAX_SIZE}" if BATCHING_ENABLED else '1'),
+                         swap_cnn_bundle, lambda: cnn_bundle,
+                         version_fn=model_source.version, signature_fn=model_source.signature)
+register_reload_endpoints(app, reloader)
+
+def start_batcher():
+    """Inicia o worker de micro-batching, se habilitado via CNN_BATCHING=1."""
+    global leaf_batcher
+    if BATCHING_ENABLED and leaf_batcher is None:
+        leaf_batcher = MicroBatcher(_predict_batch, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS).start()
+        print(f"Micro-batching ativo: até {BATCH_MAX_SIZE} imagens ou {BATCH_MAX_WAIT_MS} ms por lote")
+
+# ----------------------------------------------------
+# Leitura da imagem enviada (JSON Base64, multipart ou corpo binário)
+# ----------------------------------------------------
+def _is_binary_upload():
+    return 'image' in request.files or request.mimetype.startswith('image/')
+
+def _request_label():
+    """Rótulo do upload binário: campo de formulário (multipart) ou query string (?label=)."""
+    label = request.form.get('label') or request.args.get('label')
+    return label.lower() if label else None
+
+def _request_image_stream():
+    """Retorna um stream com a imagem do upload binário, sem decodificação Base64."""
+    upload = request.files.get('image')
+    if upload is not None:
+        # Memória (uploads pequenos) ou arquivo temporário: ambos são lidos direto pelo decoder
+        return upload.stream
+    # BytesIO(bytes) compartilha o buffer do corpo, sem cópia adicional
+    return BytesIO(request.get_data(cache=False))
 
 # ----------------------------------------------------
-# ENDPOINT DE INGESTÃO (/log) (Sem Alteração na Lógica)
+# ENDPOINT DE INGESTÃO (/log)
 # ----------------------------------------------------
 @app.route('/log/leaf_image', methods=['POST'])
 def log_leaf_image():
-    """Recebe imagem em Base64 e rótulo, decodifica e salva."""
+    """Recebe imagem (Base64 em JSON, multipart/form-data ou corpo image/*) e rótulo, e salva."""
     
     try:
-        data = request.get_json()
-        
-        if not data or 'image_base64' not in data or 'label' not in data:
-            return jsonify({"status": "error", "message": "JSON inválido. Requer 'image_base64' e 'label'."}), 400
+        binary = _is_binary_upload()
+        if binary:
+            label = _request_label()
+            if label is None:
+                return jsonify({"status": "error", "message": "Upload binário requer 'label' (campo do formulário ou ?label=)."}), 400
+            if request.content_length == 0:
+                return jsonify({"status": "error", "message": "Imagem vazia."}), 400
+        else:
+            data = request.get_json(silent=True)
+            
+            if not data or 'image_base64' not in data or 'label' not in data:
+                return jsonify({"status": "error", "message": "JSON inválido. Requer 'image_base64' e 'label'."}), 400
 
-        image_base64 = data['image_base64']
-        label = data['label'].lower()
+            image_base64 = data['image_base64']
+            label = data['label'].lower()
         
         if label not in ['saudavel', 'doente']:
             return jsonify({"status": "error", "message": "Rótulo inválido. Use 'saudavel' ou 'doente'."}), 400
 
-        target_dir = os.path.join(UPLOAD_FOLDER, label)
-        os.makedirs(target_dir, exist_ok=True) 
+        if binary:
+            image_stream = request.files['image'].stream if 'image' in request.files else request.stream
+        else:
+            try:
+                image_stream = BytesIO(base64.b64decode(image_base64))
+            except Exception:
+                return jsonify({"status": "error", "message": "Falha na decodificação do Base64."}), 400
 
+        # Grava por conteúdo: o mesmo arquivo enviado de novo não é regravado
         try:
-            image_data = base64.b64decode(image_base64)
-        except Exception:
-            return jsonify({"status": "error", "message": "Falha na decodificação do Base64."}), 400
-        
-        filename = f"image_{int(time.time())}_{label}.jpg"
-        file_path = os.path.join(target_dir, filename)
-
-        with open(file_path, 'wb') as f:
-            f.write(image_data)
+            entry, duplicate = leaf_store.put(image_stream, label)
+        except UnsupportedImage as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
 
+        file_path = os.path.join(UPLOAD_FOLDER, entry["path"])
         return jsonify({
             "status": "success", 
-            "message": f"Imagem registrada em: {file_path}",
-            "filename": filename
-        }), 201
+            "message": f"Imagem {'já registrada' if duplicate else 'registrada'} em: {file_path}",
+            "filename": os.path.basename(file_path),
+            "hash": entry["hash"],
+            "format": entry["format"],
+            "duplicate": duplicate
+        }), 200 if duplicate else 201
 
     except Exception as e:
         return jsonify({"status": "error", "message": f"Erro interno do servidor: {e}"}), 500
 
+def _prediction_response(prediction_proba, cached, model_version):
+    """Monta a resposta de predição (0 = Saudável, 1 = Doente, limite de 0.5)."""
+    prediction_label = "Doente" if prediction_proba >= 0.5 else "Saudável"
+    response = {
+        "status": "success",
+        "prediction_label": prediction_label,
+        "confidence_score": float(prediction_proba),
+        "model_version": model_version
+    }
+    if prediction_cache is not None:
+        response["cached"] = cached
+    return response
+
 # ----------------------------------------------------
 # ENDPOINT DE INFERÊNCIA (/predict) (Novo)
 # POST /predict/leaf_image
 # ----------------------------------------------------
 @app.route('/predict/leaf_image', methods=['POST'])
+@metrics.instrument('/predict/leaf_image')
 def predict_leaf_image():
-    """Recebe uma imagem em Base64 e retorna a predição de doença."""
-    global cnn_model
+    """Recebe uma imagem (Base64 em JSON, multipart/form-data ou corpo image/*) e retorna a predição de doença."""
+    bundle = cnn_bundle # Referência única: uma recarga no meio da requisição não a afeta
     
-    if cnn_model is None:
-        return jsonify({"status": "error", "message": "Modelo CNN não carregado. Verifique os logs de inicialização."}), 503
+    if bundle is None:
+        return startup.unavailable_response("Modelo CNN não carregado. Verifique os logs de inicialização.")
 
     try:
-        data = request.get_json()
-        if not data or 'image_base64' not in data:
-            return jsonify({"status": "error", "message": "Dados incompletos. Requer 'image_base64'."}), 400
+        if _is_binary_upload():
+            # 1. Upload binário: o decoder lê direto dos bytes da requisição
+            with metrics.stage('parse'):
+                image_stream = _request_image_stream()
+        else:
+            with metrics.stage('parse'):
+                data = request.get_json(silent=True)
+            if not data or 'image_base64' not in data:
+                return jsonify({"status": "error", "message": "Dados incompletos. Requer 'image_base64' ou upload binário (multipart 'image' ou corpo image/*)."}), 400
 
-        image_base64 = data['image_base64']
+            # 1. Decodificar Base64
+            with metrics.stage('base64_decode'):
+                image_stream = BytesIO(base64.b64decode(data['image_base64']))
         
-        # 1. Decodificar Base64 e preparar para Keras
-        image_data = base64.b64decode(image_base64)
-        
-        # Cria um objeto temporário em memória para Keras processar
-        from io import BytesIO
-        image_stream = BytesIO(image_data)
-        
-        # Carrega, redimensiona e converte para array
-        img = load_img(image_stream, target_size=IMG_SIZE)
-        img_array = img_to_array(img)
-        
-        # Adiciona uma dimensão de batch (1, 64, 64, 3)
-        img_array = np.expand_dims(img_array, axis=0) 
-        
-        # Normaliza (dividir por 255)
-        img_array /= 255.0
+        # Reenvio da mesma imagem para o mesmo modelo: responde do cache, sem decode nem predict
+        cache_key = None
+        if prediction_cache is not None:
+            with metrics.stage('cache_lookup'):
+                cache_key = content_key(image_stream, bundle.version)
+                cached_proba = prediction_cache.get(cache_key)
+            if cached_proba is not None:
+                with metrics.stage('serialize'):
+                    response = jsonify(_prediction_response(cached_proba, True, bundle.version))
+                return response, 200
+
+        # Decodifica (draft JPEG), redimensiona e normaliza: tensor (1, 64, 64, 3) float32
+        with metrics.stage('image_decode'):
+            img_array = preprocess_leaf_image(image_stream)
         
     except Exception as e:
         return jsonify({"status": "error", "message": f"Falha no pré-processamento da imagem: {e}"}), 400
 
     try:
-        # 2. Predição
-        prediction_proba = cnn_model.predict(img_array)[0][0]
-        
-        # 3. Decisão final (0 = Saudável, 1 = Doente)
-        prediction_label = "Doente" if prediction_proba >= 0.5 else "Saudável"
+        # 2. Predição (em lote com outras requisições, se o micro-batching estiver ativo)
+        batch_info = None
+        with metrics.stage('predict'): # Com micro-batching inclui a espera na fila
+            if leaf_batcher is not None:
+                # Lote só com requisições do mesmo bundle: nunca mistura versões do modelo
+                prediction_proba, batch_info = leaf_batcher.submit(img_array, timeout=BATCH_TIMEOUT_S,
+                                                                   context=bundle)
+            else:
+                prediction_proba = float(_predict_batch(img_array, bundle)[0][0])
+
+        if cache_key is not None:
+            prediction_cache.put(cache_key, prediction_proba)
         
-        return jsonify({
-            "status": "success",
-            "prediction_label": prediction_label,
-            "confidence_score": float(prediction_proba)
-        }), 200
+        response = _prediction_response(prediction_proba, False, bundle.version)
+        if batch_info is not None:
+            response["batch_info"] = batch_info
+        with metrics.stage('serialize'):
+            response = jsonify(response)
+        return response, 200
+
+    except TimeoutError:
+        # Forward pass travado ou fila congestionada: libera a thread em vez de esperar indefinidamente
+        response = jsonify({"status": "error",
+                            "message": f"Tempo esgotado ({BATCH_TIMEOUT_S:g} s) aguardando o lote de inferência."})
+        response.headers['Retry-After'] = '2'
+        return response, 503
 
     except Exception as e:
         return jsonify({"status": "error", "message": f"Erro interno durante a predição: {e}"}), 500
 
+# ----------------------------------------------------
+# Estatísticas do micro-batching
+# GET /stats/batcher
+# ----------------------------------------------------
+@app.route('/stats/batcher', methods=['GET'])
+def batcher_stats():
+    """Retorna tamanho médio de lote e espera média na fila."""
+    if leaf_batcher is None:
+        return jsonify({"status": "success", "enabled": False}), 200
+    return jsonify({"status": "success", "enabled": True, **leaf_batcher.stats()}), 200
+
+# ----------------------------------------------------
+# Estatísticas do cache de predições
+# GET /stats/cache
+# ----------------------------------------------------
+@app.route('/stats/cache', methods=['GET'])
+def cache_stats():
+    """Retorna acertos, faltas, evicções e ocupação do cache de predições."""
+    if prediction_cache is None:
+        return jsonify({"status": "success", "enabled": False}), 200
+    return jsonify({"status": "success", "enabled": True, "model_version": cnn_bundle.version if cnn_bundle else None, **prediction_cache.stats()}), 200
+
+# ----------------------------------------------------
+# Inicialização (servidor de desenvolvimento e Gunicorn)
+# ----------------------------------------------------
+def init_service():
+    """Carrega o modelo em background (STARTUP_MODE=blocking para carga síncrona) e monitora model_artifacts/."""
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    start_batcher()
+    reloader.start(load_cnn_artifact, warmup_cnn, reloader.batch_sizes) # Carga inicial sob o lock das recargas + monitor
+
 # ----------------------------------------------------
 # Execução do Servidor
 # ----------------------------------------------------
 if __name__ == '__main__':
-    # Roda o servidor na porta 5002
-    load_cnn_artifact() # Novo: Carrega o modelo ao iniciar
+    # Roda o servidor na porta 5002 (produção: python -m cnn_service.serve)
+    init_service()
     print(f"Serviço CNN rodando em http://127.0.0.1:5002")
-    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
     app.run(port=5002, debug=True, use_reloader=False)
\ No newline at end of file
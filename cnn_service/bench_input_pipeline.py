@@ -0,0 +1,125 @@
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+from leaf_preprocessing import IMG_SIZE, CLASS_INDICES, load_leaf_dataset, normalize
+from leaf_cache import LeafShardCache, make_tf_dataset
+from bench_preprocessing import synthetic_photo
+
+# ----------------------------------------------------
+# Benchmark da entrada do treino: ImageDataGenerator vs cache de shards + tf.data
+# ----------------------------------------------------
+# Mede o preparo (decode inicial) e o tempo de uma época só de leitura dos lotes,
+# sem o custo do modelo, em cada pipeline.
+# Uso: python cnn_service/bench_input_pipeline.py --synthetic 2000 --batch-size 32 --epochs 3
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BASE_DIR, 'uploads')
+
+
+def write_synthetic_dataset(data_dir, count, width, height):
+    """Gera `count` JPEGs (metade por classe) em data_dir/<classe>/."""
+    payloads = [synthetic_photo(width, height, seed=i) for i in range(8)] # Variedade sem custo de gerar todas
+    for i in range(count):
+        class_name = list(CLASS_INDICES)[i % len(CLASS_INDICES)]
+        os.makedirs(os.path.join(data_dir, class_name), exist_ok=True)
+        with open(os.path.join(data_dir, class_name, f"img_{i:06d}.jpg"), 'wb') as f:
+            f.write(payloads[i % len(payloads)])
+
+
+def time_epochs(make_epoch, epochs):
+    """Tempo médio por época (a primeira conta como aquecimento quando há mais de uma)."""
+    times = []
+    for _ in range(epochs):
+        started_at = time.perf_counter()
+        images = make_epoch()
+        times.append(time.perf_counter() - started_at)
+    measured = times[1:] if len(times) > 1 else times
+    return sum(measured) / len(measured), images
+
+
+def bench_generator(data_dir, batch_size, epochs):
+    """Pipeline original: ImageDataGenerator.flow_from_directory (decode a cada época)."""
+    from tensorflow.keras.preprocessing.image import ImageDataGenerator
+    started_at = time.perf_counter()
+    generator = ImageDataGenerator(rescale=1. / 255).flow_from_directory(
+        data_dir, target_size=IMG_SIZE, batch_size=batch_size, class_mode='binary',
+        classes=list(CLASS_INDICES), shuffle=True)
+    setup = time.perf_counter() - started_at
+
+    def epoch():
+        seen = 0
+        for i in range(len(generator)):
+            seen += len(generator[i][0])
+        generator.on_epoch_end() # Reembaralha, como o fit faz a cada época
+        return seen
+    return (setup,) + time_epochs(epoch, epochs)
+
+
+def bench_in_memory(data_dir, batch_size, epochs):
+    """Decode de tudo a cada execução do treino (load_leaf_dataset) + lotes em memória."""
+    started_at = time.perf_counter()
+    X_uint8, y = load_leaf_dataset(data_dir)
+    X = normalize(X_uint8)
+    setup = time.perf_counter() - started_at
+
+    def epoch():
+        order = np.random.permutation(len(X))
+        seen = 0
+        for start in range(0, len(X), batch_size):
+            seen += len(X[order[start:start + batch_size]])
+        return seen
+    return (setup,) + time_epochs(epoch, epochs)
+
+
+def bench_cache(data_dir, cache_dir, batch_size, epochs):
+    """Cache de shards (build incremental) + tf.data paralelo com prefetch."""
+    started_at = time.perf_counter()
+    dataset = LeafShardCache(cache_dir).build(data_dir)
+    setup = time.perf_counter() - started_at
+    pipeline = make_tf_dataset(dataset, batch_size)
+
+    def epoch():
+        seen = 0
+        for images, _ in pipeline:
+            seen += int(images.shape[0])
+        return seen
+    return (setup,) + time_epochs(epoch, epochs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark da entrada de dados do train_cnn.py")
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--synthetic', type=int, default=0, help="Gera N JPEGs sintéticos em vez de usar --data-dir")
+    parser.add_argument('--width', type=int, default=1024)
+    parser.add_argument('--height', type=int, default=768)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--epochs', type=int, default=3)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix='bench_cnn_input_')
+    try:
+        data_dir = args.data_dir
+        if args.synthetic:
+            data_dir = os.path.join(tmp, 'data')
+            write_synthetic_dataset(data_dir, args.synthetic, args.width, args.height)
+        cache_dir = os.path.join(tmp, 'cache')
+
+        scenarios = [
+            ("ImageDataGenerator (original)", lambda: bench_generator(data_dir, args.batch_size, args.epochs)),
+            ("load_leaf_dataset em memória", lambda: bench_in_memory(data_dir, args.batch_size, args.epochs)),
+            ("Cache frio + tf.data", lambda: bench_cache(data_dir, cache_dir, args.batch_size, args.epochs)),
+            ("Cache quente + tf.data", lambda: bench_cache(data_dir, cache_dir, args.batch_size, args.epochs)),
+        ]
+        print(f"Dados: {data_dir}, lote {args.batch_size}, {args.epochs} época(s)")
+        print(f"{'Pipeline':<32} {'preparo (s)':>12} {'época (s)':>10} {'imagens/s':>10} {'20 épocas (s)':>14}")
+        for name, run in scenarios:
+            setup, epoch_s, images = run()
+            print(f"{name:<32} {setup:>12.2f} {epoch_s:>10.3f} {images / epoch_s:>10.0f} {setup + 20 * epoch_s:>14.1f}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+import os
+import time
+import argparse
+from io import BytesIO
+import numpy as np
+from PIL import Image
+from leaf_preprocessing import IMG_SIZE, list_leaf_images, preprocess_leaf_image
+
+# ----------------------------------------------------
+# Benchmark: pré-processamento antigo (load_img) vs leaf_preprocessing
+# ----------------------------------------------------
+# Uso: python cnn_service/bench_preprocessing.py --repeat 20
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BASE_DIR, 'uploads')
+
+
+def legacy_preprocess(stream):
+    """Caminho anterior da API: load_img (decode em resolução cheia) + img_to_array + /255."""
+    try:
+        from tensorflow.keras.preprocessing.image import img_to_array, load_img
+        img = load_img(stream, target_size=IMG_SIZE)
+        img_array = img_to_array(img)
+    except ImportError:
+        # Equivalente em PIL ao load_img do Keras (interpolação 'nearest')
+        img = Image.open(stream).convert('RGB').resize((IMG_SIZE[1], IMG_SIZE[0]), Image.NEAREST)
+        img_array = np.asarray(img, dtype=np.float32)
+    img_array = np.expand_dims(img_array, axis=0)
+    img_array /= 255.0
+    return img_array
+
+
+def synthetic_photo(width, height, seed=0):
+    """Gera um JPEG com textura (simula uma foto de celular) e retorna seus bytes."""
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, size=(height // 16, width // 16, 3), dtype=np.uint8)
+    img = Image.fromarray(small).resize((width, height), Image.BILINEAR)
+    buffer = BytesIO()
+    img.save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def time_per_image(fn, payloads, repeat):
+    fn(BytesIO(payloads[0])) # Aquece caches/imports
+    started_at = time.perf_counter()
+    for _ in range(repeat):
+        for payload in payloads:
+            fn(BytesIO(payload))
+    return (time.perf_counter() - started_at) * 1000.0 / (repeat * len(payloads))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do pré-processamento de imagens da CNN")
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    datasets = {}
+    uploads = [open(path, 'rb').read() for path, _ in list_leaf_images(DATA_DIR)]
+    if uploads:
+        datasets[f"uploads/ ({len(uploads)} imagens)"] = uploads
+    datasets["JPEG sintético 12 MP (4000x3000)"] = [synthetic_photo(4000, 3000)]
+
+    print(f"{'Conjunto':<36} {'load_img (ms)':>14} {'leaf_preprocessing (ms)':>24} {'speedup':>8}")
+    for name, payloads in datasets.items():
+        repeat = args.repeat if len(payloads) > 1 else max(1, args.repeat // 2)
+        legacy_ms = time_per_image(legacy_preprocess, payloads, repeat)
+        fast_ms = time_per_image(preprocess_leaf_image, payloads, repeat)
+        print(f"{name:<36} {legacy_ms:>14.2f} {fast_ms:>24.2f} {legacy_ms / fast_ms:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
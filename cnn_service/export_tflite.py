@@ -0,0 +1,269 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import numpy as np
+from leaf_preprocessing import decode_leaf_image, normalize
+from leaf_store import training_items
+from tflite_engine import TFLITE_VARIANTS, TFLiteCNN, load_interpreter_class, tflite_filename
+
+# ----------------------------------------------------
+# Exporta a CNN (Keras .h5) para TFLite quantizado (int8 e float16)
+# ----------------------------------------------------
+# int8: quantização pós-treino completa (pesos e ativações), calibrada com
+# imagens de uploads/ (representative dataset); entrada e saída continuam float32.
+# float16: pesos em float16 (metade do tamanho), ativações em float32.
+# O relatório compara cada variante com o modelo float (rótulo, probabilidade,
+# acurácia) em imagens fora da calibração e mede latência, importação e RSS de
+# cada backend num processo próprio. Chamado pelo train_cnn.py, a paridade usa a
+# validação do treino (imagens que o modelo não viu no ajuste dos pesos); pela
+# linha de comando, uma parte de uploads/ separada da calibração (que pode ter
+# sido usada no treino: o relatório indica a origem).
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ARTIFACTS_DIR = os.path.join(BASE_DIR, 'model_artifacts')
+DATA_DIR = os.path.join(BASE_DIR, 'uploads')
+REPORT_NAME = 'cnn_tflite_report.json'
+CALIBRATION_IMAGES = int(os.environ.get('CNN_TFLITE_CALIBRATION_IMAGES', '200'))
+PARITY_FRACTION = float(os.environ.get('CNN_TFLITE_PARITY_FRACTION', '0.3')) # Sem validação: parte separada da calibração
+AGREEMENT_WARN = 0.98 # Concordância de rótulos abaixo disso gera um aviso no relatório
+BENCH_ITERATIONS = 200
+BENCH_BATCH_SIZES = (1, 16)
+
+
+def load_images(data_dir, max_images=None, seed=42):
+    """Imagens rotuladas de data_dir já pré-processadas como na API: (X float32, y int32)."""
+    items = sorted(set(training_items(data_dir)))
+    if max_images is not None and len(items) > max_images:
+        rng = np.random.default_rng(seed)
+        items = [items[i] for i in sorted(rng.choice(len(items), max_images, replace=False))]
+    images, labels = [], []
+    for path, label in items:
+        try:
+            images.append(decode_leaf_image(path))
+        except Exception as e:
+            print(f"AVISO: imagem ignorada ({path}): {e}")
+            continue
+        labels.append(label)
+    if not images:
+        raise ValueError(f"Nenhuma imagem rotulada em {data_dir} para calibrar a quantização.")
+    return normalize(np.stack(images)), np.asarray(labels, dtype=np.int32)
+
+
+def split_calibration(X, y, parity_fraction=PARITY_FRACTION, seed=42):
+    """Separa as imagens em calibração e paridade disjuntas: (X_cal, X_par, y_par)."""
+    order = np.random.default_rng(seed).permutation(len(X))
+    n_parity = int(round(len(X) * parity_fraction))
+    if len(X) >= 2:
+        n_parity = min(max(n_parity, 1), len(X) - 1) # Ao menos uma imagem em cada lado
+    parity, calibration = np.sort(order[:n_parity]), np.sort(order[n_parity:])
+    return X[calibration], X[parity], y[parity]
+
+
+def convert(model, variant, calibration=None):
+    """Converte o modelo Keras para TFLite; retorna os bytes do .tflite."""
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if variant == 'float16':
+        converter.target_spec.supported_types = [tf.float16]
+    elif variant == 'int8':
+        if calibration is None or len(calibration) == 0:
+            raise ValueError("A variante int8 requer imagens de calibração.")
+
+        def representative_dataset():
+            for i in range(len(calibration)):
+                yield [calibration[i:i + 1]]
+
+        converter.representative_dataset = representative_dataset
+        # Só kernels int8: falha na conversão em vez de cair silenciosamente para float
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    else:
+        raise ValueError(f"Variante TFLite desconhecida: {variant}")
+    return converter.convert()
+
+
+def check_parity(model, engines, X, y):
+    """Compara cada motor TFLite com o modelo float nas mesmas imagens (nenhuma: só {"images": 0})."""
+    if len(X) == 0:
+        return {"images": 0}
+    expected = model.predict(X, verbose=0).reshape(-1)
+    report = {"images": int(len(X)), "float_accuracy": float(np.mean((expected >= 0.5) == y))}
+    for variant, engine in engines.items():
+        actual = np.concatenate([engine.predict(X[i:i + 16]) for i in range(0, len(X), 16)]).reshape(-1)
+        diff = np.abs(expected - actual)
+        report[variant] = {
+            "label_agreement": float(np.mean((expected >= 0.5) == (actual >= 0.5))),
+            "accuracy": float(np.mean((actual >= 0.5) == y)),
+            "max_abs_diff": float(diff.max()),
+            "mean_abs_diff": float(diff.mean()),
+        }
+    return report
+
+
+# ----------------------------------------------------
+# Latência e memória de cada backend (um processo por backend)
+# ----------------------------------------------------
+def _peak_rss_mb():
+    """Pico de RSS do processo (VmHWM; o ru_maxrss herdaria o pico do processo pai após o exec)."""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return round(int(line.split()[1]) / 1024.0, 1)
+    return None
+
+
+def _bench_child(backend, model_path, num_threads):
+    """Roda dentro do processo filho: importa, carrega e mede um backend isolado."""
+    started_at = time.perf_counter()
+    if backend == 'keras':
+        from tensorflow.keras.models import load_model
+        import_s = time.perf_counter() - started_at
+        model = load_model(model_path)
+    else:
+        load_interpreter_class()
+        import_s = time.perf_counter() - started_at
+        model = TFLiteCNN(model_path, num_threads=num_threads)
+    load_s = time.perf_counter() - started_at - import_s
+
+    rng = np.random.default_rng(0)
+    result = {"backend": backend, "import_s": round(import_s, 3), "load_s": round(load_s, 3)}
+    for batch_size in BENCH_BATCH_SIZES:
+        batch = rng.random((batch_size, 64, 64, 3), dtype=np.float32)
+        for _ in range(5):
+            model.predict(batch, verbose=0)
+        latencies = []
+        for _ in range(BENCH_ITERATIONS):
+            t0 = time.perf_counter()
+            model.predict(batch, verbose=0)
+            latencies.append(time.perf_counter() - t0)
+        result[f"batch{batch_size}_p50_ms"] = round(float(np.percentile(latencies, 50)) * 1000.0, 3)
+        result[f"batch{batch_size}_p95_ms"] = round(float(np.percentile(latencies, 95)) * 1000.0, 3)
+    result["max_rss_mb"] = _peak_rss_mb()
+    print(json.dumps(result))
+
+
+def benchmark_backends(paths, num_threads=None):
+    """Executa `_bench_child` em processos separados para que o RSS de um não contamine o outro."""
+    results = []
+    for backend, path in paths.items():
+        cmd = [sys.executable, os.path.abspath(__file__), '--bench-child', backend, path]
+        if num_threads:
+            cmd.append(str(num_threads))
+        proc = subprocess.run(cmd, cwd=BASE_DIR, capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(f"AVISO: benchmark do backend {backend} falhou: {proc.stderr.strip()[-500:]}")
+            continue
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        result["size_kb"] = round(os.path.getsize(path) / 1024.0, 1)
+        results.append(result)
+    return results
+
+
+def print_report(report):
+    parity = report["parity"]
+    if parity["images"]:
+        print(f"\nParidade vs modelo float ({parity['images']} imagens de {report['parity_source']}, "
+              f"calibração com {report['calibration_images']}; acurácia float {parity['float_accuracy']:.3f}):")
+        print(f"{'variante':<10} {'concordância':>12} {'acurácia':>9} {'dif. máx':>9} {'dif. média':>10}")
+    for variant in TFLITE_VARIANTS:
+        if variant in parity:
+            p = parity[variant]
+            print(f"{variant:<10} {p['label_agreement']:>12.3f} {p['accuracy']:>9.3f} "
+                  f"{p['max_abs_diff']:>9.4f} {p['mean_abs_diff']:>10.4f}")
+    if report.get("benchmark"):
+        print(f"\n{'backend':<10} {'tamanho KB':>10} {'import s':>9} {'carga s':>8} {'lote1 p50 ms':>12} "
+              f"{'lote16 p50 ms':>13} {'RSS MB':>7}")
+        for r in report["benchmark"]:
+            print(f"{r['backend']:<10} {r['size_kb']:>10} {r['import_s']:>9} {r['load_s']:>8} "
+                  f"{r['batch1_p50_ms']:>12} {r['batch16_p50_ms']:>13} {r['max_rss_mb']:>7}")
+    for warning in report["warnings"]:
+        print(f"AVISO: {warning}")
+
+
+def export_tflite(model, model_path=None, output_dir=ARTIFACTS_DIR, data_dir=DATA_DIR,
+                  max_images=CALIBRATION_IMAGES, benchmark=True, num_threads=None,
+                  calibration=None, parity=None):
+    """Gera as variantes TFLite, o relatório de paridade/latência e retorna o relatório.
+
+    `calibration` (X) e `parity` ((X, y)) vêm do script de treino (imagens de treino
+    e de validação); sem eles as imagens de data_dir são divididas em duas partes disjuntas.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    if calibration is not None and parity is not None:
+        X, (X_parity, y_parity) = calibration, parity
+        parity_source = "validation"
+    else:
+        X, X_parity, y_parity = split_calibration(*load_images(data_dir, max_images))
+        parity_source = "uploads_holdout"
+    if len(X_parity) == 0:
+        parity_source = "none" # Validação vazia ou uma única imagem: as variantes saem sem paridade
+    if len(X) > max_images:
+        X = X[np.sort(np.random.default_rng(42).choice(len(X), max_images, replace=False))]
+    print(f"Calibrando com {len(X)} imagens; paridade em {len(X_parity)} imagens fora da calibração ({parity_source})")
+
+    paths, engines = {}, {}
+    for variant in TFLITE_VARIANTS:
+        path = os.path.join(output_dir, tflite_filename(variant))
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(convert(model, variant, X))
+        os.replace(tmp_path, path) # Atômico: a recarga a quente nunca vê um arquivo pela metade
+        paths[variant] = path
+        engines[variant] = TFLiteCNN(path, num_threads=num_threads)
+        print(f"Modelo TFLite {variant} salvo em: {path} ({os.path.getsize(path) / 1024.0:.1f} KB)")
+
+    report = {"created_at": time.strftime('%Y-%m-%dT%H:%M:%S'), "calibration_images": int(len(X)),
+              "parity_images": int(len(X_parity)), "parity_source": parity_source,
+              "parity": check_parity(model, engines, X_parity, y_parity), "benchmark": [], "warnings": []}
+    if parity_source == "uploads_holdout":
+        report["warnings"].append("paridade em imagens de uploads/ fora da calibração, mas possivelmente usadas no treino")
+    elif parity_source == "none":
+        report["warnings"].append("paridade não medida: nenhuma imagem fora da calibração")
+    for variant in TFLITE_VARIANTS:
+        if variant not in report["parity"]:
+            continue
+        agreement = report["parity"][variant]["label_agreement"]
+        if agreement < AGREEMENT_WARN:
+            report["warnings"].append(f"{variant}: concordância de rótulos {agreement:.3f} < {AGREEMENT_WARN}")
+    if benchmark and model_path is not None:
+        report["benchmark"] = benchmark_backends({'keras': model_path, **paths}, num_threads)
+
+    report_path = os.path.join(output_dir, REPORT_NAME)
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print_report(report)
+    print(f"\nRelatório salvo em: {report_path}")
+    return report
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--bench-child':
+        _bench_child(sys.argv[2], sys.argv[3], int(sys.argv[4]) if len(sys.argv) > 4 else None)
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description="Exporta a CNN para TFLite int8/float16 com relatório de paridade")
+    parser.add_argument('--model', default=os.path.join(ARTIFACTS_DIR, 'cnn_model.h5'))
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--output-dir', default=ARTIFACTS_DIR)
+    parser.add_argument('--max-images', type=int, default=CALIBRATION_IMAGES,
+                        help="Imagens lidas de data_dir (divididas entre calibração e paridade)")
+    parser.add_argument('--threads', type=int, default=None, help="Threads do interpretador no benchmark")
+    parser.add_argument('--no-bench', action='store_true', help="Só converte e confere a paridade")
+    args = parser.parse_args()
+
+    from tensorflow.keras.models import load_model
+    try:
+        keras_model = load_model(args.model)
+    except Exception as e:
+        print(f"ERRO ao carregar o modelo CNN. Execute o treinamento primeiro: {e}")
+        sys.exit(1)
+
+    try:
+        export_tflite(keras_model, args.model, args.output_dir, args.data_dir, args.max_images,
+                      benchmark=not args.no_bench, num_threads=args.threads)
+    except ValueError as e:
+        print(f"ERRO na exportação: {e}")
+        sys.exit(1)
@@ -0,0 +1,265 @@
+import io
+import os
+import json
+import time
+import hashlib
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from leaf_preprocessing import IMG_SIZE, CHANNELS, RESAMPLE, DRAFT_FACTOR, SCALE, decode_leaf_image, list_leaf_images
+
+try:
+    import fcntl # Trava entre processos (Linux/macOS)
+except ImportError: # pragma: no cover - Windows
+    fcntl = None
+
+# ----------------------------------------------------
+# Cache de imagens decodificadas em shards uint8 mapeáveis em memória
+# ----------------------------------------------------
+# Cada imagem é decodificada uma única vez (leaf_preprocessing) e guardada em
+# shards .npy de (n, altura, largura, 3) uint8, abertos com mmap no treino.
+# O manifest.json registra, para cada arquivo, tamanho, mtime e hash; um
+# arquivo alterado é decodificado de novo, os demais são reaproveitados.
+# Mudar IMG_SIZE ou o pré-processamento invalida o cache inteiro.
+
+CACHE_FORMAT_VERSION = 1
+SHARD_SIZE = 4096
+VERIFY_MODES = ('mtime', 'hash')
+
+
+def file_hash(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def _read_hash(path):
+    with open(path, 'rb') as f:
+        return file_hash(f.read())
+
+
+class LeafDataset:
+    """Visão dos shards do cache: `gather(indices)` monta um lote uint8."""
+
+    def __init__(self, shards, labels, shard_size, stats=None, paths=None):
+        self.shards = shards
+        self.labels = labels
+        self.paths = paths or [] # Caminho relativo de cada imagem, na ordem dos shards
+        self.shard_size = shard_size
+        self.stats = stats or {}
+
+    def __len__(self):
+        return len(self.labels)
+
+    def gather(self, indices):
+        """Lote (imagens uint8, rótulos int32). Os índices são ordenados para ler os shards em sequência."""
+        indices = np.sort(np.asarray(indices, dtype=np.int64))
+        shard_ids = indices // self.shard_size
+        rows = indices % self.shard_size
+        first = self.shards[0]
+        out = np.empty((len(indices),) + first.shape[1:], dtype=np.uint8)
+        for shard_id in np.unique(shard_ids):
+            mask = shard_ids == shard_id
+            out[mask] = self.shards[shard_id][rows[mask]]
+        return out, self.labels[indices]
+
+    def arrays(self):
+        """Dataset inteiro em memória (X uint8, y int32)."""
+        return self.gather(np.arange(len(self)))
+
+
+class LeafShardCache:
+    """Constrói e reaproveita os shards de `cache_dir` para as imagens de um diretório."""
+
+    def __init__(self, cache_dir, size=IMG_SIZE, shard_size=SHARD_SIZE, verify='mtime', workers=None):
+        if verify not in VERIFY_MODES:
+            raise ValueError(f"verify deve ser um de {VERIFY_MODES}")
+        self.cache_dir = cache_dir
+        self.size = tuple(size)
+        self.shard_size = int(shard_size)
+        self.verify = verify
+        self.workers = workers or os.cpu_count() or 1
+        self.manifest_path = os.path.join(cache_dir, 'manifest.json')
+
+    def fingerprint(self):
+        """Tudo o que muda o conteúdo dos shards; se divergir, o cache é reconstruído do zero."""
+        return {"format_version": CACHE_FORMAT_VERSION, "img_size": list(self.size),
+                "resample": int(RESAMPLE), "draft_factor": DRAFT_FACTOR, "shard_size": self.shard_size}
+
+    # ------------------------------------------------
+    # Construção
+    # ------------------------------------------------
+    def build(self, data_dir, items=None):
+        """Sincroniza o cache com as imagens de data_dir/<classe>/ e retorna o LeafDataset."""
+        started_at = time.perf_counter()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(os.path.join(self.cache_dir, '.lock'), 'w') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX) # Um build por vez (ex.: dois treinos simultâneos)
+            items = list_leaf_images(data_dir) if items is None else items
+            manifest = self._load_manifest()
+            old_entries = {e["path"]: (i, e) for i, e in enumerate(manifest["entries"])} if manifest else {}
+            old_skipped = manifest.get("skipped", {}) if manifest else {}
+            old_shards = self._open_shards(manifest) if manifest else []
+
+            # Plano: cada imagem é reaproveitada de um shard antigo ou decodificada de novo
+            plan, to_decode, skipped = [], [], {}
+            for path, label in items:
+                rel = os.path.relpath(path, data_dir)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                old = old_entries.get(rel)
+                if old is not None and old[1]["label"] == label and self._still_valid(old[1], path, st):
+                    plan.append(("cache", old[0], dict(old[1], mtime_ns=st.st_mtime_ns)))
+                elif old_skipped.get(rel) == [st.st_size, st.st_mtime_ns]:
+                    skipped[rel] = old_skipped[rel] # Continua ilegível: não tenta de novo
+                else:
+                    plan.append(("decode", len(to_decode), {"path": rel, "label": label,
+                                                            "size": st.st_size, "mtime_ns": st.st_mtime_ns}))
+                    to_decode.append(path)
+
+            decoded = self._decode_all(to_decode)
+            entries, sources = [], []
+            for kind, index, entry in plan:
+                if kind == "decode":
+                    image, digest, error = decoded[index]
+                    if error is not None:
+                        print(f"AVISO: imagem ignorada ({entry['path']}): {error}")
+                        skipped[entry["path"]] = [entry["size"], entry["mtime_ns"]]
+                        continue
+                    entry["hash"] = digest
+                    sources.append(image)
+                else:
+                    sources.append((old_shards, index))
+                entries.append(entry)
+
+            reused = sum(1 for kind, _, _ in plan if kind == "cache")
+            current = {os.path.relpath(path, data_dir) for path, _ in items}
+            stats = {"images": len(entries), "reused": reused, "decoded": len(entries) - reused,
+                     "skipped": len(skipped), "removed": len(set(old_entries) - current)}
+            unchanged = manifest is not None and not to_decode and reused == len(old_entries) \
+                and [e["path"] for e in entries] == [e["path"] for e in manifest["entries"]]
+            if unchanged:
+                if [e["mtime_ns"] for e in entries] != [e["mtime_ns"] for e in manifest["entries"]]:
+                    self._write_manifest(dict(manifest, entries=entries, skipped=skipped)) # Só o mtime mudou (modo hash)
+            else:
+                manifest = self._write_generation(manifest, entries, sources, skipped)
+            del old_shards
+            stats["build_s"] = time.perf_counter() - started_at
+            stats["rebuilt"] = not unchanged
+            return self.load(manifest, stats)
+
+    def _still_valid(self, entry, path, st):
+        if entry["size"] == st.st_size and entry["mtime_ns"] == st.st_mtime_ns:
+            return True
+        # mtime mudou (cópia, touch, restauração de backup): no modo 'hash' confere o conteúdo
+        return self.verify == 'hash' and entry["size"] == st.st_size and entry.get("hash") == _read_hash(path)
+
+    def _decode_one(self, path):
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            return decode_leaf_image(io.BytesIO(data), size=self.size), file_hash(data), None
+        except (OSError, ValueError) as e:
+            return None, None, e
+
+    def _decode_all(self, paths):
+        if not paths:
+            return []
+        # O decode/resize do Pillow libera o GIL: threads escalam com os núcleos
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(self._decode_one, paths))
+
+    def _write_generation(self, manifest, entries, sources, skipped):
+        """Grava shards novos (nova geração), troca o manifest atomicamente e apaga os antigos."""
+        generation = (manifest["generation"] + 1) if manifest else 0
+        height, width = self.size
+        shard_files = []
+        for start in range(0, len(entries), self.shard_size):
+            count = min(self.shard_size, len(entries) - start)
+            name = f"shard-{generation:06d}-{len(shard_files):05d}.npy"
+            tmp_path = os.path.join(self.cache_dir, f".{name}.tmp")
+            shard = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.uint8,
+                                              shape=(count, height, width, CHANNELS))
+            for row in range(count):
+                source = sources[start + row]
+                if isinstance(source, np.ndarray):
+                    shard[row] = source
+                else:
+                    old_shards, index = source
+                    shard[row] = old_shards[index // self.shard_size][index % self.shard_size]
+            shard.flush()
+            del shard
+            os.replace(tmp_path, os.path.join(self.cache_dir, name))
+            shard_files.append(name)
+
+        new_manifest = dict(self.fingerprint(), generation=generation, shards=shard_files,
+                            entries=entries, skipped=skipped)
+        self._write_manifest(new_manifest)
+        for name in (manifest or {}).get("shards", []):
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+        return new_manifest
+
+    def _write_manifest(self, manifest):
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, self.manifest_path)
+
+    # ------------------------------------------------
+    # Leitura
+    # ------------------------------------------------
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        fingerprint = self.fingerprint()
+        if any(manifest.get(k) != v for k, v in fingerprint.items()):
+            print("Cache de imagens com outra configuração de pré-processamento: reconstruindo.")
+            return None
+        if not all(os.path.isfile(os.path.join(self.cache_dir, name)) for name in manifest["shards"]):
+            return None
+        return manifest
+
+    def _open_shards(self, manifest):
+        return [np.load(os.path.join(self.cache_dir, name), mmap_mode='r') for name in manifest["shards"]]
+
+    def load(self, manifest=None, stats=None):
+        manifest = manifest or self._load_manifest()
+        if manifest is None:
+            raise FileNotFoundError(f"Cache de imagens não encontrado em {self.cache_dir}")
+        labels = np.array([e["label"] for e in manifest["entries"]], dtype=np.int32)
+        paths = [e["path"] for e in manifest["entries"]]
+        return LeafDataset(self._open_shards(manifest), labels, self.shard_size, stats, paths)
+
+
+def make_tf_dataset(dataset, batch_size, shuffle=True, seed=None, indices=None):
+    """Pipeline tf.data: embaralha índices, monta lotes dos shards em paralelo, normaliza e faz prefetch.
+
+    A normalização (uint8 → float32 * 1/255) é a mesma de leaf_preprocessing.normalize.
+    `indices` restringe o pipeline a um subconjunto (ex.: novas + replay no retreino incremental).
+    """
+    import tensorflow as tf
+    height, width = dataset.shards[0].shape[1:3] if dataset.shards else IMG_SIZE
+    if indices is None:
+        count = len(dataset)
+        indices = tf.data.Dataset.range(count)
+    else:
+        count = len(indices)
+        indices = tf.data.Dataset.from_tensor_slices(np.asarray(indices, dtype=np.int64))
+    if shuffle:
+        indices = indices.shuffle(count, seed=seed, reshuffle_each_iteration=True)
+
+    def load_batch(batch_indices):
+        images, labels = tf.numpy_function(dataset.gather, [batch_indices], [tf.uint8, tf.int32])
+        images.set_shape((None, height, width, CHANNELS))
+        labels.set_shape((None,))
+        return tf.cast(images, tf.float32) * SCALE, labels
+
+    return (indices.batch(batch_size)
+            .map(load_batch, num_parallel_calls=tf.data.AUTOTUNE, deterministic=not shuffle)
+            .prefetch(tf.data.AUTOTUNE))
@@ -0,0 +1,93 @@
+import os
+import numpy as np
+from PIL import Image
+
+# ----------------------------------------------------
+# Pré-processamento de imagens foliares (compartilhado por api.py e train_cnn.py)
+# ----------------------------------------------------
+# 1. JPEGs são decodificados em modo "draft" (redução por DCT no próprio
+#    decoder), então uma foto de 12 MP nunca é expandida em resolução cheia.
+# 2. Um único resize para IMG_SIZE, copiado para um buffer uint8 pré-alocado.
+# 3. Normalização vetorizada (uint8 → float32 em [0, 1]) sobre o lote inteiro.
+
+IMG_SIZE = (64, 64) # (altura, largura) usada no treinamento
+CHANNELS = 3
+RESAMPLE = Image.BILINEAR
+DRAFT_FACTOR = 2 # O draft mantém ao menos 2x o tamanho final antes do resize (como o Image.thumbnail)
+SCALE = np.float32(1.0 / 255.0)
+
+# Rótulo numérico de cada classe: a saída da CNN é a probabilidade de "doente"
+CLASS_INDICES = {'saudavel': 0, 'doente': 1}
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+def decode_leaf_image(source, out=None, size=IMG_SIZE):
+    """Decodifica e redimensiona uma imagem para (altura, largura, 3) uint8.
+
+    `source` pode ser um caminho ou um arquivo/stream binário. Se `out` for
+    informado, o resultado é escrito nele (ex.: uma linha de um lote pré-alocado).
+    """
+    height, width = size
+    with Image.open(source) as img:
+        if img.format == 'JPEG':
+            img.draft('RGB', (width * DRAFT_FACTOR, height * DRAFT_FACTOR))
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        img = img.resize((width, height), RESAMPLE)
+    if out is None:
+        out = np.empty((height, width, CHANNELS), dtype=np.uint8)
+    out[...] = np.asarray(img, dtype=np.uint8)
+    return out
+
+
+def decode_batch(sources, size=IMG_SIZE):
+    """Decodifica várias imagens num único array (n, altura, largura, 3) uint8."""
+    batch = np.empty((len(sources), size[0], size[1], CHANNELS), dtype=np.uint8)
+    for i, source in enumerate(sources):
+        decode_leaf_image(source, out=batch[i], size=size)
+    return batch
+
+
+def normalize(batch, out=None):
+    """Converte uint8 em float32 no intervalo [0, 1] numa única operação vetorizada."""
+    if out is None:
+        out = np.empty(batch.shape, dtype=np.float32)
+    return np.multiply(batch, SCALE, out=out, dtype=np.float32)
+
+
+def preprocess_leaf_image(source):
+    """Atalho para a inferência: retorna o tensor (1, altura, largura, 3) float32."""
+    return normalize(decode_leaf_image(source)[np.newaxis])
+
+
+def list_leaf_images(data_dir):
+    """Lista (caminho, rótulo) das imagens em data_dir/<classe>/, em ordem determinística."""
+    items = []
+    for class_name, class_index in CLASS_INDICES.items():
+        class_dir = os.path.join(data_dir, class_name)
+        if not os.path.isdir(class_dir):
+            continue
+        for filename in sorted(os.listdir(class_dir)):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                items.append((os.path.join(class_dir, filename), class_index))
+    return items
+
+
+def load_leaf_dataset(data_dir, size=IMG_SIZE):
+    """Carrega o dataset rotulado como (X uint8 (n, altura, largura, 3), y int32 (n,)).
+
+    Arquivos que não podem ser decodificados são ignorados com um aviso.
+    """
+    items = list_leaf_images(data_dir)
+    X = np.empty((len(items), size[0], size[1], CHANNELS), dtype=np.uint8)
+    y = np.empty(len(items), dtype=np.int32)
+    n = 0
+    for path, label in items:
+        try:
+            decode_leaf_image(path, out=X[n], size=size)
+        except (OSError, ValueError) as e:
+            print(f"AVISO: imagem ignorada ({path}): {e}")
+            continue
+        y[n] = label
+        n += 1
+    return X[:n], y[:n]
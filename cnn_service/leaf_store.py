@@ -0,0 +1,193 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import tempfile
+import threading
+from PIL import Image
+from leaf_preprocessing import CLASS_INDICES, list_leaf_images
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Raiz do projeto (pacote common)
+from common.ingestion import append_block
+
+# ----------------------------------------------------
+# Armazenamento das imagens ingeridas por conteúdo (SHA-256)
+# ----------------------------------------------------
+# uploads/objects/ab/cd/<sha256>.<ext>  - a imagem, gravada uma única vez
+# uploads/index.jsonl                   - uma linha por imagem nova (ou troca de rótulo):
+#                                         hash, rótulo, tamanho, formato, caminho, data
+# O upload vai para um arquivo temporário (calculando o hash durante a cópia) e é
+# publicado com os.link, que falha se o objeto já existir: duas ingestões
+# simultâneas nunca se sobrescrevem e um reenvio não regrava o arquivo.
+#
+# Migração das pastas antigas (uploads/<rótulo>/*.jpg):
+#   python cnn_service/leaf_store.py --root cnn_service/uploads --migrate
+
+# Formato detectado pelo Pillow -> extensão do objeto
+FORMAT_EXTENSIONS = {'JPEG': '.jpg', 'MPO': '.jpg', 'PNG': '.png', 'BMP': '.bmp', 'WEBP': '.webp'}
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class UnsupportedImage(ValueError):
+    """Upload vazio ou em formato que o treino não lê."""
+
+
+def detect_format(path):
+    """Formato real da imagem pelo cabeçalho (sem decodificar os pixels)."""
+    try:
+        with Image.open(path) as img:
+            image_format = img.format
+    except (OSError, ValueError):
+        raise UnsupportedImage("Arquivo não é uma imagem válida.")
+    if image_format not in FORMAT_EXTENSIONS:
+        raise UnsupportedImage(f"Formato {image_format} não suportado. Use JPEG, PNG, BMP ou WEBP.")
+    return image_format
+
+
+def _publish(tmp_path, path):
+    """Publica o temporário em `path` sem sobrescrever; False se o objeto já existia."""
+    try:
+        os.link(tmp_path, path)
+        return True
+    except FileExistsError:
+        return False
+    except OSError: # Sistema de arquivos sem hard links
+        if os.path.exists(path):
+            return False
+        os.replace(tmp_path, path)
+        return True
+
+
+class LeafImageStore:
+    def __init__(self, root, fsync=False):
+        self.root = root
+        self.objects_dir = os.path.join(root, 'objects')
+        self.tmp_dir = os.path.join(root, '.tmp')
+        self.index_path = os.path.join(root, 'index.jsonl')
+        self.fsync = fsync
+        self._labels = {} # hash -> último rótulo visto no índice
+        self._offset = 0 # Posição já lida do índice (outros workers também anexam a ele)
+        self._lock = threading.Lock()
+
+    def object_path(self, digest, extension):
+        """Dois níveis de diretório (256 x 256) limitam a quantidade de arquivos por pasta."""
+        return os.path.join(self.objects_dir, digest[:2], digest[2:4], digest + extension)
+
+    def put(self, stream, label):
+        """Grava a imagem de `stream` com o rótulo; retorna (entrada do índice, duplicada?)."""
+        if label not in CLASS_INDICES:
+            raise ValueError(f"Rótulo inválido: {label}")
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir, suffix='.part')
+        try:
+            digest = hashlib.sha256()
+            size = 0
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in iter(lambda: stream.read(COPY_CHUNK_SIZE), b''):
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+                if self.fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            if size == 0:
+                raise UnsupportedImage("Imagem vazia.")
+            image_format = detect_format(tmp_path)
+            digest = digest.hexdigest()
+            path = self.object_path(digest, FORMAT_EXTENSIONS[image_format])
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            created = _publish(tmp_path, path)
+        finally:
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+
+        entry = {"hash": digest, "label": label, "size": size, "format": image_format,
+                 "path": os.path.relpath(path, self.root), "ingested_at": time.strftime('%Y-%m-%dT%H:%M:%S')}
+        with self._lock:
+            self._refresh()
+            if self._labels.get(digest) != label:
+                # Imagem nova ou rótulo diferente do último registrado (o mais recente vale)
+                append_block(self.index_path, (json.dumps(entry, ensure_ascii=False) + '\n').encode('utf-8'),
+                             b'', self.fsync)
+                self._labels[digest] = label
+        return entry, not created
+
+    def _refresh(self):
+        """Lê as linhas completas anexadas ao índice desde a última leitura."""
+        try:
+            f = open(self.index_path, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            f.seek(self._offset)
+            data = f.read()
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            self._labels[entry["hash"]] = entry["label"]
+        self._offset += end
+
+    def entries(self):
+        """Entradas do índice por hash (rótulo mais recente), na ordem da primeira ingestão."""
+        latest = {}
+        if os.path.isfile(self.index_path):
+            with open(self.index_path, 'rb') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue # Linha final incompleta
+                    latest[entry["hash"]] = entry
+        return latest
+
+    def training_items(self):
+        """(caminho, rótulo numérico) de cada imagem do índice, como list_leaf_images."""
+        items = []
+        for entry in self.entries().values():
+            path = os.path.join(self.root, entry["path"])
+            if entry["label"] in CLASS_INDICES and os.path.isfile(path):
+                items.append((path, CLASS_INDICES[entry["label"]]))
+        return items
+
+    def migrate_legacy(self):
+        """Move as imagens de <root>/<rótulo>/ para o armazenamento por conteúdo."""
+        labels = {index: label for label, index in CLASS_INDICES.items()}
+        moved = duplicates = 0
+        for path, label_index in list_leaf_images(self.root):
+            try:
+                with open(path, 'rb') as f:
+                    _, duplicate = self.put(f, labels[label_index])
+            except UnsupportedImage as e:
+                print(f"AVISO: imagem ignorada ({path}): {e}")
+                continue
+            os.remove(path)
+            moved += 1
+            duplicates += duplicate
+        return moved, duplicates
+
+
+def training_items(data_dir):
+    """Imagens do treino: índice do armazenamento + pastas antigas ainda não migradas."""
+    return LeafImageStore(data_dir).training_items() + list_leaf_images(data_dir)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Armazenamento por conteúdo das imagens da CNN")
+    parser.add_argument('--root', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads'))
+    parser.add_argument('--migrate', action='store_true', help="Move uploads/<rótulo>/* para o armazenamento por conteúdo")
+    args = parser.parse_args()
+
+    store = LeafImageStore(args.root)
+    if args.migrate:
+        moved, duplicates = store.migrate_legacy()
+        print(f"{moved} imagens migradas ({duplicates} duplicadas, não regravadas)")
+    entries = store.entries()
+    by_label = {label: sum(1 for e in entries.values() if e["label"] == label) for label in CLASS_INDICES}
+    print(f"Índice: {len(entries)} imagens únicas {by_label} em {store.index_path}")
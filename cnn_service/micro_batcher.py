@@ -0,0 +1,152 @@
+import time
+import queue
+import threading
+import numpy as np
+
+# ----------------------------------------------------
+# Micro-batching dinâmico para a inferência da CNN
+# ----------------------------------------------------
+# Cada requisição HTTP enfileira um tensor (1, 64, 64, 3). Um worker em
+# background junta até `max_batch_size` imagens ou espera no máximo
+# `max_wait_ms` a partir da chegada da primeira, roda UM forward pass e
+# devolve a probabilidade de cada imagem para a requisição correspondente.
+# Com `context` (ex.: o bundle do modelo lido pela requisição), um lote só junta
+# requisições do mesmo contexto e chama `predict_fn(inputs, context)`.
+
+_STOP = object()
+
+
+class _PendingRequest:
+    """Uma imagem aguardando na fila, com o resultado preenchido pelo worker."""
+    __slots__ = ("array", "context", "enqueued_at", "done", "result", "error", "info")
+
+    def __init__(self, array, context=None):
+        self.array = array
+        self.context = context
+        self.enqueued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.info = None
+
+
+class MicroBatcher:
+    """Agrupa requisições concorrentes em um único `predict` em lote."""
+
+    def __init__(self, predict_fn, max_batch_size=16, max_wait_ms=5.0):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size deve ser >= 1")
+        self.predict_fn = predict_fn
+        self.max_batch_size = int(max_batch_size)
+        self.max_wait = max(float(max_wait_ms), 0.0) / 1000.0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._carry = None # Requisição de outro contexto que abre o próximo lote
+        self._lock = threading.Lock()
+        # Contadores agregados para ajuste do trade-off latência/vazão
+        self._batches = 0
+        self._requests = 0
+        self._queue_wait_total = 0.0
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="cnn-micro-batcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, img_array, timeout=None, context=None):
+        """Enfileira um tensor (1, H, W, C) e bloqueia até o resultado do lote.
+
+        Retorna `(probabilidade, info)`, onde `info` traz `queue_wait_ms`,
+        `batch_size` e `inference_ms` do lote em que a imagem foi processada.
+        """
+        pending = _PendingRequest(img_array, context)
+        self._queue.put(pending)
+        if not pending.done.wait(timeout):
+            raise TimeoutError("Tempo esgotado aguardando o lote de inferência.")
+        if pending.error is not None:
+            raise pending.error
+        return pending.result, pending.info
+
+    def stats(self):
+        with self._lock:
+            batches, requests = self._batches, self._requests
+            wait_total = self._queue_wait_total
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "batches": batches,
+            "requests": requests,
+            "avg_batch_size": requests / batches if batches else 0.0,
+            "avg_queue_wait_ms": wait_total * 1000.0 / requests if requests else 0.0,
+            "queue_depth": self._queue.qsize(),
+        }
+
+    # ------------------------------------------------
+    # Loop do worker
+    # ------------------------------------------------
+    def _collect(self, first):
+        batch = [first]
+        deadline = first.enqueued_at + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                # Reinsere o sinal para encerrar após processar este lote
+                self._queue.put(_STOP)
+                break
+            if item.context is not first.context:
+                # Outro contexto (ex.: modelo recém-trocado): fecha o lote e abre o próximo
+                self._carry = item
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            first, self._carry = self._carry, None
+            if first is None:
+                first = self._queue.get()
+            if first is _STOP:
+                break
+            batch = self._collect(first)
+
+            started_at = time.perf_counter()
+            try:
+                inputs = np.concatenate([p.array for p in batch], axis=0)
+                if first.context is None:
+                    outputs = self.predict_fn(inputs)
+                else:
+                    outputs = self.predict_fn(inputs, first.context)
+            except Exception as e:
+                for p in batch:
+                    p.error = e
+                    p.done.set()
+                continue
+            inference_ms = (time.perf_counter() - started_at) * 1000.0
+
+            wait_total = 0.0
+            for i, p in enumerate(batch):
+                queue_wait = started_at - p.enqueued_at
+                wait_total += queue_wait
+                p.result = float(outputs[i][0])
+                p.info = {
+                    "queue_wait_ms": round(queue_wait * 1000.0, 3),
+                    "batch_size": len(batch),
+                    "inference_ms": round(inference_ms, 3),
+                }
+                p.done.set()
+
+            with self._lock:
+                self._batches += 1
+                self._requests += len(batch)
+                self._queue_wait_total += wait_total
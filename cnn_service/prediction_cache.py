@@ -0,0 +1,96 @@
+import sys
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from common.hashing import update_from_stream
+
+# ----------------------------------------------------
+# Cache LRU de predições por conteúdo da imagem
+# ----------------------------------------------------
+# A chave é o hash dos bytes da imagem (após o Base64) mais a versão do
+# modelo carregado, então um reenvio da mesma foto não refaz decode + predict
+# e uma troca de modelo nunca devolve um resultado antigo.
+
+def content_key(stream, model_version):
+    """Calcula a chave a partir de um stream binário, sem copiá-lo (o stream volta à posição inicial)."""
+    digest = hashlib.blake2b(digest_size=16)
+    start = stream.tell()
+    update_from_stream(digest, stream)
+    stream.seek(start)
+    return f"{model_version}:{digest.hexdigest()}"
+
+
+class LRUCache:
+    """LRU thread-safe com limite de entradas, limite de bytes e TTL."""
+
+    def __init__(self, max_entries=10000, max_bytes=16 * 1024 * 1024, ttl_seconds=3600.0):
+        self.max_entries = int(max_entries)
+        self.max_bytes = int(max_bytes)
+        self.ttl = float(ttl_seconds)
+        self._data = OrderedDict() # chave -> (valor, tamanho, expira_em)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def entry_size(key, value):
+        return sys.getsizeof(key) + sys.getsizeof(value)
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[2] <= now:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        size = self.entry_size(key, value)
+        if size > self.max_bytes or self.max_entries <= 0:
+            return
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, size, time.monotonic() + self.ttl)
+            self._bytes += size
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def clear(self):
+        """Descarta todas as entradas (ex.: quando um novo modelo é carregado)."""
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+            self.invalidations += 1
+
+    def _remove(self, key):
+        _, size, _ = self._data.pop(key)
+        self._bytes -= size
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_s": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,93 @@
+import threading
+import numpy as np
+
+# ----------------------------------------------------
+# Inferência da CNN com o interpretador TFLite (sem o runtime completo do TensorFlow)
+# ----------------------------------------------------
+# Os modelos `cnn_model_int8.tflite` e `cnn_model_float16.tflite` são gerados por
+# `export_tflite.py`. O interpretador vem, nesta ordem, de `tflite_runtime`,
+# `ai_edge_litert` (pacotes leves, só o interpretador) ou `tensorflow.lite`
+# (funciona, mas importa o TensorFlow inteiro).
+
+TFLITE_VARIANTS = ('int8', 'float16')
+
+
+def tflite_filename(variant):
+    """Nome do artefato de cada variante (cnn_model_int8.tflite, cnn_model_float16.tflite)."""
+    if variant not in TFLITE_VARIANTS:
+        raise ValueError(f"Variante TFLite desconhecida: {variant} (use {', '.join(TFLITE_VARIANTS)})")
+    return f'cnn_model_{variant}.tflite'
+
+
+def load_interpreter_class():
+    """Classe Interpreter do pacote mais leve disponível."""
+    try:
+        from tflite_runtime.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    try:
+        import tensorflow as tf
+    except ImportError:
+        raise ImportError("Nenhum interpretador TFLite encontrado. Instale `ai-edge-litert` (ou `tflite-runtime`).")
+    return tf.lite.Interpreter
+
+
+class TFLiteCNN:
+    """Modelo TFLite com a mesma interface de `predict` do Keras: (N, 64, 64, 3) float32 -> (N, 1).
+
+    O interpretador não é seguro entre threads: as chamadas são serializadas por
+    um lock (o paralelismo fica nas `num_threads` de cada forward pass). A entrada
+    é redimensionada para o tamanho do lote só quando ele muda.
+    """
+
+    def __init__(self, model_path, num_threads=None):
+        Interpreter = load_interpreter_class()
+        self.model_path = model_path
+        self.num_threads = num_threads
+        self._interpreter = Interpreter(model_path=model_path, num_threads=num_threads)
+        self._input = self._interpreter.get_input_details()[0]
+        self._output = self._interpreter.get_output_details()[0]
+        self._batch_size = None
+        self._lock = threading.Lock()
+
+    def _resize(self, batch_size):
+        shape = [batch_size] + list(self._input['shape'][1:])
+        self._interpreter.resize_tensor_input(self._input['index'], shape)
+        self._interpreter.allocate_tensors()
+        # Os índices continuam os mesmos; só os detalhes (shape) mudam
+        self._output = self._interpreter.get_output_details()[0]
+        self._batch_size = batch_size
+
+    def _quantize(self, batch):
+        dtype = self._input['dtype']
+        if dtype == np.float32:
+            return np.ascontiguousarray(batch, dtype=np.float32)
+        scale, zero_point = self._input['quantization']
+        info = np.iinfo(dtype)
+        return np.clip(np.round(batch / scale + zero_point), info.min, info.max).astype(dtype)
+
+    def _dequantize(self, values):
+        if self._output['dtype'] == np.float32:
+            return values
+        scale, zero_point = self._output['quantization']
+        return (values.astype(np.float32) - zero_point) * scale
+
+    def predict(self, batch, verbose=None):
+        batch = np.asarray(batch)
+        with self._lock:
+            if batch.shape[0] != self._batch_size:
+                self._resize(batch.shape[0])
+            self._interpreter.set_tensor(self._input['index'], self._quantize(batch))
+            self._interpreter.invoke()
+            # Cópia: o buffer de saída é reaproveitado no próximo invoke
+            return self._dequantize(self._interpreter.get_tensor(self._output['index']).copy())
+
+    def __call__(self, batch, training=False):
+        """Mesma interface da chamada direta do modelo Keras (`model(x, training=False)`)."""
+        return self.predict(batch)
@@ -1,72 +1,131 @@
 import tensorflow as tf
-from tensorflow.keras.models import Sequential
+from tensorflow.keras.models import Sequential, load_model
 from tensorflow.keras.layers import Conv2D, MaxPooling2D, Flatten, Dense
-from tensorflow.keras.preprocessing.image import ImageDataGenerator
+from leaf_preprocessing import IMG_SIZE, CLASS_INDICES, normalize
+from leaf_cache import LeafShardCache, make_tf_dataset
+from leaf_store import training_items
+from export_tflite import CALIBRATION_IMAGES, export_tflite
 import os
+import sys
+import numpy as np
 
 # Definindo caminhos
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BASE_DIR)) # Raiz do projeto (pacote common)
+from common.retrain import TrainingWatermark, epochs_for, fine_tune_optimizer, image_keys, plan_retrain
+from common.training import TrainingMonitor, run_fingerprint, split_validation
+from common.registry import publish_artifacts
+
 DATA_DIR = os.path.join(BASE_DIR, 'uploads')
 MODEL_PATH = os.path.join(BASE_DIR, 'cnn_model.h5')
 os.makedirs(os.path.join(BASE_DIR, 'model_artifacts'), exist_ok=True) # Cria pasta para artefatos
 
 # Configurações
-IMG_SIZE = (64, 64) # Tamanho da imagem para o modelo
-BATCH_SIZE = 4
+BATCH_SIZE = int(os.environ.get('CNN_TRAIN_BATCH_SIZE', '4'))
 EPOCHS = 20
+CACHE_DIR = os.environ.get('CNN_DATASET_CACHE_DIR', os.path.join(BASE_DIR, 'dataset_cache'))
+CACHE_VERIFY = os.environ.get('CNN_DATASET_CACHE_VERIFY', 'mtime') # 'hash' confere o conteúdo quando o mtime muda
+EXPORT_TFLITE = os.environ.get('CNN_EXPORT_TFLITE', '1') == '1' # Variantes int8/float16 para CNN_BACKEND=tflite
 
 # 1. Preparação dos dados
-# Removemos o validation_split para usar todos os dados disponíveis para treino.
-datagen = ImageDataGenerator(
-    rescale=1./255,
-)
+# Mesmo pré-processamento da API (leaf_preprocessing): decode + resize + normalização idênticos.
+# Rótulos explícitos (CLASS_INDICES): 0 = saudavel, 1 = doente, como a API interpreta a saída.
+# As imagens vêm do índice do armazenamento por conteúdo (leaf_store), sem listar diretórios,
+# mais as pastas antigas uploads/<classe>/ ainda não migradas.
+# Cada imagem é decodificada uma única vez para os shards uint8 do cache (leaf_cache);
+# as épocas leem os shards via mmap num pipeline tf.data paralelo com prefetch.
+dataset = LeafShardCache(CACHE_DIR, verify=CACHE_VERIFY).build(DATA_DIR, items=training_items(DATA_DIR))
 
-# Gerador para dados de treino (agora usa todos os dados disponíveis)
-train_generator = datagen.flow_from_directory(
-    DATA_DIR,
-    target_size=IMG_SIZE,
-    batch_size=BATCH_SIZE,
-    class_mode='binary',
-    seed=42
-)
+if len(dataset) == 0:
+    print(f"Erro: Nenhuma imagem encontrada em {DATA_DIR} (índice index.jsonl ou subpastas: {list(CLASS_INDICES)}). Certifique-se de ter executado a Etapa 2.")
+    exit()
 
-print(f"\nTotal de imagens para treino: {train_generator.samples}")
+stats = dataset.stats
+print(f"Cache de imagens: {stats['reused']} reaproveitadas, {stats['decoded']} decodificadas, "
+      f"{stats['removed']} removidas em {stats['build_s']:.2f}s ({CACHE_DIR})")
+print(f"\nTotal de imagens para treino: {len(dataset)}")
+
+# Retreino incremental (RETRAIN_MODE=incremental): só as imagens novas (ou com rótulo trocado) + replay
+keys = image_keys(zip(dataset.paths, dataset.labels.tolist()))
+plan = plan_retrain('cnn', keys)
+print(f"Modo de treino: {plan}")
+if plan.mode == 'skip':
+    exit()
+
+# Validação (early stopping): fração fixa das imagens deste treino, sorteada com semente e estratificada pelo rótulo
+indices = np.arange(len(dataset)) if plan.indices is None else np.asarray(plan.indices)
+fit_positions, val_positions = split_validation(dataset.labels[indices])
+train_indices, val_indices = np.sort(indices[fit_positions]), np.sort(indices[val_positions])
+n_val = len(val_indices)
+train_data = make_tf_dataset(dataset, BATCH_SIZE, shuffle=True, indices=train_indices)
+val_data = make_tf_dataset(dataset, BATCH_SIZE, shuffle=False, indices=val_indices) if n_val else None
 
 # 2. Construção e Treinamento do Modelo CNN
-model = Sequential([
-    Conv2D(32, (3, 3), activation='relu', input_shape=(IMG_SIZE[0], IMG_SIZE[1], 3)),
-    MaxPooling2D((2, 2)),
-    Conv2D(64, (3, 3), activation='relu'),
-    MaxPooling2D((2, 2)),
-    Flatten(),
-    Dense(64, activation='relu'),
-    Dense(1, activation='sigmoid') 
-])
+if plan.mode == 'incremental':
+    model = load_model(os.path.join(BASE_DIR, 'model_artifacts', 'cnn_model.h5'))
+    epochs, optimizer = epochs_for('cnn'), fine_tune_optimizer()
+else:
+    model = Sequential([
+        Conv2D(32, (3, 3), activation='relu', input_shape=(IMG_SIZE[0], IMG_SIZE[1], 3)),
+        MaxPooling2D((2, 2)),
+        Conv2D(64, (3, 3), activation='relu'),
+        MaxPooling2D((2, 2)),
+        Flatten(),
+        Dense(64, activation='relu'),
+        Dense(1, activation='sigmoid') 
+    ])
+    epochs, optimizer = EPOCHS, 'adam'
 
 # Compilação
-model.compile(optimizer='adam',
+model.compile(optimizer=optimizer,
               loss='binary_crossentropy',
               metrics=['accuracy'])
 
 print("\nIniciando o treinamento do Modelo CNN...")
 
-# Treinamento
-# Ajustamos steps_per_epoch para garantir que o treinamento possa rodar mesmo com poucos dados.
-if train_generator.samples > 0:
-    steps = train_generator.samples // BATCH_SIZE
-else:
-    steps = 1 # Garante que o treinamento rode pelo menos uma vez
-
+# Treinamento (todos os dados disponíveis, ou novas + replay no modo incremental), com
+# early stopping pela perda de validação, checkpoints e log por época (common/training.py)
+monitor = TrainingMonitor('cnn', run_fingerprint('cnn', plan.mode, keys, plan.indices, epochs=epochs,
+                                                 batch_size=BATCH_SIZE), samples=len(train_indices), epochs=epochs,
+                          validation_samples=n_val)
+model, initial_epoch = monitor.resume(model)
 model.fit(
-    train_generator,
-    steps_per_epoch=steps,
-    epochs=EPOCHS,
+    train_data,
+    validation_data=val_data,
+    epochs=epochs,
+    initial_epoch=initial_epoch,
+    callbacks=[monitor],
     verbose=0
 )
 
 # 3. Conclusão
-print(f"\nTreinamento concluído. O modelo foi treinado com {train_generator.samples} amostras.")
+print(f"\nTreinamento concluído. O modelo foi treinado com {len(train_indices)} amostras "
+      f"({n_val} de validação, {monitor.epochs_run} épocas).")
 
 # 4. Salvar o modelo
-model.save(os.path.join(BASE_DIR, 'model_artifacts', 'cnn_model.h5'))
-print(f"Modelo salvo em: {os.path.join(BASE_DIR, 'model_artifacts', 'cnn_model.h5')}")
\ No newline at end of file
+model_path = os.path.join(BASE_DIR, 'model_artifacts', 'cnn_model.h5')
+model.save(model_path)
+print(f"Modelo salvo em: {model_path}")
+
+# 5. Exportar para TFLite (int8 calibrado com as imagens de uploads/ + float16) e relatório de paridade
+if EXPORT_TFLITE:
+    try:
+        # No retreino incremental só confere a paridade (o benchmark dos backends sobe três processos)
+        # Calibração com imagens de treino; paridade na validação (fora da calibração e do ajuste dos pesos)
+        rng = np.random.default_rng(42)
+        calibration_indices = train_indices if len(train_indices) <= CALIBRATION_IMAGES else \
+            rng.choice(train_indices, CALIBRATION_IMAGES, replace=False)
+        calibration = normalize(dataset.gather(calibration_indices)[0])
+        parity = dataset.gather(val_indices)
+        export_tflite(model, model_path, data_dir=DATA_DIR, benchmark=plan.mode == 'full',
+                      calibration=calibration, parity=(normalize(parity[0]), parity[1]))
+    except Exception as e:
+        print(f"AVISO: exportação TFLite falhou (o modelo Keras continua válido): {e}")
+
+# 6. Marca d'água: todas as imagens do cache já foram vistas por este modelo
+TrainingWatermark.save('cnn', keys, plan.mode, new_samples=plan.n_new, replay_samples=plan.n_replay)
+monitor.finish()
+
+# 7. Registro: versão imutável dos artefatos (checksums + metadados); o alias latest aponta para ela
+publish_artifacts('cnn', metadata={"mode": plan.mode, "samples": int(len(train_indices)),
+                                   "epochs_run": monitor.epochs_run})
\ No newline at end of file
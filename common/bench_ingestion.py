@@ -0,0 +1,113 @@
+import os
+import csv
+import time
+import argparse
+import tempfile
+import threading
+import multiprocessing
+from common.ingestion import DirectCsvWriter, BufferedCsvWriter
+
+# ----------------------------------------------------
+# Benchmark da ingestão: append_to_csv original vs writers de common.ingestion
+# ----------------------------------------------------
+# Uso: python -m common.bench_ingestion --rows 20000 --threads 8 --processes 4
+HEADERS = ["temperatura", "umidade", "chuva", "ph", "rendimento_alto"]
+ROW = {"temperatura": 25.3, "umidade": 65, "chuva": 110, "ph": 6.4, "rendimento_alto": 1}
+
+
+def legacy_append_to_csv(path, data):
+    """Cópia do append_to_csv anterior (isfile + open + DictWriter + close, sem trava)."""
+    file_exists = os.path.isfile(path)
+    with open(path, mode='a', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=HEADERS, delimiter=',')
+        if not file_exists:
+            writer.writeheader()
+        writer.writerow(data)
+    return True
+
+
+def run_threads(append, rows, threads):
+    per_thread = rows // threads
+
+    def worker():
+        for _ in range(per_thread):
+            append(ROW)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    started_at = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return per_thread * threads, time.perf_counter() - started_at
+
+
+def check_file(path, expected_rows):
+    """Conta cabeçalhos e linhas malformadas do CSV gerado."""
+    headers = bad = data_rows = 0
+    with open(path, newline='') as f:
+        for record in csv.reader(f):
+            if record == HEADERS:
+                headers += 1
+            elif len(record) != len(HEADERS):
+                bad += 1
+            else:
+                data_rows += 1
+    ok = headers == 1 and bad == 0 and data_rows == expected_rows
+    return f"{'OK' if ok else 'FALHOU'} (cabeçalhos={headers}, linhas={data_rows}/{expected_rows}, malformadas={bad})"
+
+
+def _process_worker(path, rows, threads, durability, fsync):
+    writer = BufferedCsvWriter(path, HEADERS, durability=durability, fsync=fsync)
+    run_threads(writer.append, rows, threads)
+    writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de ingestão em CSV")
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--fsync', choices=('always', 'never'), default='never',
+                        help="Política de fsync dos writers novos ('always' mostra o ganho do group commit)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        scenarios = {
+            "append_to_csv original": lambda path: (lambda row: legacy_append_to_csv(path, row), None),
+            "DirectCsvWriter": lambda path: (DirectCsvWriter(path, HEADERS, fsync=args.fsync).append, None),
+            "BufferedCsvWriter (commit)": lambda path: _buffered(path, 'commit', args.fsync),
+            "BufferedCsvWriter (buffered)": lambda path: _buffered(path, 'buffered', args.fsync),
+        }
+        print(f"{args.rows} linhas, {args.threads} threads, fsync={args.fsync}")
+        print(f"{'Writer':<32} {'linhas/s':>12}  integridade")
+        for i, (name, factory) in enumerate(scenarios.items()):
+            path = os.path.join(tmp, f"bench_{i}.csv")
+            append, writer = factory(path)
+            rows, elapsed = run_threads(append, args.rows, args.threads)
+            if writer is not None:
+                writer.close()
+            print(f"{name:<32} {rows / elapsed:>12.0f}  {check_file(path, rows)}")
+
+        # Vários processos gravando no mesmo arquivo
+        path = os.path.join(tmp, "bench_multiprocess.csv")
+        per_process = args.rows // args.processes
+        procs = [multiprocessing.Process(target=_process_worker, args=(path, per_process, args.threads, 'commit', args.fsync))
+                 for _ in range(args.processes)]
+        started_at = time.perf_counter()
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+        elapsed = time.perf_counter() - started_at
+        expected = (per_process // args.threads) * args.threads * args.processes
+        print(f"{f'Buffered x {args.processes} processos':<32} {expected / elapsed:>12.0f}  {check_file(path, expected)}")
+
+
+def _buffered(path, durability, fsync):
+    writer = BufferedCsvWriter(path, HEADERS, durability=durability, fsync=fsync)
+    return writer.append, writer
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,535 @@
+import os
+import sys
+import json
+import time
+import random
+import signal
+import socket
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from io import BytesIO
+from importlib import metadata
+import numpy as np
+import requests
+
+# ----------------------------------------------------
+# Teste de carga dos três serviços de inferência
+# ----------------------------------------------------
+# Sobe cada serviço localmente (Gunicorn, porta livre), espera o /ready e aplica
+# carga em laço fechado com N clientes simultâneos por --duration segundos, para
+# cada nível de --concurrency. Registra vazão, latência p50/p95/p99, CPU e RSS
+# do serviço (mestre + workers) num JSON comparável entre commits.
+#
+# Uso:
+#   python -m common.bench_services --services fnn,cnn,rnn --concurrency 1,8,32 --duration 20
+#   python -m common.bench_services --compare bench_results/base.json   # roda e compara
+#   python -m common.bench_services --diff antes.json depois.json       # só compara
+#
+# Artefatos: 'real' usa model_artifacts/; 'tiny' treina em segundos, com dados
+# sintéticos, modelos com a mesma arquitetura dos scripts de treino (latência
+# representativa, predições sem sentido); 'auto' usa os reais quando existem.
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT_DIR, 'bench_results')
+SOIL_CSV = os.path.join(ROOT_DIR, 'fnn_service', 'soil_database.csv')
+NOTES_CSV = os.path.join(ROOT_DIR, 'rnn_service', 'field_notes_database.csv')
+UPLOADS_DIR = os.path.join(ROOT_DIR, 'cnn_service', 'uploads')
+
+SERVICES = {
+    'fnn': {'endpoint': '/predict/soil_data', 'artifacts': ('fnn_model.npz',)},
+    'cnn': {'endpoint': '/predict/leaf_image', 'artifacts': ('cnn_model.h5',)},
+    'rnn': {'endpoint': '/predict/note', 'artifacts': ('rnn_model.h5', 'tokenizer_vocab.json')},
+}
+# Cargas repetem payloads: sem isto a CNN mediria o cache de predições, não o modelo
+DEFAULT_SERVICE_ENV = {'cnn': {'CNN_CACHE_MAX_ENTRIES': '0'}}
+
+FEATURES = ['temperatura', 'umidade', 'chuva', 'ph']
+SOIL_LOW = np.array([15.0, 40.0, 0.0, 5.0])
+SOIL_HIGH = np.array([35.0, 95.0, 200.0, 7.5])
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+KERAS_FILTERS = '!"#$%&()*+,-./:;<=>?@[\\]^_`{|}~\t\n'
+MAX_LEN = 50
+
+
+# ----------------------------------------------------
+# Payloads (gerados uma vez por execução, com semente fixa)
+# ----------------------------------------------------
+def soil_payloads(n, rng):
+    """Metade linhas reais do soil_database.csv (se houver), metade sorteadas nas faixas do dashboard."""
+    payloads = []
+    if os.path.isfile(SOIL_CSV):
+        import pandas as pd
+        df = pd.read_csv(SOIL_CSV)[FEATURES].dropna()
+        if len(df):
+            sample = df.sample(n=min(n // 2, len(df)), random_state=int(rng.integers(1 << 31)))
+            payloads += [{"kind": "csv", "json": {f: float(row[f]) for f in FEATURES}} for _, row in sample.iterrows()]
+    for values in rng.uniform(SOIL_LOW, SOIL_HIGH, size=(n - len(payloads), len(FEATURES))):
+        payloads.append({"kind": "aleatorio", "json": dict(zip(FEATURES, (round(float(v), 2) for v in values)))})
+    return payloads
+
+
+def _note_texts():
+    if os.path.isfile(NOTES_CSV):
+        import pandas as pd
+        notes = pd.read_csv(NOTES_CSV)['nota'].dropna().astype(str).tolist()
+        if notes:
+            return notes
+    return ["O solo na área recém-plantada está compactando muito rapidamente. Requer subsolagem urgente.",
+            "Folhas amareladas no talhão 3. Verificar irrigação.",
+            "Visita de rotina, plantas com bom desenvolvimento."]
+
+
+def note_payloads(word_counts, per_length, rng):
+    """Notas reais + notas sintéticas com N palavras do vocabulário das notas (N em --note-words)."""
+    texts = _note_texts()
+    words = ' '.join(texts).split()
+    payloads = [{"kind": "real", "json": {"nota": texts[i]}}
+                for i in rng.choice(len(texts), size=min(per_length, len(texts)), replace=False)]
+    for count in word_counts:
+        for _ in range(per_length):
+            note = ' '.join(words[i] for i in rng.integers(0, len(words), size=count))
+            payloads.append({"kind": f"{count}_palavras", "json": {"nota": note}})
+    return payloads
+
+
+def _size_class(width, height):
+    megapixels = width * height / 1e6
+    return "<0.3MP" if megapixels < 0.3 else ("0.3-2MP" if megapixels <= 2 else ">2MP")
+
+
+def synthetic_jpeg(width, height, rng):
+    """JPEG com textura (parecido com uma foto de celular no custo de decodificação)."""
+    from PIL import Image
+    small = rng.integers(0, 256, size=(max(1, height // 16), max(1, width // 16), 3), dtype=np.uint8)
+    buffer = BytesIO()
+    Image.fromarray(small).resize((width, height), Image.BILINEAR).save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def image_payloads(source, sizes, max_images, rng):
+    """Imagens de cnn_service/uploads/ (classe por megapixels) ou JPEGs sintéticos nos tamanhos pedidos."""
+    from PIL import Image
+    payloads = []
+    if source in ('uploads', 'auto'):
+        paths = sorted(os.path.join(d, f) for d, dirs, files in os.walk(UPLOADS_DIR) if '.tmp' not in d
+                       for f in files if f.lower().endswith(IMAGE_EXTENSIONS))
+        for i in rng.permutation(len(paths))[:max_images]:
+            with open(paths[i], 'rb') as f:
+                data = f.read()
+            try:
+                with Image.open(BytesIO(data)) as img:
+                    kind, image_format = _size_class(*img.size), img.format
+            except OSError:
+                continue
+            payloads.append({"kind": kind, "data": data, "content_type": Image.MIME.get(image_format, 'image/jpeg')})
+        if payloads or source == 'uploads':
+            return payloads
+    per_size = max(1, max_images // len(sizes))
+    for width, height in sizes:
+        for _ in range(per_size):
+            payloads.append({"kind": f"{width}x{height}", "data": synthetic_jpeg(width, height, rng),
+                             "content_type": 'image/jpeg'})
+    return payloads
+
+
+# ----------------------------------------------------
+# Artefatos mínimos (mesma arquitetura dos scripts de treino)
+# ----------------------------------------------------
+def build_tiny_artifacts(service, output_dir, seed=42):
+    """Treina 1 época em dados sintéticos e grava os artefatos que a API do serviço carrega."""
+    import tensorflow as tf
+    from tensorflow.keras.models import Sequential
+    from tensorflow.keras.layers import Dense, Conv2D, MaxPooling2D, Flatten, Embedding, LSTM, Input
+    tf.keras.utils.set_random_seed(seed)
+    rng = np.random.default_rng(seed)
+    os.makedirs(output_dir, exist_ok=True)
+
+    if service == 'fnn':
+        import joblib
+        from sklearn.preprocessing import MinMaxScaler
+        sys.path.insert(0, os.path.join(ROOT_DIR, 'fnn_service'))
+        from export_fnn import export_numpy_engine
+        X = rng.uniform(SOIL_LOW, SOIL_HIGH, size=(512, len(FEATURES)))
+        scaler = MinMaxScaler().fit(X)
+        model = Sequential([Input((len(FEATURES),)), Dense(16, activation='relu'), Dense(8, activation='relu'),
+                            Dense(1, activation='sigmoid')])
+        model.compile(optimizer='adam', loss='binary_crossentropy')
+        model.fit(scaler.transform(X), rng.integers(0, 2, size=len(X)), epochs=1, verbose=0)
+        model.save(os.path.join(output_dir, 'fnn_model.h5'))
+        joblib.dump(scaler, os.path.join(output_dir, 'scaler.pkl'))
+        export_numpy_engine(model, scaler, os.path.join(output_dir, 'fnn_model.npz'))
+
+    elif service == 'cnn':
+        model = Sequential([Input((64, 64, 3)), Conv2D(32, (3, 3), activation='relu'), MaxPooling2D((2, 2)),
+                            Conv2D(64, (3, 3), activation='relu'), MaxPooling2D((2, 2)), Flatten(),
+                            Dense(64, activation='relu'), Dense(1, activation='sigmoid')])
+        model.compile(optimizer='adam', loss='binary_crossentropy')
+        images = rng.random((64, 64, 64, 3), dtype=np.float32)
+        model.fit(images, rng.integers(0, 2, size=64), epochs=1, verbose=0)
+        model.save(os.path.join(output_dir, 'cnn_model.h5'))
+        # Variantes TFLite para medir CNN_BACKEND=tflite (calibradas com as mesmas imagens sintéticas)
+        sys.path.insert(0, os.path.join(ROOT_DIR, 'cnn_service'))
+        from export_tflite import convert
+        from tflite_engine import TFLITE_VARIANTS, tflite_filename
+        for variant in TFLITE_VARIANTS:
+            with open(os.path.join(output_dir, tflite_filename(variant)), 'wb') as f:
+                f.write(convert(model, variant, images[:16]))
+
+    elif service == 'rnn':
+        table = str.maketrans({c: ' ' for c in KERAS_FILTERS})
+        vocab = sorted({w for text in _note_texts() for w in text.lower().translate(table).split()})
+        spec = {"format_version": 1, "num_words": None, "oov_token": "<OOV>", "filters": KERAS_FILTERS,
+                "lower": True, "split": ' ', "max_len": MAX_LEN, "vocab": ["<OOV>"] + vocab}
+        with open(os.path.join(output_dir, 'tokenizer_vocab.json'), 'w', encoding='utf-8') as f:
+            json.dump(spec, f, ensure_ascii=False)
+        vocab_size = len(spec["vocab"]) + 1
+        model = Sequential([Input((MAX_LEN,)), Embedding(vocab_size, 16, mask_zero=True), LSTM(32),
+                            Dense(1, activation='sigmoid')])
+        model.compile(optimizer='adam', loss='binary_crossentropy')
+        model.fit(rng.integers(1, vocab_size, size=(64, MAX_LEN)), rng.integers(0, 2, size=64), epochs=1, verbose=0)
+        model.save(os.path.join(output_dir, 'rnn_model.h5'))
+    print(f"[{service}] artefatos mínimos gravados em {output_dir}")
+    return output_dir
+
+
+def has_real_artifacts(service):
+    model_dir = os.path.join(ROOT_DIR, f'{service}_service', 'model_artifacts')
+    return all(os.path.isfile(os.path.join(model_dir, name)) for name in SERVICES[service]['artifacts'])
+
+
+# ----------------------------------------------------
+# Processo do serviço
+# ----------------------------------------------------
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def process_tree_usage(root_pid):
+    """(segundos de CPU, RSS em bytes) do processo e de todos os descendentes, via /proc (Linux)."""
+    if not os.path.isdir('/proc'):
+        return None, None
+    stats, children = {}, {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                raw = f.read()
+        except OSError:
+            continue
+        fields = raw[raw.rfind(')') + 2:].split() # O nome do processo pode conter espaços
+        pid, ppid = int(entry), int(fields[1])
+        stats[pid] = (int(fields[11]) + int(fields[12]), int(fields[21]))
+        children.setdefault(ppid, []).append(pid)
+    cpu_ticks = rss_pages = 0
+    pending = [root_pid]
+    while pending:
+        pid = pending.pop()
+        if pid in stats:
+            cpu_ticks += stats[pid][0]
+            rss_pages += stats[pid][1]
+        pending.extend(children.get(pid, ()))
+    return cpu_ticks / os.sysconf('SC_CLK_TCK'), rss_pages * os.sysconf('SC_PAGE_SIZE')
+
+
+class ServiceProcess:
+    """Serviço rodando sob `python -m <serviço>_service.serve` numa porta livre."""
+
+    def __init__(self, service, workers, threads, env, log_path):
+        self.service = service
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.command = [sys.executable, '-m', f'{service}_service.serve', '--host', '127.0.0.1',
+                        '--port', str(self.port), '--workers', str(workers), '--threads', str(threads)]
+        self.env = dict(os.environ, **env)
+        self.log_path = log_path
+        self.process = None
+
+    def start(self, ready_timeout):
+        """Sobe o serviço e espera o /ready; retorna o tempo até ficar pronto (s)."""
+        started_at = time.perf_counter()
+        with open(self.log_path, 'wb') as log:
+            self.process = subprocess.Popen(self.command, cwd=ROOT_DIR, env=self.env, stdout=log,
+                                            stderr=subprocess.STDOUT, start_new_session=True)
+        while time.perf_counter() - started_at < ready_timeout:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Serviço {self.service} encerrou ao subir.\n{self.log_tail()}")
+            try:
+                if requests.get(f"{self.url}/ready", timeout=1).status_code == 200:
+                    return time.perf_counter() - started_at
+            except requests.exceptions.RequestException:
+                pass
+            time.sleep(0.25)
+        self.stop()
+        raise RuntimeError(f"Serviço {self.service} não ficou pronto em {ready_timeout:g}s.\n{self.log_tail()}")
+
+    def stop(self):
+        if self.process is None or self.process.poll() is not None:
+            return
+        os.killpg(self.process.pid, signal.SIGTERM) # Mestre e workers do Gunicorn
+        try:
+            self.process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            os.killpg(self.process.pid, signal.SIGKILL)
+            self.process.wait()
+
+    def log_tail(self, lines=20):
+        with open(self.log_path, 'rb') as f:
+            return b''.join(f.readlines()[-lines:]).decode('utf-8', 'replace')
+
+
+# ----------------------------------------------------
+# Gerador de carga (laço fechado)
+# ----------------------------------------------------
+def _post(session, url, payload, timeout):
+    if "json" in payload:
+        return session.post(url, json=payload["json"], timeout=timeout)
+    return session.post(url, data=payload["data"], headers={"Content-Type": payload["content_type"]}, timeout=timeout)
+
+
+def run_load(url, payloads, concurrency, duration_s, warmup_s, timeout, seed, pid=None):
+    """Cada cliente envia uma requisição por vez até o fim do prazo; só o período após o aquecimento conta."""
+    measure_from = time.perf_counter() + warmup_s
+    measure_until = measure_from + duration_s
+    records = [None] * concurrency
+
+    def client(index):
+        session = requests.Session()
+        order = list(range(len(payloads)))
+        random.Random(seed + index).shuffle(order)
+        local, i = [], 0
+        while True:
+            started_at = time.perf_counter()
+            if started_at >= measure_until:
+                break
+            payload = payloads[order[i % len(order)]]
+            i += 1
+            try:
+                response = _post(session, url, payload, timeout)
+                status = response.status_code
+            except requests.exceptions.RequestException as e:
+                status = type(e).__name__
+            if started_at >= measure_from:
+                local.append(((time.perf_counter() - started_at) * 1000, status, payload["kind"]))
+        records[index] = local
+
+    clients = [threading.Thread(target=client, args=(i,), daemon=True) for i in range(concurrency)]
+    for t in clients:
+        t.start()
+
+    usage = {"rss_peak": None}
+    cpu_start = None
+    if pid is not None:
+        time.sleep(max(0.0, measure_from - time.perf_counter()))
+        cpu_start, _ = process_tree_usage(pid)
+        while any(t.is_alive() for t in clients) and time.perf_counter() < measure_until:
+            _, rss = process_tree_usage(pid)
+            if rss is not None:
+                usage["rss_peak"] = max(usage["rss_peak"] or 0, rss)
+            time.sleep(0.5)
+        cpu_end, _ = process_tree_usage(pid)
+    for t in clients:
+        t.join()
+
+    samples = [r for local in records for r in (local or [])]
+    result = summarize(samples, duration_s)
+    result["cpu_percent"] = None
+    if cpu_start is not None and cpu_end is not None:
+        result["cpu_percent"] = round((cpu_end - cpu_start) / duration_s * 100, 1)
+    result["rss_mb_peak"] = round(usage["rss_peak"] / 2**20, 1) if usage["rss_peak"] else None
+    return result
+
+
+def _percentiles(latencies):
+    if not len(latencies):
+        return None
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {"mean": round(float(np.mean(latencies)), 3), "p50": round(float(p50), 3), "p95": round(float(p95), 3),
+            "p99": round(float(p99), 3), "max": round(float(np.max(latencies)), 3)}
+
+
+def summarize(samples, duration_s):
+    ok = [latency for latency, status, _ in samples if isinstance(status, int) and 200 <= status < 300]
+    errors = {}
+    for _, status, _ in samples:
+        if not (isinstance(status, int) and 200 <= status < 300):
+            errors[str(status)] = errors.get(str(status), 0) + 1
+    by_payload = {}
+    for kind in sorted({kind for _, _, kind in samples}):
+        latencies = [latency for latency, status, k in samples
+                     if k == kind and isinstance(status, int) and 200 <= status < 300]
+        by_payload[kind] = {"requests": sum(1 for _, _, k in samples if k == kind), **(_percentiles(latencies) or {})}
+    return {"requests": len(samples), "errors": len(samples) - len(ok), "errors_by_status": errors,
+            "throughput_rps": round(len(ok) / duration_s, 2), "latency_ms": _percentiles(ok), "by_payload": by_payload}
+
+
+# ----------------------------------------------------
+# Resultados
+# ----------------------------------------------------
+def environment_info():
+    def git(*args):
+        try:
+            completed = subprocess.run(['git', *args], cwd=ROOT_DIR, capture_output=True, text=True, timeout=30)
+        except (OSError, subprocess.SubprocessError):
+            return None
+        return completed.stdout.strip() if completed.returncode == 0 else None
+    versions = {}
+    for package in ('numpy', 'flask', 'gunicorn', 'tensorflow', 'tensorflow-cpu', 'keras', 'pillow'):
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            pass
+    status = git('status', '--porcelain', '--untracked-files=no')
+    return {"git_commit": git('rev-parse', 'HEAD'), "git_dirty": bool(status) if status is not None else None,
+            "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'), "python": platform.python_version(),
+            "platform": platform.platform(), "cpu_count": os.cpu_count(), "packages": versions}
+
+
+def _result_key(result):
+    return (result["service"], result["concurrency"])
+
+
+def _delta(old, new):
+    if old is None or new is None:
+        return f"{'-':>22}"
+    change = f"{(new - old) / old * 100:+.1f}%" if old else ""
+    return f"{old:>8.1f} → {new:<8.1f}{change:>7}"
+
+
+def print_diff(base, current):
+    """Compara dois arquivos de resultados por (serviço, concorrência)."""
+    print(f"Base: {(base['meta'].get('git_commit') or '?')[:10]}  Atual: {(current['meta'].get('git_commit') or '?')[:10]}")
+    print(f"{'Serviço':<8}{'Conc.':>6}  {'req/s':^24}{'p95 (ms)':^24}{'p99 (ms)':^24}{'CPU %':^24}")
+    base_results = {_result_key(r): r for r in base["results"]}
+    for result in current["results"]:
+        old = base_results.get(_result_key(result))
+        if old is None:
+            continue
+        latency, old_latency = result.get("latency_ms") or {}, old.get("latency_ms") or {}
+        print(f"{result['service']:<8}{result['concurrency']:>6}  "
+              f"{_delta(old['throughput_rps'], result['throughput_rps'])}"
+              f"{_delta(old_latency.get('p95'), latency.get('p95'))}"
+              f"{_delta(old_latency.get('p99'), latency.get('p99'))}"
+              f"{_delta(old.get('cpu_percent'), result.get('cpu_percent'))}")
+
+
+def _load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def parse_sizes(raw):
+    return [tuple(int(v) for v in size.lower().split('x')) for size in raw.split(',') if size.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Teste de carga dos serviços de inferência")
+    parser.add_argument('--services', default='fnn,cnn,rnn')
+    parser.add_argument('--concurrency', default='1,8,32', help="Níveis de clientes simultâneos")
+    parser.add_argument('--duration', type=float, default=20.0, help="Segundos medidos por nível")
+    parser.add_argument('--warmup', type=float, default=3.0, help="Segundos de aquecimento por nível (descartados)")
+    parser.add_argument('--timeout', type=float, default=30.0, help="Timeout de cada requisição (s)")
+    parser.add_argument('--workers', type=int, default=2, help="Workers do Gunicorn por serviço")
+    parser.add_argument('--threads', type=int, default=4, help="Threads por worker")
+    parser.add_argument('--artifacts', choices=('auto', 'real', 'tiny'), default='auto')
+    parser.add_argument('--url', action='append', default=[], metavar='SERVIÇO=URL',
+                        help="Usa um serviço já rodando em vez de subir um (sem medição de CPU/RSS)")
+    parser.add_argument('--env', action='append', default=[], metavar='SERVIÇO:VAR=VALOR',
+                        help="Variável de ambiente extra para um serviço (ex.: cnn:CNN_BATCHING=1)")
+    parser.add_argument('--soil-rows', type=int, default=200)
+    parser.add_argument('--note-words', default='3,12,40,120', help="Tamanhos das notas sintéticas (palavras)")
+    parser.add_argument('--image-source', choices=('auto', 'uploads', 'synthetic'), default='auto')
+    parser.add_argument('--image-sizes', default='320x240,1024x768,3024x4032', help="Tamanhos das imagens sintéticas")
+    parser.add_argument('--max-images', type=int, default=48)
+    parser.add_argument('--ready-timeout', type=float, default=180.0)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default=None, help="Arquivo JSON (padrão: bench_results/<data>-<commit>.json)")
+    parser.add_argument('--compare', default=None, metavar='BASE.json', help="Compara com um resultado anterior")
+    parser.add_argument('--diff', nargs=2, metavar=('BASE.json', 'ATUAL.json'), help="Só compara dois resultados")
+    args = parser.parse_args(argv)
+
+    if args.diff:
+        print_diff(_load_results(args.diff[0]), _load_results(args.diff[1]))
+        return
+
+    services = [s.strip() for s in args.services.split(',') if s.strip()]
+    unknown = [s for s in services if s not in SERVICES]
+    if unknown:
+        parser.error(f"Serviços desconhecidos: {unknown}")
+    concurrency_levels = [int(c) for c in args.concurrency.split(',') if c.strip()]
+    external = dict(item.split('=', 1) for item in args.url)
+    service_env = {s: dict(DEFAULT_SERVICE_ENV.get(s, {})) for s in services}
+    for item in args.env:
+        service, assignment = item.split(':', 1)
+        key, value = assignment.split('=', 1)
+        service_env.setdefault(service, {})[key] = value
+
+    rng = np.random.default_rng(args.seed)
+    payload_builders = {
+        'fnn': lambda: soil_payloads(args.soil_rows, rng),
+        'cnn': lambda: image_payloads(args.image_source, parse_sizes(args.image_sizes), args.max_images, rng),
+        'rnn': lambda: note_payloads([int(n) for n in args.note_words.split(',')], 16, rng),
+    }
+
+    meta = environment_info()
+    output = args.output or os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{(meta['git_commit'] or 'nogit')[:10]}.json")
+    results = []
+    with tempfile.TemporaryDirectory(prefix='bench_services_') as tmp:
+        for service in services:
+            payloads = payload_builders[service]()
+            if not payloads:
+                print(f"[{service}] sem payloads (verifique --image-source); serviço ignorado")
+                continue
+            kinds = sorted({p["kind"] for p in payloads})
+            process, ready_s, artifacts = None, None, 'external'
+            if service in external:
+                url = external[service].rstrip('/')
+            else:
+                artifacts = args.artifacts
+                if artifacts == 'auto':
+                    artifacts = 'real' if has_real_artifacts(service) else 'tiny'
+                env = dict(service_env.get(service, {}))
+                if artifacts == 'tiny':
+                    env[f'{service.upper()}_MODEL_DIR'] = build_tiny_artifacts(service, os.path.join(tmp, service), args.seed)
+                process = ServiceProcess(service, args.workers, args.threads, env, os.path.join(tmp, f'{service}.log'))
+                ready_s = process.start(args.ready_timeout)
+                url = process.url
+                print(f"[{service}] pronto em {ready_s:.1f}s em {url} (artefatos: {artifacts})")
+
+            try:
+                for concurrency in concurrency_levels:
+                    result = run_load(url + SERVICES[service]['endpoint'], payloads, concurrency, args.duration,
+                                      args.warmup, args.timeout, args.seed,
+                                      pid=process.process.pid if process else None)
+                    result.update({"service": service, "endpoint": SERVICES[service]['endpoint'],
+                                   "concurrency": concurrency, "duration_s": args.duration, "artifacts": artifacts,
+                                   "workers": args.workers if process else None,
+                                   "threads": args.threads if process else None,
+                                   "service_env": service_env.get(service, {}), "payload_kinds": kinds,
+                                   "startup_ready_s": round(ready_s, 2) if ready_s is not None else None})
+                    results.append(result)
+                    latency = result["latency_ms"] or {}
+                    print(f"[{service}] c={concurrency:<4} {result['throughput_rps']:>9.1f} req/s  "
+                          f"p50 {latency.get('p50', 0):>8.1f}  p95 {latency.get('p95', 0):>8.1f}  "
+                          f"p99 {latency.get('p99', 0):>8.1f} ms  erros {result['errors']}  "
+                          f"CPU {result['cpu_percent']}%  RSS {result['rss_mb_peak']} MB")
+            finally:
+                if process is not None:
+                    process.stop()
+
+    report = {"meta": meta, "config": vars(args), "results": results}
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True, ensure_ascii=False)
+    print(f"Resultados gravados em {output}")
+    if args.compare:
+        print_diff(_load_results(args.compare), report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+import os
+import re
+import time
+import argparse
+import pandas as pd
+from common.ingestion import list_segments
+
+try:
+    import fcntl # Trava entre processos (Linux/macOS)
+except ImportError: # pragma: no cover - Windows
+    fcntl = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+    from pyarrow import fs as pa_fs
+except ImportError: # pyarrow é opcional: sem ele o treino continua lendo só os CSVs
+    pa = None
+
+# ----------------------------------------------------
+# Armazenamento colunar (Parquet) dos dados de treino
+# ----------------------------------------------------
+# A compactação move os CSVs de ingestão (segmentos rotacionados e, opcionalmente,
+# o CSV principal) para arquivos Parquet tipados e comprimidos, particionados por
+# data de ingestão: <csv>_parquet/ingest_date=AAAA-MM-DD/part-*.parquet.
+# Os scripts de treino leem só as colunas/partições necessárias (leitura com mmap)
+# e somam o que ainda estiver em CSV.
+#
+# Uso: python -m common.columnar --dataset all [--include-base] [--min-age 60]
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Tipos das colunas de cada dataset (nomes dos tipos do pyarrow)
+DATASETS = {
+    "soil": {
+        "csv": os.path.join(ROOT_DIR, 'fnn_service', 'soil_database.csv'),
+        "columns": {"temperatura": "float64", "umidade": "float64", "chuva": "float64",
+                    "ph": "float64", "rendimento_alto": "int8"},
+    },
+    "notes": {
+        "csv": os.path.join(ROOT_DIR, 'rnn_service', 'field_notes_database.csv'),
+        "columns": {"nota": "string", "rotulo": "string"},
+    },
+}
+
+PARTITION_FIELD = 'ingest_date'
+COMPRESSION = os.environ.get('COLUMNAR_COMPRESSION', 'zstd')
+STAMP_PATTERN = re.compile(r'-(\d{4})(\d{2})(\d{2})T\d{6}-')
+
+
+def parquet_dir(csv_path):
+    """Diretório do dataset Parquet de um CSV (ex.: soil_database_parquet/)."""
+    stem, _ = os.path.splitext(csv_path)
+    return f"{stem}_parquet"
+
+
+def staging_dir(csv_path):
+    """CSVs reivindicados pela compactação e ainda não convertidos."""
+    return os.path.join(parquet_dir(csv_path), '_staging')
+
+
+def list_staged(csv_path):
+    directory = staging_dir(csv_path)
+    if not os.path.isdir(directory):
+        return []
+    return [os.path.join(directory, f) for f in sorted(os.listdir(directory)) if f.endswith('.csv')]
+
+
+def list_parts(csv_path):
+    directory = parquet_dir(csv_path)
+    parts = []
+    for dirpath, dirnames, filenames in os.walk(directory):
+        dirnames[:] = [d for d in dirnames if not d.startswith(('_', '.'))]
+        parts += [os.path.join(dirpath, f) for f in filenames if f.endswith('.parquet') and not f.startswith('.')]
+    return sorted(parts)
+
+
+def ingest_date(path):
+    """Data de ingestão de um CSV: carimbo do nome do segmento ou, na falta dele, o mtime."""
+    match = STAMP_PATTERN.search(os.path.basename(path))
+    if match:
+        return '-'.join(match.groups())
+    return time.strftime('%Y-%m-%d', time.localtime(os.path.getmtime(path)))
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("pyarrow não está instalado. Execute: pip install pyarrow")
+
+
+def _arrow_schema(columns):
+    return pa.schema([(name, pa.type_for_alias(kind)) for name, kind in columns.items()])
+
+
+# ----------------------------------------------------
+# Compactação CSV -> Parquet
+# ----------------------------------------------------
+def _claim(path, csv_path):
+    """Move o CSV para _staging/ (rename atômico). O writer de ingestão recria `path` no próximo bloco."""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    if os.path.abspath(path) == os.path.abspath(csv_path):
+        # O CSV principal não tem carimbo no nome: usa o mtime para a partição
+        stem += time.strftime('-%Y%m%dT%H%M%S-base', time.localtime(os.path.getmtime(path)))
+    target = os.path.join(staging_dir(csv_path), f"{stem}-{time.time_ns()}.csv")
+    os.rename(path, target)
+    if fcntl is not None:
+        # Espera um bloco que já estava sendo gravado no arquivo reivindicado
+        with open(target, 'rb') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            fcntl.flock(f, fcntl.LOCK_UN)
+    return target
+
+
+def _read_csv_typed(path, columns):
+    skipped = []
+
+    def skip_invalid(row):
+        skipped.append(row.number)
+        return 'skip'
+
+    table = pa_csv.read_csv(
+        path,
+        parse_options=pa_csv.ParseOptions(newlines_in_values=True, invalid_row_handler=skip_invalid),
+        convert_options=pa_csv.ConvertOptions(column_types=_arrow_schema(columns), include_columns=list(columns)),
+    )
+    return table, len(skipped)
+
+
+def compact_file(staged, csv_path, columns, compression=COMPRESSION):
+    """Converte um CSV reivindicado em um arquivo Parquet da partição da sua data de ingestão.
+
+    O nome do Parquet deriva do arquivo reivindicado, então repetir a compactação
+    após uma queda sobrescreve o mesmo arquivo em vez de duplicar linhas.
+    """
+    table, skipped = _read_csv_typed(staged, columns)
+    partition = os.path.join(parquet_dir(csv_path), f"{PARTITION_FIELD}={ingest_date(staged)}")
+    os.makedirs(partition, exist_ok=True)
+    name = os.path.splitext(os.path.basename(staged))[0]
+    target = os.path.join(partition, f"part-{name}.parquet")
+    tmp_path = os.path.join(partition, f".part-{name}.parquet.tmp")
+    pq.write_table(table, tmp_path, compression=compression)
+    os.replace(tmp_path, target)
+    csv_bytes = os.path.getsize(staged)
+    os.remove(staged)
+    return {"rows": table.num_rows, "skipped": skipped, "csv_bytes": csv_bytes,
+            "parquet_bytes": os.path.getsize(target), "path": target}
+
+
+def compact(name, include_base=False, min_age=60.0, compression=COMPRESSION):
+    """Compacta os CSVs do dataset `name`; retorna o resumo da execução.
+
+    Segmentos modificados há menos de `min_age` segundos ficam para a próxima
+    execução. Arquivos já em _staging/ (execução anterior interrompida) são
+    convertidos primeiro.
+    """
+    _require_pyarrow()
+    spec = DATASETS[name]
+    csv_path = spec["csv"]
+    os.makedirs(staging_dir(csv_path), exist_ok=True)
+
+    candidates = list_segments(csv_path)
+    if include_base and os.path.isfile(csv_path):
+        candidates.append(csv_path)
+    now = time.time()
+    staged = list_staged(csv_path)
+    for path in candidates:
+        try:
+            if now - os.path.getmtime(path) < min_age or os.path.getsize(path) == 0:
+                continue
+            staged.append(_claim(path, csv_path))
+        except FileNotFoundError: # Reivindicado por outra execução
+            continue
+
+    summary = {"dataset": name, "files": 0, "rows": 0, "skipped": 0, "csv_bytes": 0, "parquet_bytes": 0}
+    for path in staged:
+        try:
+            result = compact_file(path, csv_path, spec["columns"], compression)
+        except (pa.ArrowInvalid, OSError) as e:
+            # Fica em _staging/ (e continua visível ao treino) até a próxima execução
+            print(f"Erro ao compactar {path}: {e}")
+            continue
+        summary["files"] += 1
+        for key in ("rows", "skipped", "csv_bytes", "parquet_bytes"):
+            summary[key] += result[key]
+    return summary
+
+
+# ----------------------------------------------------
+# Leitura para o treino
+# ----------------------------------------------------
+def _read_parquet(csv_path, columns, since=None, until=None):
+    dataset = ds.dataset(
+        parquet_dir(csv_path), format='parquet',
+        partitioning=ds.partitioning(pa.schema([(PARTITION_FIELD, pa.string())]), flavor='hive'),
+        filesystem=pa_fs.LocalFileSystem(use_mmap=True),
+    )
+    condition = None
+    if since:
+        condition = ds.field(PARTITION_FIELD) >= since
+    if until:
+        upper = ds.field(PARTITION_FIELD) <= until
+        condition = upper if condition is None else condition & upper
+    return dataset.to_table(columns=columns, filter=condition).to_pandas()
+
+
+def read_dataset(name, columns=None, since=None, until=None):
+    """DataFrame do dataset `name` com só as `columns` pedidas.
+
+    Junta as partições Parquet (filtradas por data de ingestão, AAAA-MM-DD,
+    quando `since`/`until` são informados) com os CSVs ainda não compactados,
+    que entram sempre. Sem pyarrow, lê apenas os CSVs.
+    """
+    spec = DATASETS[name]
+    csv_path = spec["csv"]
+    columns = list(columns or spec["columns"])
+    frames = []
+
+    if list_parts(csv_path):
+        _require_pyarrow()
+        frames.append(_read_parquet(csv_path, columns, since, until))
+
+    dtypes = {c: spec["columns"][c] for c in columns if spec["columns"][c] != 'string'}
+    csv_paths = [p for p in [csv_path] + list_segments(csv_path) + list_staged(csv_path) if os.path.isfile(p)]
+    for path in csv_paths:
+        frames.append(pd.read_csv(path, usecols=columns, dtype=dtypes)[columns])
+
+    if not frames:
+        raise FileNotFoundError(csv_path)
+    return pd.concat(frames, ignore_index=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compacta os CSVs de ingestão em Parquet particionado por data")
+    parser.add_argument('--dataset', choices=('all',) + tuple(DATASETS), default='all')
+    parser.add_argument('--include-base', action='store_true',
+                        help="Também compacta o CSV principal (o writer de ingestão o recria vazio)")
+    parser.add_argument('--min-age', type=float, default=60.0,
+                        help="Ignora segmentos modificados há menos de N segundos")
+    parser.add_argument('--compression', default=COMPRESSION)
+    args = parser.parse_args()
+
+    names = list(DATASETS) if args.dataset == 'all' else [args.dataset]
+    for name in names:
+        started_at = time.perf_counter()
+        s = compact(name, args.include_base, args.min_age, args.compression)
+        ratio = s["csv_bytes"] / s["parquet_bytes"] if s["parquet_bytes"] else 0.0
+        print(f"{name}: {s['files']} arquivo(s), {s['rows']} linhas ({s['skipped']} malformadas ignoradas), "
+              f"{s['csv_bytes']} -> {s['parquet_bytes']} bytes ({ratio:.1f}x) em {time.perf_counter() - started_at:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,22 @@
+import hashlib
+
+# ----------------------------------------------------
+# Hash de arquivos e streams em blocos (sem carregar o conteúdo inteiro)
+# ----------------------------------------------------
+# Usado pela versão dos artefatos (hot_reload), pelos checksums do registro e
+# pela chave do cache de predições da CNN.
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def update_from_stream(digest, stream):
+    """Alimenta `digest` com o restante do stream binário, bloco a bloco; retorna o digest."""
+    for chunk in iter(lambda: stream.read(HASH_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    return digest
+
+
+def file_sha256(path):
+    """SHA-256 (hex) do conteúdo do arquivo."""
+    with open(path, 'rb') as f:
+        return update_from_stream(hashlib.sha256(), f).hexdigest()
@@ -0,0 +1,206 @@
+import os
+import hmac
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
+from flask import jsonify, request
+from common.startup import PENDING, LOADING, WARMING, READY, start_service
+from common.hashing import update_from_stream
+
+# ----------------------------------------------------
+# Recarga a quente dos modelos: carga em background + troca atômica
+# ----------------------------------------------------
+# O serviço guarda modelo, pré-processador e versão num único ModelBundle. Cada
+# requisição lê a referência uma vez no início e usa só ela, então a troca
+# (uma atribuição) nunca mistura versões e as requisições em andamento terminam
+# no modelo antigo, liberado pelo coletor quando a última delas acaba.
+#
+# Gatilhos:
+#   - arquivos de model_artifacts/ alterados (verificados a cada MODEL_RELOAD_POLL_S;
+#     a recarga espera o tamanho/mtime ficarem estáveis entre duas verificações)
+#   - alias do registro (common/registry.py) repontado para outra versão
+#   - POST /model/reload (só o worker que atender; o monitor cobre todos). Exige o
+#     cabeçalho X-Reload-Token igual a MODEL_RELOAD_TOKEN; sem o token configurado
+#     o endpoint responde 403, então nunca fica aberto por padrão.
+# Falha na carga ou no warm-up mantém a versão atual servindo. A carga inicial
+# usa o mesmo lock das recargas: nenhuma recarga corre em paralelo com ela.
+
+RELOAD_POLL_S = float(os.environ.get('MODEL_RELOAD_POLL_S', '5')) # 0 desliga o monitor de arquivos
+RELOAD_TOKEN = os.environ.get('MODEL_RELOAD_TOKEN', '') # Vazio: POST /model/reload desabilitado
+
+
+def artifacts_signature(model_dir, names):
+    """(nome, mtime, tamanho) dos artefatos presentes: muda quando algum é regravado."""
+    signature = []
+    for name in names:
+        try:
+            st = os.stat(os.path.join(model_dir, name))
+        except FileNotFoundError:
+            continue
+        signature.append((name, st.st_mtime_ns, st.st_size))
+    return tuple(signature)
+
+
+def artifacts_version(model_dir, names):
+    """Versão do conjunto de artefatos: 12 primeiros caracteres do SHA-256 dos arquivos presentes."""
+    digest = hashlib.sha256()
+    for name in names:
+        path = os.path.join(model_dir, name)
+        if not os.path.isfile(path):
+            continue
+        digest.update(name.encode('utf-8') + b'\0')
+        with open(path, 'rb') as f:
+            update_from_stream(digest, f)
+    return digest.hexdigest()[:12]
+
+
+class ModelBundle:
+    """Modelo + pré-processador + versão, trocados juntos numa única atribuição."""
+
+    def __init__(self, model, version, preprocessor=None):
+        self.model = model
+        self.preprocessor = preprocessor
+        self.version = version
+        self.loaded_at = time.strftime('%Y-%m-%dT%H:%M:%S')
+
+
+class ModelReloader:
+    """Monitora os artefatos e recarrega o modelo sem derrubar o serviço.
+
+    `build_fn(phase)` carrega os artefatos e devolve um ModelBundle novo (sem
+    tocar no que está servindo); `warmup_fn(n, bundle)` aquece o bundle novo;
+    `swap_fn(bundle)` publica o bundle; `current_fn()` devolve o atual.
+    `version_fn()`/`signature_fn()` substituem o hash/assinatura dos arquivos de
+    model_dir (ex.: ArtifactSource do registro, que observa o alias).
+    Uma recarga bem-sucedida após uma carga inicial que falhou deixa o serviço pronto.
+    """
+
+    def __init__(self, startup, model_dir, artifact_names, build_fn, warmup_fn, batch_sizes,
+                 swap_fn, current_fn, poll_s=RELOAD_POLL_S, version_fn=None, signature_fn=None):
+        self.startup = startup
+        self.service_name = startup.service_name
+        self.model_dir = model_dir
+        self.artifact_names = tuple(artifact_names)
+        self.build_fn = build_fn
+        self.warmup_fn = warmup_fn
+        self.batch_sizes = list(batch_sizes)
+        self.swap_fn = swap_fn
+        self.current_fn = current_fn
+        self.poll_s = poll_s
+        self.version_fn = version_fn or (lambda: artifacts_version(self.model_dir, self.artifact_names))
+        self.signature_fn = signature_fn or (lambda: artifacts_signature(self.model_dir, self.artifact_names))
+        self.reloads = 0
+        self.last_error = None
+        self.last_reload_s = None
+        self._reload_lock = threading.Lock()
+        self._thread = None
+
+    @contextmanager
+    def phase(self, name):
+        """Mede uma fase da recarga (mesma interface de StartupState.phase)."""
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            print(f"[{self.service_name}] reload {name}: {time.perf_counter() - started_at:.3f} s")
+
+    def reload(self, force=False):
+        """Carrega, aquece e publica a versão atual dos artefatos.
+
+        Retorna 'reloaded', 'unchanged', 'busy' (outra recarga em andamento) ou 'failed'.
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            return 'busy'
+        try:
+            current = self.current_fn()
+            if not force and current is not None and self.version_fn() == current.version:
+                return 'unchanged'
+            started_at = time.perf_counter()
+            try:
+                bundle = self.build_fn(self.phase)
+                with self.phase('warmup'):
+                    for n in self.batch_sizes:
+                        self.warmup_fn(n, bundle)
+            except Exception as e:
+                self.last_error = str(e)
+                kept = current.version if current is not None else None
+                print(f"[{self.service_name}] recarga falhou, mantendo a versão {kept}: {e}")
+                return 'failed'
+            self.swap_fn(bundle)
+            if self.startup.state != READY:
+                self.startup.state, self.startup.error = READY, None
+            self.reloads += 1
+            self.last_error = None
+            self.last_reload_s = time.perf_counter() - started_at
+            previous = current.version if current is not None else None
+            print(f"[{self.service_name}] modelo trocado: {previous} -> {bundle.version} "
+                  f"({self.last_reload_s:.3f} s fora do caminho das requisições)")
+            return 'reloaded'
+        finally:
+            self._reload_lock.release()
+
+    def start(self, load_fn=None, warmup_fn=None, batch_sizes=()):
+        """Dispara a carga inicial (se `load_fn`) e inicia o monitor de arquivos (MODEL_RELOAD_POLL_S=0 desliga).
+
+        A carga inicial segura o lock das recargas até o fim do warm-up: um
+        POST /model/reload nesse intervalo recebe 'busy' em vez de carregar em paralelo.
+        """
+        if load_fn is not None:
+            start_service(self.startup, load_fn, warmup_fn, batch_sizes, lock=self._reload_lock)
+        if self.poll_s > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._watch, name=f"{self.service_name}-reload", daemon=True)
+            self._thread.start()
+        return self
+
+    def _watch(self):
+        # Assinatura anterior à carga inicial: mudanças durante ela são vistas depois
+        seen = self.signature_fn()
+        pending = None # Assinatura nova aguardando ficar estável (arquivo ainda sendo gravado)
+        while self.startup.state in (PENDING, LOADING, WARMING):
+            time.sleep(0.2)
+        while True:
+            time.sleep(self.poll_s)
+            signature = self.signature_fn()
+            if signature == seen:
+                pending = None
+                continue
+            if signature != pending:
+                pending = signature
+                continue
+            # Estável por um intervalo inteiro: recarrega (no-op se o conteúdo não mudou).
+            # Após uma falha só tenta de novo quando os arquivos mudarem outra vez.
+            if self.reload() != 'busy':
+                seen, pending = signature, None
+
+    def to_dict(self):
+        current = self.current_fn()
+        return {
+            "service": self.service_name,
+            "model_version": current.version if current is not None else None,
+            "loaded_at": current.loaded_at if current is not None else None,
+            "reloads": self.reloads,
+            "last_reload_s": round(self.last_reload_s, 3) if self.last_reload_s is not None else None,
+            "last_error": self.last_error,
+            "watching": self._thread is not None,
+        }
+
+
+def register_reload_endpoints(app, reloader, token=RELOAD_TOKEN):
+    """Adiciona GET /model (versão ativa) e POST /model/reload (recarga imediata, protegida por `token`)."""
+    @app.route('/model', methods=['GET'])
+    def model_info():
+        return jsonify(reloader.to_dict()), 200
+
+    @app.route('/model/reload', methods=['POST'])
+    def model_reload():
+        if not token:
+            return jsonify({"status": "error",
+                            "message": "Recarga por HTTP desabilitada. Defina MODEL_RELOAD_TOKEN."}), 403
+        if not hmac.compare_digest(request.headers.get('X-Reload-Token', '').encode(), token.encode()):
+            return jsonify({"status": "error", "message": "Token de recarga inválido."}), 401
+        result = reloader.reload(force=request.args.get('force') == '1')
+        status = {'reloaded': 200, 'unchanged': 200, 'busy': 409, 'failed': 500}[result]
+        return jsonify({"status": "error" if status >= 400 else "success", "result": result,
+                        **reloader.to_dict()}), status
+
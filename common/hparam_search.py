@@ -0,0 +1,385 @@
+import os
+import sys
+import csv
+import json
+import time
+import random
+import argparse
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+
+# ----------------------------------------------------
+# Busca de hiperparâmetros em paralelo (grade ou aleatória)
+# ----------------------------------------------------
+# O processo principal prepara os dados uma única vez (FNN: arrays já
+# normalizados; RNN: textos; CNN: shards do cache de imagens, lidos via mmap)
+# e um pool de processos roda os trials. Cada worker limita as threads do
+# TensorFlow (--threads-per-trial, padrão: núcleos / workers) antes de importá-lo,
+# para os trials não disputarem os mesmos núcleos.
+#
+# Cada trial usa a arquitetura do script de treino com os parâmetros sorteados,
+# o mesmo early stopping/log por época (common/training.py) e grava o artefato
+# em <saída>/trial-NNN/. O leaderboard compara métrica de teste, tempo de treino
+# e latência de inferência do artefato (batch 1): o motor NumPy que a API da FNN
+# serve; na CNN/RNN, a chamada direta net(x, training=False) compilada com
+# tf.function. O model.predict (uns 80 ms por chamada) e a LSTM em modo eager
+# (laço em Python, uns 160 ms) mediriam o overhead, não o custo do modelo.
+#
+# Uso:
+#   python -m common.hparam_search --model fnn --param units1=8,16,32 --param learning_rate=0.001,0.003
+#   python -m common.hparam_search --model rnn --strategy random --trials 12 \
+#       --param lstm_units=int:16:64 --param learning_rate=loguniform:0.0003:0.01 --param max_len=30,50
+#   python -m common.hparam_search --spec busca.json --workers 3
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT_DIR, 'hparam_results')
+TEST_SIZE = 0.3 # Mesma separação treino/teste dos scripts de treino
+LATENCY_ITERATIONS = 200
+
+# Parâmetros de cada modelo e seus valores nos scripts de treino (usados quando não variam)
+DEFAULTS = {
+    'fnn': {'units1': 16, 'units2': 8, 'batch_size': 4, 'epochs': 50, 'learning_rate': 0.001},
+    'rnn': {'vocab_size': 1000, 'max_len': 50, 'embedding_dim': 16, 'lstm_units': 32, 'batch_size': 4,
+            'epochs': 20, 'learning_rate': 0.001},
+    'cnn': {'filters1': 32, 'filters2': 64, 'dense_units': 64, 'batch_size': 4, 'epochs': 20,
+            'learning_rate': 0.001},
+}
+SORT_METRICS = {'test_accuracy': True, 'test_loss': False, 'train_s': False, 'latency_p50_ms': False}
+
+
+# ----------------------------------------------------
+# Espaço de busca
+# ----------------------------------------------------
+def _parse_value(raw):
+    for cast in (int, float):
+        try:
+            return cast(raw)
+        except ValueError:
+            pass
+    return raw
+
+
+def parse_param(text):
+    """'nome=a,b,c' (lista) ou 'nome=int:8:64' / 'uniform:0:1' / 'loguniform:1e-4:1e-2' (faixa, busca aleatória)."""
+    name, _, values = text.partition('=')
+    if not values:
+        raise ValueError(f"Parâmetro inválido: {text!r} (use nome=valores)")
+    kind = values.split(':', 1)[0]
+    if kind in ('int', 'uniform', 'loguniform'):
+        _, low, high = values.split(':')
+        return name.strip(), {kind: [float(low), float(high)]}
+    return name.strip(), [_parse_value(v) for v in values.split(',')]
+
+
+def _sample(spec, rng):
+    if isinstance(spec, list):
+        return rng.choice(spec)
+    (kind, (low, high)), = spec.items()
+    if kind == 'int':
+        return rng.randint(int(low), int(high))
+    if kind == 'loguniform':
+        return float(np.exp(rng.uniform(np.log(low), np.log(high))))
+    return rng.uniform(low, high)
+
+
+def expand_space(model, space, strategy, trials, seed=42):
+    """Lista de dicionários de parâmetros (completos, com os padrões do script)."""
+    unknown = [name for name in space if name not in DEFAULTS[model]]
+    if unknown:
+        raise ValueError(f"Parâmetros desconhecidos para {model}: {unknown} (disponíveis: {list(DEFAULTS[model])})")
+    names = list(space)
+    if strategy == 'grid':
+        ranges = [n for n in names if not isinstance(space[n], list)]
+        if ranges:
+            raise ValueError(f"Faixas ({ranges}) só valem na busca aleatória (--strategy random)")
+        combos = [dict(zip(names, values)) for values in itertools.product(*(space[n] for n in names))]
+        if trials:
+            combos = combos[:trials]
+    else:
+        rng = random.Random(seed)
+        combos = [{n: _sample(space[n], rng) for n in names} for _ in range(trials or 10)]
+    return [dict(DEFAULTS[model], **combo) for combo in combos]
+
+
+# ----------------------------------------------------
+# Dados compartilhados (preparados uma vez no processo principal)
+# ----------------------------------------------------
+def prepare_data(model, data_dir):
+    """Grava em data_dir os dados que todos os trials leem (arrays .npy abertos com mmap)."""
+    os.makedirs(data_dir, exist_ok=True)
+    from sklearn.model_selection import train_test_split
+    if ROOT_DIR not in sys.path:
+        sys.path.insert(0, ROOT_DIR)
+
+    if model == 'fnn':
+        import joblib
+        from sklearn.preprocessing import MinMaxScaler
+        from common.columnar import read_dataset
+        features = ['temperatura', 'umidade', 'chuva', 'ph']
+        df = read_dataset('soil', features + ['rendimento_alto'])
+        scaler = MinMaxScaler()
+        X = scaler.fit_transform(df[features].values)
+        arrays = dict(zip(('X_train', 'X_test', 'y_train', 'y_test'),
+                          train_test_split(X, df['rendimento_alto'].values, test_size=TEST_SIZE, random_state=42)))
+        joblib.dump(scaler, os.path.join(data_dir, 'scaler.pkl'))
+
+    elif model == 'rnn':
+        from common.columnar import read_dataset
+        df = read_dataset('notes', ['nota', 'rotulo'])
+        texts = df['nota'].astype(str).to_numpy(dtype=str)
+        labels = df['rotulo'].map({'rotina': 0, 'urgente': 1}).values
+        arrays = dict(zip(('X_train', 'X_test', 'y_train', 'y_test'),
+                          train_test_split(texts, labels, test_size=TEST_SIZE, random_state=42)))
+
+    else:
+        cnn_dir = os.path.join(ROOT_DIR, 'cnn_service')
+        if cnn_dir not in sys.path:
+            sys.path.insert(0, cnn_dir)
+        from leaf_cache import LeafShardCache
+        from leaf_store import training_items
+        uploads = os.path.join(cnn_dir, 'uploads')
+        cache_dir = os.environ.get('CNN_DATASET_CACHE_DIR', os.path.join(cnn_dir, 'dataset_cache'))
+        verify = os.environ.get('CNN_DATASET_CACHE_VERIFY', 'mtime')
+        dataset = LeafShardCache(cache_dir, verify=verify).build(uploads, items=training_items(uploads))
+        if len(dataset) < 2:
+            raise ValueError(f"A busca da CNN requer ao menos 2 imagens rotuladas em {uploads} "
+                             f"(uma de treino e uma de teste); há {len(dataset)}.")
+        indices = np.random.default_rng(42).permutation(len(dataset))
+        n_test = max(int(len(indices) * TEST_SIZE), 1) # Sem imagem de teste o evaluate rodaria num conjunto vazio
+        arrays = {'train_indices': np.sort(indices[n_test:]), 'test_indices': np.sort(indices[:n_test])}
+        with open(os.path.join(data_dir, 'cache_dir.txt'), 'w') as f:
+            f.write(cache_dir)
+
+    for name, array in arrays.items():
+        np.save(os.path.join(data_dir, f'{name}.npy'), array)
+    sizes = {name: int(len(array)) for name, array in arrays.items()}
+    print(f"Dados de {model} preparados em {data_dir}: {sizes}")
+    return sizes
+
+
+def _load(data_dir, name):
+    return np.load(os.path.join(data_dir, f'{name}.npy'), mmap_mode='r')
+
+
+# ----------------------------------------------------
+# Trials (rodam nos processos do pool)
+# ----------------------------------------------------
+def _init_worker(threads):
+    """Limita as threads do TensorFlow antes de importá-lo (vale para todos os trials deste processo)."""
+    os.environ['TF_NUM_INTRAOP_THREADS'] = str(threads)
+    os.environ['TF_NUM_INTEROP_THREADS'] = '1'
+    os.environ['OMP_NUM_THREADS'] = str(threads)
+    os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+    for path in (ROOT_DIR, os.path.join(ROOT_DIR, 'fnn_service'), os.path.join(ROOT_DIR, 'cnn_service')):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+
+def _build_model(model, params):
+    from tensorflow.keras.models import Sequential
+    from tensorflow.keras.layers import Input, Dense, Conv2D, MaxPooling2D, Flatten, Embedding, LSTM
+    if model == 'fnn':
+        layers = [Input((4,)), Dense(params['units1'], activation='relu'),
+                  Dense(params['units2'], activation='relu'), Dense(1, activation='sigmoid')]
+    elif model == 'rnn':
+        layers = [Input((params['max_len'],)), Embedding(params['vocab_size'], params['embedding_dim'], mask_zero=True),
+                  LSTM(params['lstm_units']), Dense(1, activation='sigmoid')]
+    else:
+        layers = [Input((64, 64, 3)), Conv2D(params['filters1'], (3, 3), activation='relu'), MaxPooling2D((2, 2)),
+                  Conv2D(params['filters2'], (3, 3), activation='relu'), MaxPooling2D((2, 2)), Flatten(),
+                  Dense(params['dense_units'], activation='relu'), Dense(1, activation='sigmoid')]
+    return Sequential(layers)
+
+
+def _latency_ms(predict, sample):
+    for _ in range(10):
+        predict(sample)
+    latencies = []
+    for _ in range(LATENCY_ITERATIONS):
+        started_at = time.perf_counter()
+        predict(sample)
+        latencies.append(time.perf_counter() - started_at)
+    return float(np.percentile(latencies, 50)) * 1000.0
+
+
+def run_trial(model, trial_id, params, data_dir, trial_dir):
+    """Treina um trial e mede o artefato; retorna o resultado (também gravado em result.json)."""
+    from tensorflow import keras
+    from tensorflow.keras.optimizers import Adam
+    from common.training import TrainingMonitor, split_validation
+    os.makedirs(trial_dir, exist_ok=True)
+    keras.backend.clear_session()
+    keras.utils.set_random_seed(42)
+
+    net = _build_model(model, params)
+    net.compile(optimizer=Adam(learning_rate=params['learning_rate']), loss='binary_crossentropy',
+                metrics=['accuracy'])
+    fit_kwargs = {}
+    if model == 'cnn':
+        from leaf_cache import LeafShardCache, make_tf_dataset
+        with open(os.path.join(data_dir, 'cache_dir.txt')) as f:
+            dataset = LeafShardCache(f.read().strip()).load() # mmap: os trials compartilham o page cache
+        train_indices, test_indices = np.asarray(_load(data_dir, 'train_indices')), np.asarray(_load(data_dir, 'test_indices'))
+        fit_positions, val_positions = split_validation(dataset.labels[train_indices])
+        fit_data = (make_tf_dataset(dataset, params['batch_size'], indices=train_indices[fit_positions]),)
+        if len(val_positions):
+            fit_kwargs['validation_data'] = make_tf_dataset(dataset, params['batch_size'], shuffle=False,
+                                                            indices=train_indices[val_positions])
+        test_data = (make_tf_dataset(dataset, params['batch_size'], shuffle=False, indices=test_indices),)
+        sample = np.zeros((1, 64, 64, 3), dtype=np.float32)
+    else:
+        X_train, X_test = _load(data_dir, 'X_train'), _load(data_dir, 'X_test')
+        y_train, y_test = np.asarray(_load(data_dir, 'y_train')), np.asarray(_load(data_dir, 'y_test'))
+        if model == 'rnn':
+            from tensorflow.keras.preprocessing.text import Tokenizer
+            from tensorflow.keras.preprocessing.sequence import pad_sequences
+            tokenizer = Tokenizer(num_words=params['vocab_size'], oov_token="<OOV>")
+            tokenizer.fit_on_texts(list(X_train))
+
+            def encode(texts):
+                return pad_sequences(tokenizer.texts_to_sequences(list(texts)), maxlen=params['max_len'],
+                                     padding='post', truncating='post')
+            X_train, X_test = encode(X_train), encode(X_test)
+        else:
+            X_train, X_test = np.asarray(X_train), np.asarray(X_test)
+        fit_positions, val_positions = split_validation(y_train)
+        fit_data = (X_train[fit_positions], y_train[fit_positions])
+        fit_kwargs['batch_size'] = params['batch_size']
+        if len(val_positions):
+            fit_kwargs['validation_data'] = (X_train[val_positions], y_train[val_positions])
+        test_data = (X_test, y_test)
+        sample = X_test[:1]
+
+    monitor = TrainingMonitor(model, fingerprint=f"trial-{trial_id}", samples=len(fit_positions),
+                              epochs=params['epochs'], validation_samples=len(val_positions),
+                              checkpoint_dir=os.path.join(trial_dir, 'checkpoints'),
+                              log_path=os.path.join(trial_dir, 'training_log.jsonl'))
+    started_at = time.perf_counter()
+    net.fit(*fit_data, epochs=params['epochs'], callbacks=[monitor], verbose=0, **fit_kwargs)
+    train_s = time.perf_counter() - started_at
+    monitor.finish()
+    test_loss, test_accuracy = net.evaluate(*test_data, verbose=0)
+
+    artifact = os.path.join(trial_dir, f'{model}_model.h5')
+    net.save(artifact)
+    if model == 'fnn':
+        # Latência do que a API serve: o motor NumPy com o scaler incorporado
+        import joblib
+        from export_fnn import build_engine
+        engine = build_engine(net, joblib.load(os.path.join(data_dir, 'scaler.pkl')))
+        latency = _latency_ms(engine.predict_proba, np.array([[25.0, 70.0, 120.0, 6.5]]))
+    else:
+        import tensorflow as tf
+        forward = tf.function(lambda x: net(x, training=False), autograph=False) # Traçado na primeira chamada
+        latency = _latency_ms(lambda x: forward(x).numpy(), tf.constant(np.asarray(sample)))
+
+    result = {"trial": trial_id, "params": params, "test_accuracy": round(float(test_accuracy), 4),
+              "test_loss": round(float(test_loss), 4), "train_s": round(train_s, 2),
+              "epochs_run": monitor.epochs_run, "best_epoch": monitor.best_epoch,
+              "latency_p50_ms": round(latency, 3), "params_count": int(net.count_params()),
+              "artifact": artifact, "artifact_kb": round(os.path.getsize(artifact) / 1024.0, 1), "pid": os.getpid()}
+    with open(os.path.join(trial_dir, 'result.json'), 'w') as f:
+        json.dump(result, f, indent=2)
+    return result
+
+
+# ----------------------------------------------------
+# Leaderboard
+# ----------------------------------------------------
+def write_leaderboard(results, output_dir, metric):
+    descending = SORT_METRICS[metric]
+    # Empates (comuns na acurácia de testes pequenos) vão para a menor perda e depois o treino mais rápido
+    ranked = sorted(results, key=lambda r: (-r[metric] if descending else r[metric], r['test_loss'], r['train_s']))
+    with open(os.path.join(output_dir, 'leaderboard.json'), 'w') as f:
+        json.dump(ranked, f, indent=2)
+    param_names = list(ranked[0]['params']) if ranked else []
+    columns = ['rank', 'trial', 'test_accuracy', 'test_loss', 'train_s', 'epochs_run', 'latency_p50_ms',
+               'params_count', 'artifact_kb']
+    with open(os.path.join(output_dir, 'leaderboard.csv'), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns + param_names)
+        for rank, r in enumerate(ranked, 1):
+            writer.writerow([rank] + [r[c] for c in columns[1:]] + [r['params'][p] for p in param_names])
+
+    # Na tabela, só os parâmetros que variaram entre os trials
+    varied_names = [p for p in param_names if len({json.dumps(r['params'][p]) for r in ranked}) > 1]
+    print(f"\n{'#':>3} {'trial':>5} {'acurácia':>9} {'perda':>7} {'treino s':>9} {'épocas':>6} {'lat. ms':>8}  parâmetros")
+    for rank, r in enumerate(ranked, 1):
+        varied = ' '.join(f"{k}={v:.4g}" if isinstance(v, float) else f"{k}={v}"
+                          for k, v in r['params'].items() if k in varied_names)
+        print(f"{rank:>3} {r['trial']:>5} {r['test_accuracy']:>9.4f} {r['test_loss']:>7.4f} {r['train_s']:>9.2f} "
+              f"{r['epochs_run']:>6} {r['latency_p50_ms']:>8.3f}  {varied}")
+    return ranked
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Busca de hiperparâmetros em paralelo para fnn, rnn ou cnn")
+    parser.add_argument('--model', choices=tuple(DEFAULTS))
+    parser.add_argument('--spec', default=None, help="JSON com model, strategy, trials e space")
+    parser.add_argument('--param', action='append', default=[], metavar='NOME=VALORES',
+                        help="Valores (a,b,c) ou faixa (int:8:64, uniform:0:1, loguniform:1e-4:1e-2)")
+    parser.add_argument('--strategy', choices=('grid', 'random'), default=None)
+    parser.add_argument('--trials', type=int, default=None, help="Trials da busca aleatória (ou limite da grade)")
+    parser.add_argument('--workers', type=int, default=2, help="Trials simultâneos")
+    parser.add_argument('--threads-per-trial', type=int, default=None, help="Padrão: núcleos / workers")
+    parser.add_argument('--metric', choices=tuple(SORT_METRICS), default='test_accuracy')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default=None, help="Padrão: hparam_results/<modelo>-<data>/")
+    args = parser.parse_args(argv)
+
+    spec = {}
+    if args.spec:
+        with open(args.spec, encoding='utf-8') as f:
+            spec = json.load(f)
+    model = args.model or spec.get('model')
+    if model not in DEFAULTS:
+        parser.error("Informe --model (fnn, rnn ou cnn) ou 'model' no --spec")
+    space = dict(spec.get('space', {}))
+    space.update(parse_param(p) for p in args.param)
+    strategy = args.strategy or spec.get('strategy', 'grid')
+    trials = args.trials or spec.get('trials')
+    try:
+        configs = expand_space(model, space, strategy, trials, args.seed)
+    except ValueError as e:
+        parser.error(str(e))
+
+    output_dir = args.output or os.path.join(RESULTS_DIR, f"{model}-{time.strftime('%Y%m%d-%H%M%S')}")
+    data_dir = os.path.join(output_dir, 'data')
+    prepare_data(model, data_dir)
+    workers = max(1, min(args.workers, len(configs)))
+    threads = args.threads_per_trial or max(1, (os.cpu_count() or 1) // workers)
+    print(f"{len(configs)} trials ({strategy}) em {workers} processos x {threads} thread(s) do TensorFlow")
+
+    results = []
+    started_at = time.perf_counter()
+    # spawn: o TensorFlow não é seguro após fork, e cada worker aplica os limites de threads antes de importá-lo
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_worker, initargs=(threads,)) as executor:
+        futures = {executor.submit(run_trial, model, i, params, data_dir, os.path.join(output_dir, f'trial-{i:03d}')): i
+                   for i, params in enumerate(configs)}
+        for future in as_completed(futures):
+            trial_id = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"[trial {trial_id}] falhou: {e}")
+                continue
+            results.append(result)
+            print(f"[trial {trial_id}] acurácia {result['test_accuracy']:.4f} em {result['train_s']:.1f}s "
+                  f"({result['epochs_run']} épocas, {result['latency_p50_ms']:.3f} ms/predição)")
+
+    with open(os.path.join(output_dir, 'search.json'), 'w') as f:
+        json.dump({"model": model, "strategy": strategy, "space": space, "workers": workers,
+                   "threads_per_trial": threads, "wall_s": round(time.perf_counter() - started_at, 2)}, f, indent=2)
+    if results:
+        write_leaderboard(results, output_dir, args.metric)
+    print(f"\nResultados em {output_dir} (busca em {time.perf_counter() - started_at:.1f}s)")
+
+
+if __name__ == '__main__':
+    main()
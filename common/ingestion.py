@@ -0,0 +1,325 @@
+import io
+import os
+import csv
+import time
+import atexit
+import threading
+from collections import deque
+
+try:
+    import fcntl # Trava entre processos (Linux/macOS)
+except ImportError: # pragma: no cover - Windows: apenas a trava entre threads do próprio processo
+    fcntl = None
+
+# ----------------------------------------------------
+# Escrita de ingestão (/log) em CSV: direta ou com group commit
+# ----------------------------------------------------
+# DirectCsvWriter  - uma escrita por requisição (comportamento anterior), agora com trava.
+# BufferedCsvWriter - acumula linhas em memória e grava blocos inteiros numa única
+#                     chamada write() sob trava exclusiva do arquivo, então vários
+#                     workers nunca intercalam linhas parciais nem duplicam o cabeçalho.
+
+FSYNC_POLICIES = ('always', 'interval', 'never')
+DURABILITY_MODES = ('commit', 'buffered')
+
+
+def format_rows(rows, fieldnames):
+    """Serializa dicts em linhas CSV (campos extras são ignorados)."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fieldnames, extrasaction='ignore', lineterminator='\n')
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+def segment_dir(path):
+    """Diretório dos segmentos rotacionados de um CSV (ex.: soil_database_segments/)."""
+    stem, _ = os.path.splitext(path)
+    return f"{stem}_segments"
+
+
+def list_segments(path):
+    """Segmentos rotacionados de `path`, em ordem de criação."""
+    directory = segment_dir(path)
+    if not os.path.isdir(directory):
+        return []
+    return [os.path.join(directory, f) for f in sorted(os.listdir(directory)) if f.endswith('.csv')]
+
+
+def _write_all(fd, data):
+    view = memoryview(data)
+    while view:
+        written = os.write(fd, view)
+        view = view[written:]
+
+
+def _open_locked(path):
+    """Abre `path` para append sob trava exclusiva.
+
+    Se o arquivo foi renomeado entre o open e a trava (a compactação o reivindicou),
+    reabre: o bloco vai para o novo arquivo em `path`, nunca para o já reivindicado.
+    """
+    while True:
+        fd = os.open(path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        if fcntl is None:
+            return fd
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            current = os.stat(path)
+        except FileNotFoundError:
+            current = None
+        opened = os.fstat(fd)
+        if current is not None and (current.st_ino, current.st_dev) == (opened.st_ino, opened.st_dev):
+            return fd
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+def append_block(path, data, header, fsync=False):
+    """Anexa `data` (bytes) a `path` sob trava exclusiva; escreve o cabeçalho se o arquivo estiver vazio.
+
+    Se a última linha do arquivo ficou incompleta (queda no meio de uma escrita),
+    uma quebra de linha é inserida antes para não corromper o novo bloco.
+    Retorna o tamanho final do arquivo.
+    """
+    fd = _open_locked(path)
+    try:
+        size = os.fstat(fd).st_size
+        prefix = b''
+        if size == 0:
+            prefix = header
+        else:
+            os.lseek(fd, size - 1, os.SEEK_SET)
+            if os.read(fd, 1) != b'\n':
+                prefix = b'\n'
+        _write_all(fd, prefix + data)
+        if fsync:
+            os.fsync(fd)
+        return size + len(prefix) + len(data)
+    finally:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+class DirectCsvWriter:
+    """Uma escrita (open + append + close) por linha, como o append_to_csv original."""
+
+    def __init__(self, path, fieldnames, encoding='utf-8', fsync='never'):
+        self.path = path
+        self.fieldnames = list(fieldnames)
+        self.encoding = encoding
+        self.fsync = fsync == 'always'
+        self._header = format_rows([dict(zip(self.fieldnames, self.fieldnames))], self.fieldnames).encode(encoding)
+        self.ingested = self.flushed = self.dropped = 0
+        self._lock = threading.Lock()
+
+    def append(self, row):
+        data = format_rows([row], self.fieldnames).encode(self.encoding)
+        try:
+            append_block(self.path, data, self._header, self.fsync)
+        except OSError as e:
+            print(f"Erro ao salvar CSV: {e}")
+            with self._lock:
+                self.dropped += 1
+            return False
+        with self._lock:
+            self.ingested += 1
+            self.flushed += 1
+        return True
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def stats(self):
+        with self._lock:
+            return {"writer": "direct", "path": self.path, "ingested": self.ingested,
+                    "flushed": self.flushed, "dropped": self.dropped, "buffered": 0}
+
+
+class BufferedCsvWriter:
+    """Group commit: uma thread grava o buffer acumulado em blocos.
+
+    durability='commit'  - append() só retorna após o bloco com a linha estar no disco;
+                           requisições concorrentes compartilham a mesma escrita/fsync.
+    durability='buffered' - append() retorna imediatamente; o bloco é gravado ao atingir
+                           `flush_rows` linhas ou a cada `flush_interval` segundos.
+    max_segment_bytes > 0 - cada processo grava em segmentos próprios em <csv>_segments/,
+                           rotacionados ao atingir o tamanho máximo.
+    """
+
+    def __init__(self, path, fieldnames, flush_rows=256, flush_interval=0.2, fsync='interval',
+                 fsync_interval=1.0, durability='commit', max_buffer_rows=100000,
+                 max_segment_bytes=0, encoding='utf-8'):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync deve ser um de {FSYNC_POLICIES}")
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"durability deve ser um de {DURABILITY_MODES}")
+        self.path = path
+        self.fieldnames = list(fieldnames)
+        self.flush_rows = max(1, int(flush_rows))
+        self.flush_interval = max(0.001, float(flush_interval))
+        self.fsync = fsync
+        self.fsync_interval = float(fsync_interval)
+        self.durability = durability
+        self.max_buffer_rows = int(max_buffer_rows)
+        self.max_segment_bytes = int(max_segment_bytes)
+        self.encoding = encoding
+        self._header = format_rows([dict(zip(self.fieldnames, self.fieldnames))], self.fieldnames).encode(encoding)
+
+        self._cond = threading.Condition()
+        self._buffer = []
+        self._batch_id = 0 # Bloco sendo preenchido
+        self._committed = -1 # Último bloco gravado
+        self._failed = deque(maxlen=1024) # Blocos cuja escrita falhou
+        self._closed = False
+        self._last_fsync = 0.0
+        self._segment_seq = 0
+        self._segment_path = None
+
+        self.ingested = self.flushed = self.dropped = 0
+        self.flushes = self.fsyncs = 0
+
+        self._thread = threading.Thread(target=self._run, name="ingestion-flusher", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # ------------------------------------------------
+    # API pública
+    # ------------------------------------------------
+    def append(self, row):
+        """Enfileira uma linha; retorna False se ela foi descartada (buffer cheio ou falha de escrita)."""
+        line = format_rows([row], self.fieldnames)
+        with self._cond:
+            if self._closed or len(self._buffer) >= self.max_buffer_rows:
+                self.dropped += 1
+                return False
+            self._buffer.append(line)
+            self.ingested += 1
+            batch_id = self._batch_id
+            if self.durability == 'commit' or len(self._buffer) >= self.flush_rows:
+                self._cond.notify_all()
+            if self.durability != 'commit':
+                return True
+            while self._committed < batch_id:
+                self._cond.wait()
+            return batch_id not in self._failed
+
+    def flush(self, timeout=None):
+        """Bloqueia até que tudo o que já foi enfileirado esteja gravado."""
+        with self._cond:
+            target = self._batch_id if self._buffer else self._batch_id - 1
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: self._committed >= target, timeout)
+
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "writer": "buffered",
+                "path": self._segment_path or self.path,
+                "durability": self.durability,
+                "fsync": self.fsync,
+                "ingested": self.ingested,
+                "flushed": self.flushed,
+                "dropped": self.dropped,
+                "buffered": len(self._buffer),
+                "flushes": self.flushes,
+                "fsyncs": self.fsyncs,
+                "avg_rows_per_flush": self.flushed / self.flushes if self.flushes else 0.0,
+            }
+
+    # ------------------------------------------------
+    # Thread de gravação
+    # ------------------------------------------------
+    def _ready_to_flush(self):
+        return self.durability == 'commit' or len(self._buffer) >= self.flush_rows
+
+    def _run(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_interval
+                while not self._closed and not (self._buffer and self._ready_to_flush()):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        if self._buffer:
+                            break
+                        deadline = time.monotonic() + self.flush_interval
+                        remaining = self.flush_interval
+                    self._cond.wait(remaining)
+                if not self._buffer:
+                    if self._closed:
+                        return
+                    continue
+                lines, self._buffer = self._buffer, []
+                batch_id = self._batch_id
+                self._batch_id += 1
+
+            # Escrita fora da trava: novas linhas já vão para o próximo bloco
+            ok = self._write(lines)
+
+            with self._cond:
+                self.flushes += 1
+                if ok:
+                    self.flushed += len(lines)
+                else:
+                    self.dropped += len(lines)
+                    self._failed.append(batch_id)
+                self._committed = batch_id
+                self._cond.notify_all()
+
+    def _target_path(self):
+        if self.max_segment_bytes <= 0:
+            return self.path
+        if self._segment_path is None:
+            directory = segment_dir(self.path)
+            os.makedirs(directory, exist_ok=True)
+            stem = os.path.splitext(os.path.basename(self.path))[0]
+            stamp = time.strftime('%Y%m%dT%H%M%S')
+            self._segment_path = os.path.join(directory, f"{stem}-{stamp}-{os.getpid()}-{self._segment_seq:04d}.csv")
+        return self._segment_path
+
+    def _write(self, lines):
+        data = ''.join(lines).encode(self.encoding)
+        now = time.monotonic()
+        do_fsync = self.fsync == 'always' or (self.fsync == 'interval' and now - self._last_fsync >= self.fsync_interval)
+        try:
+            size = append_block(self._target_path(), data, self._header, do_fsync)
+        except OSError as e:
+            print(f"Erro ao salvar CSV ({len(lines)} linhas descartadas): {e}")
+            return False
+        if do_fsync:
+            self._last_fsync = now
+            self.fsyncs += 1
+        if self.max_segment_bytes > 0 and size >= self.max_segment_bytes:
+            # Rotação: o próximo bloco abre um novo segmento
+            self._segment_seq += 1
+            self._segment_path = None
+        return True
+
+
+def create_writer(path, fieldnames):
+    """Cria o writer de ingestão configurado pelas variáveis INGEST_*."""
+    kind = os.environ.get('INGEST_WRITER', 'buffered')
+    fsync = os.environ.get('INGEST_FSYNC', 'interval')
+    if kind == 'direct':
+        return DirectCsvWriter(path, fieldnames, fsync=fsync)
+    return BufferedCsvWriter(
+        path, fieldnames,
+        flush_rows=int(os.environ.get('INGEST_FLUSH_ROWS', '256')),
+        flush_interval=float(os.environ.get('INGEST_FLUSH_INTERVAL_MS', '200')) / 1000.0,
+        fsync=fsync,
+        fsync_interval=float(os.environ.get('INGEST_FSYNC_INTERVAL_MS', '1000')) / 1000.0,
+        durability=os.environ.get('INGEST_DURABILITY', 'commit'),
+        max_buffer_rows=int(os.environ.get('INGEST_MAX_BUFFER_ROWS', '100000')),
+        max_segment_bytes=int(os.environ.get('INGEST_SEGMENT_MAX_BYTES', '0')),
+    )
@@ -0,0 +1,273 @@
+import os
+import glob
+import json
+import time
+import bisect
+import functools
+import threading
+from contextlib import nullcontext
+from flask import Response, jsonify
+
+# ----------------------------------------------------
+# Métricas no formato do Prometheus: contagem, erros e latência por etapa
+# ----------------------------------------------------
+# Uso nos serviços:
+#   metrics = ServiceMetrics('cnn')
+#   register_metrics_endpoint(app)                  # GET /metrics
+#   @app.route('/predict/leaf_image', methods=['POST'])
+#   @metrics.instrument('/predict/leaf_image')       # contagem por status + latência total
+#   def predict_leaf_image():
+#       with metrics.stage('image_decode'): ...      # latência de cada etapa
+#
+# Com METRICS_ENABLED=0 o decorador devolve a view original e `stage` devolve
+# um contexto nulo compartilhado: nenhuma medição, nenhum lock.
+#
+# No Gunicorn cada worker tem os seus contadores. Com METRICS_DIR, cada worker
+# grava um retrato em <METRICS_DIR>/<serviço>-<pid>.json (a cada METRICS_FLUSH_S)
+# e o /metrics soma todos; os arquivos de workers encerrados continuam somando,
+# para os contadores nunca diminuírem. O `serve` apaga ao subir só os retratos
+# do próprio serviço, então vários serviços podem dividir o mesmo METRICS_DIR.
+
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+METRICS_DIR = os.environ.get('METRICS_DIR', '')
+FLUSH_INTERVAL_S = float(os.environ.get('METRICS_FLUSH_S', '1'))
+
+# Limites dos buckets de latência (s); o último bucket é +Inf
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+FAMILIES = (
+    ('agro_requests_total', 'counter', 'Requisições por endpoint e status HTTP.'),
+    ('agro_request_errors_total', 'counter', 'Requisições com status HTTP >= 400 (exceções contam como 500).'),
+    ('agro_request_duration_seconds', 'histogram', 'Latência total da requisição no servidor.'),
+    ('agro_stage_duration_seconds', 'histogram', 'Latência de cada etapa da requisição (parse, decode, predict...).'),
+)
+
+_NULL_STAGE = nullcontext()
+_registries = [] # Todos os registros do processo (o gateway em modo inprocess hospeda vários)
+
+
+def _status_code(response):
+    """Status HTTP do retorno de uma view Flask (Response ou tupla (corpo, status))."""
+    if isinstance(response, tuple):
+        return response[1] if len(response) > 1 and isinstance(response[1], int) else 200
+    return getattr(response, 'status_code', 200)
+
+
+class _Stage:
+    """Mede uma etapa; classe simples em vez de @contextmanager para pesar menos por chamada."""
+    __slots__ = ('metrics', 'name', 'endpoint', 'started_at')
+
+    def __init__(self, metrics, name, endpoint=None):
+        self.metrics = metrics
+        self.name = name
+        self.endpoint = endpoint
+
+    def __enter__(self):
+        self.started_at = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.started_at
+        endpoint = self.endpoint or getattr(self.metrics._local, 'endpoint', None) or ''
+        self.metrics._observe(('agro_stage_duration_seconds', (('endpoint', endpoint), ('stage', self.name))), elapsed)
+
+
+class ServiceMetrics:
+    """Contadores e histogramas de um serviço (seguro entre threads)."""
+
+    def __init__(self, service, enabled=None, metrics_dir=None):
+        self.service = service
+        self.enabled = METRICS_ENABLED if enabled is None else enabled
+        self.metrics_dir = METRICS_DIR if metrics_dir is None else metrics_dir
+        self._counters = {} # (família, labels) -> valor
+        self._histograms = {} # (família, labels) -> [contagem por bucket..., +Inf, soma]
+        self._lock = threading.Lock()
+        self._local = threading.local() # Endpoint da requisição em andamento, para `stage`
+        self._dirty = False
+        self._flusher = None if self.metrics_dir else False # False: sem agregação entre workers
+        _registries.append(self)
+
+    # ------------------------------------------------
+    # Instrumentação
+    # ------------------------------------------------
+    def instrument(self, endpoint):
+        """Decorador da view: conta a requisição pelo status e mede a latência total."""
+        def decorator(view):
+            if not self.enabled:
+                return view
+
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                self._local.endpoint = endpoint
+                started_at = time.perf_counter()
+                status = 500 # Exceção não tratada: o Flask responde 500
+                try:
+                    response = view(*args, **kwargs)
+                    status = _status_code(response)
+                    return response
+                finally:
+                    self._local.endpoint = None
+                    self.observe_request(endpoint, status, time.perf_counter() - started_at)
+            return wrapper
+        return decorator
+
+    def stage(self, name, endpoint=None):
+        """Contexto que mede uma etapa da requisição em andamento.
+
+        `endpoint` é necessário nas respostas em streaming: o gerador roda depois
+        que a view retornou, fora do contexto do `instrument`.
+        """
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name, endpoint)
+
+    def observe_request(self, endpoint, status, seconds):
+        labels = (('endpoint', endpoint), ('status', str(status)))
+        self._inc(('agro_requests_total', labels))
+        if status >= 400:
+            self._inc(('agro_request_errors_total', labels))
+        self._observe(('agro_request_duration_seconds', (('endpoint', endpoint),)), seconds)
+
+    def _inc(self, key, amount=1):
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+            self._dirty = True
+        self._ensure_flusher()
+
+    def _observe(self, key, seconds):
+        index = bisect.bisect_left(LATENCY_BUCKETS, seconds) # Bucket "le": limite inclusivo
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+            histogram[index] += 1
+            histogram[-1] += seconds
+            self._dirty = True
+        self._ensure_flusher()
+
+    # ------------------------------------------------
+    # Agregação entre workers (METRICS_DIR)
+    # ------------------------------------------------
+    def _snapshot_path(self, pid=None):
+        return os.path.join(self.metrics_dir, f"{self.service}-{pid or os.getpid()}.json")
+
+    def _ensure_flusher(self):
+        if self._flusher is None:
+            with self._lock:
+                if self._flusher is None:
+                    self._flusher = threading.Thread(target=self._flush_loop, name=f"{self.service}-metrics",
+                                                     daemon=True)
+                    self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL_S)
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"AVISO: falha ao gravar métricas em {self.metrics_dir}: {e}")
+
+    def flush(self):
+        """Grava o retrato deste worker (de forma atômica) se algo mudou desde a última gravação."""
+        with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            data = {"counters": [[family, labels, value] for (family, labels), value in self._counters.items()],
+                    "histograms": [[family, labels, list(h)] for (family, labels), h in self._histograms.items()]}
+        os.makedirs(self.metrics_dir, exist_ok=True)
+        path = self._snapshot_path()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def collect(self):
+        """(contadores, histogramas) deste processo somados aos dos outros workers em METRICS_DIR."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: list(h) for key, h in self._histograms.items()}
+        if not self.metrics_dir:
+            return counters, histograms
+
+        own_path = self._snapshot_path()
+        for path in glob.glob(os.path.join(self.metrics_dir, f"{self.service}-*.json")):
+            if path == own_path:
+                continue
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue # Worker gravando ou arquivo removido
+            for family, labels, value in data.get("counters", []):
+                key = (family, tuple(tuple(pair) for pair in labels))
+                counters[key] = counters.get(key, 0) + value
+            for family, labels, values in data.get("histograms", []):
+                key = (family, tuple(tuple(pair) for pair in labels))
+                if key in histograms:
+                    histograms[key] = [a + b for a, b in zip(histograms[key], values)]
+                else:
+                    histograms[key] = list(values)
+        return counters, histograms
+
+
+# ----------------------------------------------------
+# Exposição (/metrics)
+# ----------------------------------------------------
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+def render_metrics():
+    """Texto no formato de exposição do Prometheus com todos os registros do processo."""
+    samples = {name: [] for name, _, _ in FAMILIES}
+    bounds = [f"{b:g}" for b in LATENCY_BUCKETS] + ['+Inf']
+    for registry in _registries:
+        if not registry.enabled:
+            continue
+        counters, histograms = registry.collect()
+        base = (('service', registry.service),)
+        for (family, labels), value in sorted(counters.items()):
+            samples[family].append(f"{family}{_format_labels(base + labels)} {value}")
+        for (family, labels), histogram in sorted(histograms.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, histogram):
+                cumulative += count
+                samples[family].append(f"{family}_bucket{_format_labels(base + labels + (('le', bound),))} {cumulative}")
+            samples[family].append(f"{family}_sum{_format_labels(base + labels)} {histogram[-1]:.6f}")
+            samples[family].append(f"{family}_count{_format_labels(base + labels)} {cumulative}")
+
+    lines = []
+    for name, kind, help_text in FAMILIES:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(samples[name])
+    return '\n'.join(lines) + '\n'
+
+
+def register_metrics_endpoint(app):
+    """Adiciona GET /metrics (texto do Prometheus); 404 com METRICS_ENABLED=0."""
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        if not METRICS_ENABLED:
+            return jsonify({"status": "error", "message": "Métricas desabilitadas (METRICS_ENABLED=0)."}), 404
+        return Response(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def reset_metrics_dir(services, metrics_dir=METRICS_DIR):
+    """Remove os retratos de uma execução anterior dos serviços dados (chamado pelo mestre do Gunicorn).
+
+    Só apaga <serviço>-*.json: os retratos vivos de outros serviços no mesmo
+    METRICS_DIR continuam somando.
+    """
+    if not metrics_dir:
+        return
+    for service in services:
+        for path in glob.glob(os.path.join(metrics_dir, f"{service}-*.json")):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,405 @@
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import numpy as np
+from common.hashing import file_sha256
+
+try:
+    import fcntl # Trava entre processos (Linux/macOS)
+except ImportError: # pragma: no cover - Windows
+    fcntl = None
+
+# ----------------------------------------------------
+# Registro de artefatos versionados (imutáveis, com checksums e alias "latest")
+# ----------------------------------------------------
+# Cada treino publica um bundle em <serviço>_service/model_registry/vNNNN/
+# (ao lado de model_artifacts/, ou em MODEL_REGISTRY_DIR/<serviço>/):
+#   - cópias dos artefatos (modelo .h5/.tflite, scaler, tokenizer, relatórios);
+#   - arrays .npz convertidos para um .bin contíguo (cada array alinhado em
+#     64 bytes, índice no manifesto), aberto com mmap: os N workers de um host
+#     leem as mesmas páginas do page cache em vez de N cópias privadas no RSS;
+#   - manifest.json: versão, SHA-256 e tamanho de cada arquivo, hash do bundle
+#     e metadados do treino.
+# A pasta é montada em .tmp-* e renomeada (atômico) para vNNNN; os arquivos
+# ficam somente leitura. Aliases (latest, ou outro nome, ex.: estavel) são
+# arquivos em aliases/ com o nome da versão, trocados com os.replace.
+#
+# As APIs carregam por <SERVIÇO>_MODEL_VERSION (latest, padrão, ou vNNNN); sem
+# registro publicado usam a pasta model_artifacts/ como antes. A recarga a quente
+# observa o alias: repontá-lo (novo treino ou rollback) troca o modelo servido.
+#
+# Uso:
+#   python -m common.registry list fnn
+#   python -m common.registry publish cnn              # publica o conteúdo atual de model_artifacts/
+#   python -m common.registry verify rnn latest
+#   python -m common.registry alias fnn latest v0003   # rollback
+#   python -m common.registry prune cnn --keep 5
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REGISTRY_ROOT = os.environ.get('MODEL_REGISTRY_DIR') # Vazio: model_registry/ ao lado de model_artifacts/
+REGISTRY_PUBLISH = os.environ.get('MODEL_REGISTRY_PUBLISH', '1') == '1' # Os scripts de treino publicam ao final
+REGISTRY_VERIFY = os.environ.get('MODEL_REGISTRY_VERIFY', '1') == '1' # Confere os checksums na carga
+REGISTRY_KEEP = int(os.environ.get('MODEL_REGISTRY_KEEP', '10')) # Versões mantidas (as com alias nunca saem)
+DEFAULT_ALIAS = 'latest'
+MANIFEST_NAME = 'manifest.json'
+ARRAY_ALIGNMENT = 64
+
+# Artefatos de cada serviço que entram no bundle (os ausentes são ignorados)
+REGISTRY_FILES = {
+    'fnn': ('fnn_model.npz', 'fnn_model.h5', 'scaler.pkl'),
+    'rnn': ('rnn_model.h5', 'tokenizer_vocab.json', 'tokenizer.pkl'),
+    'cnn': ('cnn_model.h5', 'cnn_model_int8.tflite', 'cnn_model_float16.tflite', 'cnn_tflite_report.json'),
+}
+
+
+def blob_name(name):
+    """Arquivo .bin que substitui um .npz no bundle (fnn_model.npz -> fnn_model.bin)."""
+    return f"{os.path.splitext(name)[0]}.bin"
+
+
+def write_array_blob(arrays, path):
+    """Grava os arrays num único arquivo contíguo (cada um alinhado em 64 bytes); retorna o índice."""
+    index, offset = [], 0
+    with open(path, 'wb') as f:
+        for name, array in arrays.items():
+            array = np.asarray(array) # tobytes() já grava em ordem C; ascontiguousarray viraria escalares em 1-d
+            if array.dtype.hasobject:
+                raise ValueError(f"Array {name} com objetos Python não pode ser mapeado em memória")
+            padding = -offset % ARRAY_ALIGNMENT
+            f.write(b'\0' * padding)
+            offset += padding
+            f.write(array.tobytes())
+            index.append({"name": name, "dtype": array.dtype.str, "shape": list(array.shape), "offset": offset})
+            offset += array.nbytes
+    return index
+
+
+def map_array_blob(path, index):
+    """{nome: array somente leitura} apontando para o arquivo mapeado (nenhuma cópia)."""
+    if os.path.getsize(path) == 0:
+        buffer = np.zeros(0, dtype=np.uint8)
+    else:
+        buffer = np.memmap(path, dtype=np.uint8, mode='r')
+    arrays = {}
+    for entry in index:
+        dtype = np.dtype(entry["dtype"])
+        count = int(np.prod(entry["shape"], dtype=np.int64))
+        start = entry["offset"]
+        arrays[entry["name"]] = buffer[start:start + count * dtype.itemsize].view(dtype).reshape(entry["shape"])
+    return arrays
+
+
+class RegistryVersion:
+    """Um bundle publicado: caminhos dos arquivos, arrays mapeados e verificação dos checksums."""
+
+    def __init__(self, service, version, path, manifest):
+        self.service = service
+        self.version = version
+        self.path = path
+        self.manifest = manifest
+        self._arrays = {}
+
+    def has(self, name):
+        return name in self.manifest["files"] or name in self.manifest["arrays"]
+
+    def file(self, name):
+        """Caminho de um artefato do bundle (FileNotFoundError se não foi publicado)."""
+        if name not in self.manifest["files"]:
+            raise FileNotFoundError(f"{name} não está na versão {self.version} de {self.service}")
+        return os.path.join(self.path, name)
+
+    def arrays(self, name):
+        """Arrays de um .npz publicado, mapeados do .bin (compartilhados entre processos pelo page cache)."""
+        if name not in self._arrays:
+            if name not in self.manifest["arrays"]:
+                raise FileNotFoundError(f"{name} não está na versão {self.version} de {self.service}")
+            self._arrays[name] = map_array_blob(os.path.join(self.path, blob_name(name)),
+                                                self.manifest["arrays"][name])
+        return self._arrays[name]
+
+    def verify(self):
+        """Confere o SHA-256 de cada arquivo com o manifesto; ValueError na primeira divergência."""
+        for name, entry in self.manifest["stored"].items():
+            path = os.path.join(self.path, name)
+            if not os.path.isfile(path):
+                raise ValueError(f"{self.service} {self.version}: {name} ausente")
+            if os.path.getsize(path) != entry["bytes"] or file_sha256(path) != entry["sha256"]:
+                raise ValueError(f"{self.service} {self.version}: checksum de {name} não confere")
+        return True
+
+    def to_dict(self):
+        return {"version": self.version, "bundle_sha256": self.manifest["bundle_sha256"],
+                "created_at": self.manifest["created_at"], "metadata": self.manifest["metadata"]}
+
+
+def default_model_dir(service):
+    return os.path.join(ROOT_DIR, f'{service}_service', 'model_artifacts')
+
+
+def registry_path(service, model_dir=None):
+    """MODEL_REGISTRY_DIR/<serviço>, ou model_registry/ ao lado de model_dir.
+
+    Um model_dir alternativo (ex.: <SERVIÇO>_MODEL_DIR do benchmark) tem o seu
+    próprio registro, então nunca carrega versões publicadas para outro diretório.
+    """
+    if REGISTRY_ROOT:
+        return os.path.join(REGISTRY_ROOT, service)
+    return os.path.join(os.path.dirname(os.path.abspath(model_dir or default_model_dir(service))), 'model_registry')
+
+
+class ModelRegistry:
+    """Registro de versões de um serviço (ver `registry_path`)."""
+
+    def __init__(self, service, model_dir=None):
+        self.service = service
+        self.model_dir = model_dir or default_model_dir(service)
+        self.path = registry_path(service, self.model_dir)
+        self.aliases_dir = os.path.join(self.path, 'aliases')
+
+    # ------------------------------------------------
+    # Leitura
+    # ------------------------------------------------
+    def versions(self):
+        """Versões publicadas, da mais antiga para a mais nova."""
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(name for name in os.listdir(self.path)
+                      if name.startswith('v') and name[1:].isdigit()
+                      and os.path.isfile(os.path.join(self.path, name, MANIFEST_NAME)))
+
+    def alias_path(self, alias=DEFAULT_ALIAS):
+        return os.path.join(self.aliases_dir, alias)
+
+    def aliases(self):
+        if not os.path.isdir(self.aliases_dir):
+            return {}
+        return {alias: self.resolve(alias) for alias in sorted(os.listdir(self.aliases_dir))
+                if not alias.startswith('.')}
+
+    def resolve(self, ref=DEFAULT_ALIAS):
+        """Nome da versão para um alias ou versão (vNNNN); None se não existir."""
+        if ref.startswith('v') and ref[1:].isdigit():
+            return ref if os.path.isfile(os.path.join(self.path, ref, MANIFEST_NAME)) else None
+        try:
+            with open(self.alias_path(ref), encoding='utf-8') as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def open(self, ref=DEFAULT_ALIAS, verify=REGISTRY_VERIFY):
+        """RegistryVersion da versão (ou alias) pedida, com os checksums conferidos."""
+        version = self.resolve(ref)
+        if version is None:
+            raise FileNotFoundError(f"Versão {ref!r} não encontrada no registro de {self.service} ({self.path})")
+        path = os.path.join(self.path, version)
+        with open(os.path.join(path, MANIFEST_NAME), encoding='utf-8') as f:
+            manifest = json.load(f)
+        entry = RegistryVersion(self.service, version, path, manifest)
+        if verify:
+            entry.verify()
+        return entry
+
+    # ------------------------------------------------
+    # Escrita (serializada por uma trava no diretório do registro)
+    # ------------------------------------------------
+    def _lock(self):
+        os.makedirs(self.path, exist_ok=True)
+        lock = open(os.path.join(self.path, '.lock'), 'a')
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        return lock
+
+    def _write_alias(self, alias, version):
+        os.makedirs(self.aliases_dir, exist_ok=True)
+        tmp_path = os.path.join(self.aliases_dir, f'.{alias}.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(version)
+        os.replace(tmp_path, self.alias_path(alias))
+
+    def publish(self, model_dir=None, names=None, metadata=None, alias=DEFAULT_ALIAS):
+        """Publica os artefatos de model_dir como uma versão nova; retorna o RegistryVersion."""
+        model_dir = model_dir or self.model_dir
+        names = [n for n in (names or REGISTRY_FILES[self.service]) if os.path.isfile(os.path.join(model_dir, n))]
+        if not names:
+            raise FileNotFoundError(f"Nenhum artefato de {self.service} em {model_dir}")
+        started_at = time.perf_counter()
+        with self._lock():
+            versions = self.versions()
+            version = f"v{int(versions[-1][1:]) + 1 if versions else 1:04d}"
+            tmp_dir = os.path.join(self.path, f'.tmp-{version}-{os.getpid()}')
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            os.makedirs(tmp_dir)
+            files, arrays, stored = {}, {}, {}
+            for name in names:
+                src = os.path.join(model_dir, name)
+                files[name] = {"sha256": file_sha256(src), "bytes": os.path.getsize(src)}
+                if name.endswith('.npz'):
+                    with np.load(src, allow_pickle=False) as data:
+                        arrays[name] = write_array_blob({k: data[k] for k in data.files},
+                                                        os.path.join(tmp_dir, blob_name(name)))
+                else:
+                    shutil.copyfile(src, os.path.join(tmp_dir, name))
+            for name in sorted(os.listdir(tmp_dir)):
+                path = os.path.join(tmp_dir, name)
+                stored[name] = {"sha256": file_sha256(path), "bytes": os.path.getsize(path)}
+                os.chmod(path, 0o444) # Imutável: ninguém regrava um bundle publicado
+            bundle_sha256 = hashlib.sha256(json.dumps(files, sort_keys=True).encode('utf-8')).hexdigest()
+            manifest = {"service": self.service, "version": version, "created_at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+                        "bundle_sha256": bundle_sha256, "files": files, "arrays": arrays, "stored": stored,
+                        "metadata": metadata or {}}
+            with open(os.path.join(tmp_dir, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, indent=2)
+            os.rename(tmp_dir, os.path.join(self.path, version)) # Atômico: a versão aparece completa
+            if alias:
+                self._write_alias(alias, version)
+            self._prune_locked(REGISTRY_KEEP)
+        total_kb = sum(e["bytes"] for e in stored.values()) / 1024.0
+        print(f"[{self.service}] versão {version} publicada em {self.path} ({len(stored)} arquivos, {total_kb:.1f} KB, "
+              f"{time.perf_counter() - started_at:.2f}s, bundle {bundle_sha256[:12]})"
+              + (f"; {alias} -> {version}" if alias else ""))
+        return self.open(version, verify=False)
+
+    def set_alias(self, alias, ref):
+        """Aponta um alias para uma versão existente (ex.: rollback do latest)."""
+        with self._lock():
+            version = self.resolve(ref)
+            if version is None:
+                raise FileNotFoundError(f"Versão {ref!r} não encontrada no registro de {self.service}")
+            self._write_alias(alias, version)
+        return version
+
+    def prune(self, keep=REGISTRY_KEEP):
+        with self._lock():
+            return self._prune_locked(keep)
+
+    def _prune_locked(self, keep):
+        """Remove as versões mais antigas além de `keep`, exceto as apontadas por algum alias."""
+        if keep <= 0:
+            return []
+        pinned = set(self.aliases().values())
+        versions = self.versions()
+        removed = [v for v in versions[:-keep] if v not in pinned]
+        for version in removed:
+            path = os.path.join(self.path, version)
+            for name in os.listdir(path):
+                os.chmod(os.path.join(path, name), 0o644)
+            shutil.rmtree(path)
+        return removed
+
+
+# ----------------------------------------------------
+# Origem dos artefatos de uma API: registro (versão ou alias) ou model_artifacts/
+# ----------------------------------------------------
+class ArtifactSource:
+    """Resolve de onde o serviço carrega e qual versão está disponível.
+
+    Com `ref` (latest ou vNNNN) e o registro publicado, os artefatos vêm do
+    bundle; sem registro (ou ref vazio) vêm de model_dir, versionados pelo hash
+    dos arquivos como antes. `signature()` e `version()` alimentam a recarga a quente.
+    """
+
+    def __init__(self, service, ref, model_dir, artifact_names):
+        self.service = service
+        self.ref = ref
+        self.model_dir = model_dir
+        self.artifact_names = tuple(artifact_names)
+        self.registry = ModelRegistry(service, model_dir) if ref else None
+
+    def _registry_version(self):
+        return self.registry.resolve(self.ref) if self.registry is not None else None
+
+    def version(self):
+        """Versão disponível agora (sem carregar nada)."""
+        version = self._registry_version()
+        if version is not None:
+            return version
+        if self.registry is not None and self.ref != DEFAULT_ALIAS:
+            raise FileNotFoundError(f"Versão {self.ref!r} não encontrada no registro de {self.service}")
+        from common.hot_reload import artifacts_version
+        return artifacts_version(self.model_dir, self.artifact_names)
+
+    def signature(self):
+        """Muda quando o alias é repontado ou quando os arquivos de model_dir são regravados."""
+        from common.hot_reload import artifacts_signature
+        signature = artifacts_signature(self.model_dir, self.artifact_names)
+        if self.registry is not None and not (self.ref.startswith('v') and self.ref[1:].isdigit()):
+            signature += artifacts_signature(self.registry.aliases_dir, (self.ref,))
+        return signature
+
+    def open(self):
+        """(RegistryVersion ou None, versão): None significa carregar de model_dir."""
+        version = self._registry_version()
+        if version is None:
+            return None, self.version()
+        entry = self.registry.open(version)
+        return entry, entry.version
+
+    def path(self, entry, name):
+        """Caminho de um artefato no bundle (entry) ou em model_dir."""
+        return entry.file(name) if entry is not None else os.path.join(self.model_dir, name)
+
+    def exists(self, entry, name):
+        return entry.has(name) if entry is not None else os.path.isfile(os.path.join(self.model_dir, name))
+
+
+def publish_artifacts(service, model_dir=None, metadata=None):
+    """Publica o conteúdo atual de model_dir (chamado ao final dos scripts de treino).
+
+    Com MODEL_REGISTRY_PUBLISH=0 não faz nada. Uma falha não invalida o treino:
+    os artefatos em model_artifacts/ continuam valendo.
+    """
+    if not REGISTRY_PUBLISH:
+        return None
+    model_dir = model_dir or default_model_dir(service)
+    try:
+        return ModelRegistry(service, model_dir).publish(metadata=metadata)
+    except Exception as e:
+        print(f"AVISO: publicação no registro falhou (os artefatos em {model_dir} continuam válidos): {e}")
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Registro de artefatos versionados dos modelos")
+    sub = parser.add_subparsers(dest='command', required=True)
+    for name in ('list', 'publish', 'verify', 'alias', 'prune'):
+        cmd = sub.add_parser(name)
+        cmd.add_argument('service', choices=tuple(REGISTRY_FILES))
+        if name == 'verify':
+            cmd.add_argument('ref', nargs='?', default=DEFAULT_ALIAS)
+        elif name == 'alias':
+            cmd.add_argument('alias')
+            cmd.add_argument('ref')
+        elif name == 'prune':
+            cmd.add_argument('--keep', type=int, default=REGISTRY_KEEP)
+        cmd.add_argument('--model-dir', default=None, help="Padrão: <serviço>_service/model_artifacts")
+    args = parser.parse_args(argv)
+    registry = ModelRegistry(args.service, args.model_dir)
+
+    try:
+        if args.command == 'list':
+            aliases = registry.aliases()
+            for version in registry.versions():
+                info = registry.open(version, verify=False).to_dict()
+                tags = ', '.join(a for a, v in aliases.items() if v == version)
+                print(f"{version}  {info['created_at']}  {info['bundle_sha256'][:12]}  "
+                      f"{json.dumps(info['metadata'], ensure_ascii=False)}" + (f"  [{tags}]" if tags else ""))
+        elif args.command == 'publish':
+            registry.publish(metadata={"source": "manual"})
+        elif args.command == 'verify':
+            entry = registry.open(args.ref)
+            print(f"{args.service} {entry.version}: {len(entry.manifest['stored'])} arquivos conferem")
+        elif args.command == 'alias':
+            print(f"{args.service}: {args.alias} -> {registry.set_alias(args.alias, args.ref)}")
+        else:
+            print(f"{args.service}: removidas {registry.prune(args.keep) or 'nenhuma'}")
+    except (FileNotFoundError, ValueError) as e:
+        print(f"ERRO: {e}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
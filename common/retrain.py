@@ -0,0 +1,279 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import subprocess
+import numpy as np
+
+try:
+    import fcntl # Trava entre processos (Linux/macOS)
+except ImportError: # pragma: no cover - Windows
+    fcntl = None
+
+# ----------------------------------------------------
+# Retreino incremental: só o que chegou desde o último treino
+# ----------------------------------------------------
+# Cada treino grava em model_artifacts/training_watermark.npz a "marca d'água"
+# do que já foi treinado: uma chave de 64 bits por amostra, calculada pelo
+# conteúdo (linha do CSV/Parquet, ou caminho + rótulo da imagem). A ordem das
+# linhas muda com a compactação e com a rotação dos segmentos, então um
+# contador de posição não basta.
+#
+# Com RETRAIN_MODE=incremental o script de treino:
+#   - compara as chaves atuais com a marca d'água e separa as amostras novas;
+#   - não treina se houver menos de RETRAIN_MIN_NEW amostras novas;
+#   - carrega o modelo atual (warm start) e faz o ajuste fino com as novas mais
+#     uma amostra aleatória das antigas (replay: RETRAIN_REPLAY_RATIO antigas por nova),
+#     com taxa de aprendizado menor e menos épocas;
+#   - volta ao treino completo se não houver marca d'água ou se os artefatos
+#     tiverem mudado desde ela (ex.: restaurados de um backup).
+#
+# O agendador (python -m common.retrain) confere o volume novo sem importar o
+# TensorFlow e só então roda o script num processo separado, com prioridade
+# baixa (nice). A API segue servindo e a recarga a quente pega os artefatos novos.
+#
+# Uso:
+#   python -m common.retrain --check                # só mostra o volume novo de cada serviço
+#   python -m common.retrain --services fnn,rnn     # retreina os que passaram do limite
+#   python -m common.retrain --loop 600             # confere a cada 10 minutos
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WATERMARK_NAME = 'training_watermark.npz'
+
+RETRAIN_MODE = os.environ.get('RETRAIN_MODE', 'full') # full | incremental
+RETRAIN_MIN_NEW = os.environ.get('RETRAIN_MIN_NEW') # Padrão por serviço em TARGETS
+RETRAIN_REPLAY_RATIO = float(os.environ.get('RETRAIN_REPLAY_RATIO', '1.0'))
+RETRAIN_EPOCHS = os.environ.get('RETRAIN_EPOCHS') # Padrão por serviço em TARGETS
+RETRAIN_LEARNING_RATE = float(os.environ.get('RETRAIN_LEARNING_RATE', '0.0001'))
+RETRAIN_FORCE = os.environ.get('RETRAIN_FORCE', '0') == '1'
+RETRAIN_NICE = int(os.environ.get('RETRAIN_NICE', '10'))
+RETRAIN_THREADS = os.environ.get('RETRAIN_THREADS') # Limita as threads do TensorFlow no treino
+
+# Script, artefatos que o treino grava (versão da marca d'água) e padrões de cada serviço
+TARGETS = {
+    'fnn': {'script': os.path.join(ROOT_DIR, 'fnn_service', 'train_fnn.py'),
+            'model_dir': os.path.join(ROOT_DIR, 'fnn_service', 'model_artifacts'),
+            'artifacts': ('fnn_model.h5', 'scaler.pkl'), 'min_new': 200, 'epochs': 10},
+    'rnn': {'script': os.path.join(ROOT_DIR, 'rnn_service', 'train_rnn.py'),
+            'model_dir': os.path.join(ROOT_DIR, 'rnn_service', 'model_artifacts'),
+            'artifacts': ('rnn_model.h5', 'tokenizer.pkl'), 'min_new': 50, 'epochs': 5},
+    'cnn': {'script': os.path.join(ROOT_DIR, 'cnn_service', 'train_cnn.py'),
+            'model_dir': os.path.join(ROOT_DIR, 'cnn_service', 'model_artifacts'),
+            'artifacts': ('cnn_model.h5',), 'min_new': 20, 'epochs': 5},
+}
+SOIL_COLUMNS = ['temperatura', 'umidade', 'chuva', 'ph', 'rendimento_alto']
+NOTE_COLUMNS = ['nota', 'rotulo']
+
+
+# ----------------------------------------------------
+# Chaves das amostras
+# ----------------------------------------------------
+def row_keys(df, columns):
+    """Uma chave uint64 por linha, calculada pelo conteúdo das colunas (independe da ordem e do arquivo)."""
+    import pandas as pd
+    return pd.util.hash_pandas_object(df[columns], index=False).to_numpy(dtype=np.uint64)
+
+
+def text_keys(values):
+    """Uma chave uint64 por texto (ex.: 'caminho:rótulo' de cada imagem)."""
+    return np.array([int.from_bytes(hashlib.blake2b(v.encode('utf-8'), digest_size=8).digest(), 'little')
+                     for v in values], dtype=np.uint64)
+
+
+def min_new_for(service):
+    return int(RETRAIN_MIN_NEW) if RETRAIN_MIN_NEW else TARGETS[service]['min_new']
+
+
+def epochs_for(service):
+    return int(RETRAIN_EPOCHS) if RETRAIN_EPOCHS else TARGETS[service]['epochs']
+
+
+def _artifacts_version(service):
+    from common.hot_reload import artifacts_version
+    target = TARGETS[service]
+    return artifacts_version(target['model_dir'], target['artifacts'])
+
+
+# ----------------------------------------------------
+# Marca d'água
+# ----------------------------------------------------
+class TrainingWatermark:
+    """Chaves já treinadas (ordenadas, sem repetição) + metadados do último treino."""
+
+    def __init__(self, path, keys=None, meta=None):
+        self.path = path
+        self.keys = np.empty(0, dtype=np.uint64) if keys is None else keys
+        self.meta = meta or {}
+
+    @classmethod
+    def load(cls, service):
+        path = os.path.join(TARGETS[service]['model_dir'], WATERMARK_NAME)
+        if not os.path.isfile(path):
+            return None
+        with np.load(path, allow_pickle=False) as data:
+            return cls(path, data['keys'], json.loads(str(data['meta'])))
+
+    def new_mask(self, keys):
+        """True para as amostras que o último treino não viu."""
+        return ~np.isin(keys, self.keys, assume_unique=False)
+
+    @classmethod
+    def save(cls, service, keys, mode, **extra):
+        """Grava (de forma atômica) a marca d'água dos artefatos recém-salvos."""
+        path = os.path.join(TARGETS[service]['model_dir'], WATERMARK_NAME)
+        meta = {"mode": mode, "samples": int(len(keys)), "trained_at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+                "artifacts_version": _artifacts_version(service), **extra}
+        keys = np.unique(keys)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, keys=keys, meta=np.array(json.dumps(meta)))
+        os.replace(tmp_path, path)
+        return cls(path, keys, meta)
+
+
+class RetrainPlan:
+    """Decisão do treino: 'full', 'incremental' (índices a treinar) ou 'skip'."""
+
+    def __init__(self, mode, reason, indices=None, n_new=0, n_replay=0):
+        self.mode = mode
+        self.reason = reason
+        self.indices = indices
+        self.n_new = n_new
+        self.n_replay = n_replay
+
+    def as_full(self, reason):
+        return RetrainPlan('full', reason, n_new=self.n_new)
+
+    def __str__(self):
+        if self.mode == 'incremental':
+            return f"incremental: {self.n_new} novas + {self.n_replay} de replay ({self.reason})"
+        return f"{self.mode}: {self.reason}"
+
+
+def plan_retrain(service, keys, mode=None, force=None, seed=42):
+    """Decide entre treino completo, ajuste fino incremental ou nada a fazer."""
+    mode = mode or RETRAIN_MODE
+    force = RETRAIN_FORCE if force is None else force
+    if mode != 'incremental':
+        return RetrainPlan('full', "RETRAIN_MODE=full", n_new=len(keys))
+
+    watermark = TrainingWatermark.load(service)
+    if watermark is None:
+        return RetrainPlan('full', "sem marca d'água do treino anterior", n_new=len(keys))
+    if watermark.meta.get("artifacts_version") != _artifacts_version(service):
+        return RetrainPlan('full', "artefatos alterados desde o último treino", n_new=len(keys))
+
+    new = np.flatnonzero(watermark.new_mask(keys))
+    min_new = min_new_for(service)
+    if len(new) < min_new and not force:
+        return RetrainPlan('skip', f"{len(new)} amostras novas < RETRAIN_MIN_NEW={min_new}", n_new=len(new))
+    if len(new) == 0:
+        return RetrainPlan('skip', "nenhuma amostra nova")
+
+    old = np.setdiff1d(np.arange(len(keys)), new, assume_unique=True)
+    n_replay = min(len(old), int(np.ceil(len(new) * RETRAIN_REPLAY_RATIO)))
+    replay = np.random.default_rng(seed).choice(old, n_replay, replace=False) if n_replay else old[:0]
+    indices = np.concatenate([new, np.sort(replay)])
+    return RetrainPlan('incremental', f"{len(new)} novas de {len(keys)}", indices, len(new), n_replay)
+
+
+def fine_tune_optimizer():
+    """Adam com taxa menor para o ajuste fino (não desfaz o que o modelo já aprendeu)."""
+    from tensorflow.keras.optimizers import Adam
+    return Adam(learning_rate=RETRAIN_LEARNING_RATE)
+
+
+# ----------------------------------------------------
+# Volume novo sem TensorFlow (usado pelo agendador)
+# ----------------------------------------------------
+def current_keys(service):
+    """Chaves dos dados de treino atuais, como o script de treino as calcula."""
+    if service in ('fnn', 'rnn'):
+        if ROOT_DIR not in sys.path:
+            sys.path.insert(0, ROOT_DIR)
+        from common.columnar import read_dataset
+        dataset, columns = ('soil', SOIL_COLUMNS) if service == 'fnn' else ('notes', NOTE_COLUMNS)
+        return row_keys(read_dataset(dataset, columns), columns)
+    cnn_dir = os.path.join(ROOT_DIR, 'cnn_service')
+    if cnn_dir not in sys.path:
+        sys.path.insert(0, cnn_dir)
+    from leaf_store import training_items
+    data_dir = os.path.join(cnn_dir, 'uploads')
+    return image_keys([(os.path.relpath(path, data_dir), label) for path, label in training_items(data_dir)])
+
+
+def image_keys(items):
+    """Chaves de (caminho relativo, rótulo): o caminho do armazenamento já é o hash do conteúdo."""
+    return text_keys([f"{path}:{label}" for path, label in items])
+
+
+def pending(service):
+    """(plano incremental, total de amostras) sem treinar nada."""
+    try:
+        keys = current_keys(service)
+    except FileNotFoundError:
+        return RetrainPlan('skip', "sem dados de treino"), 0
+    return plan_retrain(service, keys, mode='incremental'), len(keys)
+
+
+def _lower_priority():
+    os.nice(RETRAIN_NICE)
+
+
+def run_training(service, mode='incremental', force=False):
+    """Roda o script de treino num processo separado, com prioridade baixa; retorna o código de saída."""
+    target = TARGETS[service]
+    env = dict(os.environ, RETRAIN_MODE=mode, RETRAIN_FORCE='1' if force else '0')
+    if RETRAIN_THREADS:
+        env.update(TF_NUM_INTRAOP_THREADS=RETRAIN_THREADS, TF_NUM_INTEROP_THREADS='1', OMP_NUM_THREADS=RETRAIN_THREADS)
+    os.makedirs(target['model_dir'], exist_ok=True)
+    with open(os.path.join(target['model_dir'], '.retrain.lock'), 'w') as lock:
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                print(f"[{service}] retreino já em andamento em outro processo")
+                return None
+        started_at = time.perf_counter()
+        proc = subprocess.run([sys.executable, target['script']], cwd=os.path.dirname(target['script']), env=env,
+                              preexec_fn=_lower_priority if hasattr(os, 'nice') else None)
+    print(f"[{service}] treino ({mode}) terminou com código {proc.returncode} em {time.perf_counter() - started_at:.1f}s")
+    return proc.returncode
+
+
+def check_and_retrain(services, check_only=False, full=False, force=False):
+    for service in services:
+        if full:
+            run_training(service, mode='full')
+            continue
+        plan, total = pending(service)
+        print(f"[{service}] {total} amostras; {plan}")
+        if check_only or (plan.mode == 'skip' and not (force and plan.n_new)):
+            continue
+        run_training(service, mode='incremental', force=force)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retreino incremental disparado pelo volume de dados novos")
+    parser.add_argument('--services', default='fnn,rnn,cnn')
+    parser.add_argument('--check', action='store_true', help="Só mostra o volume novo, sem treinar")
+    parser.add_argument('--force', action='store_true', help="Ajuste fino mesmo abaixo de RETRAIN_MIN_NEW")
+    parser.add_argument('--full', action='store_true', help="Treino completo do zero (atualiza a marca d'água)")
+    parser.add_argument('--loop', type=float, default=0, metavar='SEGUNDOS', help="Repete a verificação a cada N s")
+    args = parser.parse_args()
+
+    services = [s.strip() for s in args.services.split(',') if s.strip()]
+    unknown = [s for s in services if s not in TARGETS]
+    if unknown:
+        parser.error(f"Serviços desconhecidos: {unknown}")
+    while True:
+        check_and_retrain(services, args.check, args.full, args.force)
+        if args.loop <= 0:
+            break
+        time.sleep(args.loop)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+import os
+import sys
+import argparse
+import importlib
+import importlib.util
+
+# ----------------------------------------------------
+# Modo de produção: Gunicorn multi-processo para os serviços Flask
+# ----------------------------------------------------
+# Cada worker importa a API e carrega o modelo DEPOIS do fork (preload_app
+# desativado), então nenhum estado do TensorFlow é compartilhado entre
+# processos. Os pools de threads do TF/BLAS são limitados por worker para que
+# N workers não disputem os mesmos núcleos.
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Configuração padrão de cada serviço (sobrescrita pelos argumentos de linha de comando)
+SERVICE_CONFIG = {
+    'fnn': {'dir': 'fnn_service', 'port': 5001, 'workers': 2, 'threads': 4, 'timeout': 30},
+    'cnn': {'dir': 'cnn_service', 'port': 5002, 'workers': 2, 'threads': 2, 'timeout': 60},
+    'rnn': {'dir': 'rnn_service', 'port': 5003, 'workers': 2, 'threads': 2, 'timeout': 30},
+    'gateway': {'dir': 'gateway_service', 'port': 5000, 'workers': 2, 'threads': 16, 'timeout': 60},
+}
+
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS')
+
+
+def pin_threads(intra_op, inter_op):
+    """Limita os pools de threads do TensorFlow e das bibliotecas BLAS no processo atual.
+
+    Precisa rodar antes do primeiro import do TensorFlow (que é tardio nas APIs).
+    """
+    os.environ['TF_NUM_INTRAOP_THREADS'] = str(intra_op)
+    os.environ['TF_NUM_INTEROP_THREADS'] = str(inter_op)
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(intra_op)
+
+
+def default_intra_op_threads(workers):
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+def _add_service_paths(service):
+    service_dir = os.path.join(ROOT_DIR, SERVICE_CONFIG[service]['dir'])
+    for path in (ROOT_DIR, service_dir):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    return service_dir
+
+
+def load_api(service):
+    """Importa o módulo `api` do serviço (o diretório do serviço entra no sys.path)."""
+    service_dir = _add_service_paths(service)
+    os.chdir(service_dir)
+    return importlib.import_module('api')
+
+
+def import_service_api(service):
+    """Importa o `api.py` do serviço como `<serviço>_api`, para hospedar vários serviços num só processo.
+
+    Os módulos auxiliares de cada serviço têm nomes únicos (fnn_engine, leaf_preprocessing,
+    note_tokenizer...), então os diretórios dos serviços podem dividir o sys.path.
+    """
+    module_name = f"{service}_api"
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    service_dir = _add_service_paths(service)
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(service_dir, 'api.py'))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def build_parser(service):
+    config = SERVICE_CONFIG[service]
+    parser = argparse.ArgumentParser(description=f"Servidor de produção do serviço {service.upper()} (Gunicorn)")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=config['port'])
+    parser.add_argument('--workers', type=int, default=config['workers'], help="Processos worker")
+    parser.add_argument('--threads', type=int, default=config['threads'], help="Threads HTTP por worker")
+    parser.add_argument('--intra-op-threads', type=int, default=None,
+                        help="Threads intra-op do TF por worker (padrão: núcleos / workers)")
+    parser.add_argument('--inter-op-threads', type=int, default=1, help="Threads inter-op do TF por worker")
+    parser.add_argument('--timeout', type=int, default=config['timeout'])
+    return parser
+
+
+def serve(service, argv=None):
+    """Sobe o serviço sob Gunicorn com workers gthread."""
+    args = build_parser(service).parse_args(argv)
+    intra_op = args.intra_op_threads or default_intra_op_threads(args.workers)
+
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        print("ERRO: o modo de produção requer o Gunicorn (pip install gunicorn).")
+        sys.exit(1)
+
+    class ServiceApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f"{args.host}:{args.port}")
+            self.cfg.set('workers', args.workers)
+            self.cfg.set('threads', args.threads)
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('timeout', args.timeout)
+            self.cfg.set('preload_app', False)
+
+        def load(self):
+            # Executado dentro de cada worker, após o fork
+            pin_threads(intra_op, args.inter_op_threads)
+            api = load_api(service)
+            api.init_service()
+            return api.app
+
+    # Retratos de métricas da execução anterior não devem somar nesta
+    from common.metrics import METRICS_DIR, reset_metrics_dir
+    hosted = ('fnn', 'cnn', 'rnn') if service == 'gateway' and os.environ.get('GATEWAY_MODE') == 'inprocess' else ()
+    reset_metrics_dir((service,) + hosted) # O gateway inprocess também grava os retratos dos três modelos
+    if args.workers > 1 and not METRICS_DIR:
+        print("AVISO: sem METRICS_DIR, o /metrics mostra só o worker que atendeu a requisição.")
+
+    print(f"Serviço {service.upper()} (produção) em http://{args.host}:{args.port} — "
+          f"{args.workers} workers x {args.threads} threads, {intra_op} threads intra-op por worker")
+    ServiceApplication().run()
@@ -0,0 +1,112 @@
+import os
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+from flask import jsonify
+
+# ----------------------------------------------------
+# Inicialização dos serviços: carga em background, warm-up e /ready
+# ----------------------------------------------------
+# Estados: pending → loading → warming → ready (ou failed)
+
+PENDING, LOADING, WARMING, READY, FAILED = 'pending', 'loading', 'warming', 'ready', 'failed'
+
+
+def warmup_batch_sizes(default='1'):
+    """Lê WARMUP_BATCH_SIZES (ex.: "1,8,16"); "0" ou vazio desabilita o warm-up."""
+    raw = os.environ.get('WARMUP_BATCH_SIZES', default)
+    sizes = sorted({int(s) for s in raw.split(',') if s.strip()})
+    return [s for s in sizes if s > 0]
+
+
+class StartupState:
+    """Acompanha a carga dos artefatos de um serviço e mede cada fase."""
+
+    def __init__(self, service_name):
+        self.service_name = service_name
+        self.state = PENDING
+        self.error = None
+        self.timings = {}
+        self._created_at = time.perf_counter()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        """Mede uma fase (import, load, warmup) e registra o tempo no log."""
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started_at
+            with self._lock:
+                self.timings[name] = self.timings.get(name, 0.0) + elapsed
+            print(f"[{self.service_name}] startup {name}: {elapsed:.3f} s")
+
+    def run(self, load_fn, warmup_fn=None, batch_sizes=(), lock=None):
+        """Executa carga e warm-up de forma síncrona; retorna True se ficou pronto.
+
+        `load_fn` deve retornar True quando os artefatos foram carregados.
+        `warmup_fn(n)` executa um lote fictício de tamanho `n`.
+        `lock` (o da recarga a quente) fica preso durante carga e warm-up.
+        """
+        with lock or nullcontext():
+            self.state, self.error = LOADING, None
+            try:
+                if not load_fn():
+                    raise RuntimeError("Falha ao carregar os artefatos. Verifique os logs de inicialização.")
+                if warmup_fn is not None and batch_sizes:
+                    self.state = WARMING
+                    with self.phase('warmup'):
+                        for n in batch_sizes:
+                            warmup_fn(n)
+            except Exception as e:
+                self.state, self.error = FAILED, str(e)
+                print(f"[{self.service_name}] startup falhou: {e}")
+                return False
+
+            self.state = READY
+        summary = ', '.join(f"{k} {v:.3f} s" for k, v in self.timings.items())
+        print(f"[{self.service_name}] pronto em {time.perf_counter() - self._created_at:.3f} s ({summary})")
+        return True
+
+    def start_background(self, load_fn, warmup_fn=None, batch_sizes=(), lock=None):
+        """Dispara `run` numa thread para que o servidor HTTP suba imediatamente."""
+        self._thread = threading.Thread(
+            target=self.run, args=(load_fn, warmup_fn, batch_sizes, lock),
+            name=f"{self.service_name}-startup", daemon=True
+        )
+        self._thread.start()
+        return self._thread
+
+    @property
+    def ready(self):
+        return self.state == READY
+
+    def to_dict(self):
+        with self._lock:
+            timings = {k: round(v, 3) for k, v in self.timings.items()}
+        return {"service": self.service_name, "state": self.state, "error": self.error, "timings_s": timings}
+
+    def unavailable_response(self, message):
+        """Resposta 503 padrão enquanto o modelo não está disponível."""
+        if self.state in (PENDING, LOADING):
+            message = "Modelo ainda carregando. Tente novamente em instantes."
+        response = jsonify({"status": "error", "message": message, "startup_state": self.state})
+        response.headers['Retry-After'] = '2'
+        return response, 503
+
+
+def register_ready_endpoint(app, startup):
+    """Adiciona GET /ready: 200 quando pronto, 503 caso contrário."""
+    @app.route('/ready', methods=['GET'])
+    def ready():
+        return jsonify(startup.to_dict()), (200 if startup.ready else 503)
+
+
+def start_service(startup, load_fn, warmup_fn=None, batch_sizes=(), lock=None):
+    """Carrega os artefatos conforme STARTUP_MODE: background (padrão) ou blocking."""
+    if os.environ.get('STARTUP_MODE', 'background') == 'blocking':
+        startup.run(load_fn, warmup_fn, batch_sizes, lock)
+    else:
+        startup.start_background(load_fn, warmup_fn, batch_sizes, lock)
@@ -0,0 +1,259 @@
+import os
+import sys
+import json
+import time
+import shutil
+import signal
+import hashlib
+import numpy as np
+from tensorflow import keras
+
+# ----------------------------------------------------
+# Acompanhamento do treino: early stopping, checkpoints e log por época
+# ----------------------------------------------------
+# Uso nos scripts de treino:
+#   monitor = TrainingMonitor('fnn', fingerprint=run_fingerprint(...), samples=len(X_train), epochs=50)
+#   model, initial_epoch = monitor.resume(model)    # continua de um checkpoint do mesmo treino
+#   model.fit(..., epochs=50, initial_epoch=initial_epoch, callbacks=[monitor], verbose=0)
+#   ... salva os artefatos ...
+#   monitor.finish()                                # remove os checkpoints
+#
+# - Validação separada por `split_validation`: sorteio com semente e estratificado
+#   pelo rótulo (o `validation_split` do Keras pegaria só as últimas linhas).
+# - Early stopping pela perda de validação (ou de treino, sem validação): as
+#   primeiras TRAIN_MIN_EPOCHS épocas são aquecimento (não contam como melhor
+#   época nem para a paciência); depois para após TRAIN_PATIENCE épocas sem
+#   melhora e restaura os melhores pesos. Com menos de
+#   TRAIN_MIN_VALIDATION_SAMPLES amostras de validação a perda é ruidosa demais:
+#   treina todas as épocas e o modelo final fica com os pesos da última.
+# - Checkpoint (modelo + otimizador + estado do early stopping) em
+#   <serviço>_service/checkpoints/ a cada TRAIN_CHECKPOINT_INTERVAL_S; um
+#   SIGTERM (preempção) grava o checkpoint ao fim da época em andamento e encerra.
+#   O checkpoint só é retomado pelo mesmo treino: mesma impressão digital
+#   (modo, dados e configuração).
+# - Log estruturado: uma linha JSON por evento (run_start, epoch, checkpoint,
+#   resume, early_stop, run_end) em <serviço>_service/training_log.jsonl.
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+EARLY_STOPPING = os.environ.get('TRAIN_EARLY_STOPPING', '1') == '1'
+PATIENCE = int(os.environ.get('TRAIN_PATIENCE', '5'))
+MIN_EPOCHS = int(os.environ.get('TRAIN_MIN_EPOCHS', '5')) # Aquecimento antes do early stopping
+MIN_VALIDATION_SAMPLES = int(os.environ.get('TRAIN_MIN_VALIDATION_SAMPLES', '20')) # Abaixo disso não restaura
+MIN_DELTA = float(os.environ.get('TRAIN_MIN_DELTA', '0.0001'))
+VALIDATION_SPLIT = float(os.environ.get('TRAIN_VALIDATION_SPLIT', '0.2'))
+CHECKPOINT_INTERVAL_S = float(os.environ.get('TRAIN_CHECKPOINT_INTERVAL_S', '60')) # 0: toda época
+RESUME = os.environ.get('TRAIN_RESUME', '1') == '1'
+PREEMPTED_EXIT_CODE = 143 # 128 + SIGTERM, como um processo encerrado pelo sinal
+
+
+def run_fingerprint(service, mode, keys, indices=None, **config):
+    """Identifica um treino (dados + configuração): só um checkpoint com a mesma impressão é retomado."""
+    digest = hashlib.sha256(f"{service}:{mode}:{json.dumps(config, sort_keys=True)}".encode('utf-8'))
+    keys = np.asarray(keys, dtype=np.uint64)
+    digest.update((keys if indices is None else keys[indices]).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def split_validation(labels, split=VALIDATION_SPLIT, seed=42):
+    """(índices de treino, índices de validação): sorteio com semente, estratificado pelo rótulo.
+
+    Cada classe contribui com a mesma fração (arredondada) e mantém ao menos uma
+    amostra no treino. Sem amostras suficientes, a validação fica vazia.
+    """
+    labels = np.asarray(labels)
+    rng = np.random.default_rng(seed)
+    train, val = [], []
+    if int(len(labels) * split) >= 1:
+        for label in np.unique(labels):
+            members = rng.permutation(np.flatnonzero(labels == label))
+            n_val = min(int(round(len(members) * split)), len(members) - 1)
+            val.append(members[:n_val])
+            train.append(members[n_val:])
+    else:
+        train.append(np.arange(len(labels)))
+    train = np.sort(np.concatenate(train)).astype(np.int64)
+    val = np.sort(np.concatenate(val)).astype(np.int64) if val else np.zeros(0, dtype=np.int64)
+    return train, val
+
+
+def service_dir(service):
+    return os.path.join(ROOT_DIR, f'{service}_service')
+
+
+class TrainingMonitor(keras.callbacks.Callback):
+    """Callback do Keras que registra cada época, faz checkpoints e para cedo."""
+
+    def __init__(self, service, fingerprint, samples, epochs, patience=PATIENCE, min_delta=MIN_DELTA,
+                 early_stopping=EARLY_STOPPING, checkpoint_interval_s=CHECKPOINT_INTERVAL_S,
+                 checkpoint_dir=None, log_path=None, validation_samples=None, min_epochs=MIN_EPOCHS):
+        super().__init__()
+        self.service = service
+        self.fingerprint = fingerprint
+        self.samples = int(samples)
+        self.epochs = int(epochs)
+        self.patience = patience
+        self.min_delta = min_delta
+        self.early_stopping = early_stopping
+        self.min_epochs = min_epochs
+        self.validation_samples = validation_samples
+        # Sem validação a perda monitorada é a de treino, estável o bastante para restaurar
+        self.restore_best = validation_samples is None or validation_samples == 0 or \
+            validation_samples >= MIN_VALIDATION_SAMPLES
+        # Com validação ruidosa, parar cedo erra tanto quanto restaurar: treina todas as épocas
+        self.early_stopping = early_stopping and self.restore_best
+        self.checkpoint_interval_s = checkpoint_interval_s
+        self.checkpoint_dir = checkpoint_dir or os.path.join(service_dir(service), 'checkpoints')
+        self.log_path = log_path or os.path.join(service_dir(service), 'training_log.jsonl')
+        self.run_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}"
+        # Estado do early stopping (persistido nos checkpoints)
+        self.best = None
+        self.best_epoch = None
+        self.wait = 0
+        self.stopped_epoch = None
+        self._best_weights = None
+        self._epoch_started_at = None
+        self._last_checkpoint_at = time.monotonic()
+        self._preempted = False
+        self._previous_handler = None
+
+    # ------------------------------------------------
+    # Log estruturado
+    # ------------------------------------------------
+    def log(self, event, **fields):
+        record = {"event": event, "service": self.service, "run_id": self.run_id,
+                  "time": time.strftime('%Y-%m-%dT%H:%M:%S'), **fields}
+        with open(self.log_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        return record
+
+    # ------------------------------------------------
+    # Checkpoints
+    # ------------------------------------------------
+    @property
+    def _state_path(self):
+        return os.path.join(self.checkpoint_dir, 'state.json')
+
+    def resume(self, model):
+        """(modelo, época inicial): o do checkpoint deste mesmo treino, se houver, senão o recebido."""
+        if not RESUME or not os.path.isfile(self._state_path):
+            return model, 0
+        with open(self._state_path, encoding='utf-8') as f:
+            state = json.load(f)
+        if state.get("fingerprint") != self.fingerprint:
+            print(f"[{self.service}] checkpoint de outro treino (dados ou configuração diferentes): ignorado")
+            return model, 0
+        model = keras.models.load_model(os.path.join(self.checkpoint_dir, 'last.keras'))
+        self.best, self.best_epoch, self.wait = state["best"], state["best_epoch"], state["wait"]
+        best_path = os.path.join(self.checkpoint_dir, 'best.weights.h5')
+        if os.path.isfile(best_path):
+            best_model = keras.models.clone_model(model)
+            best_model.load_weights(best_path)
+            self._best_weights = best_model.get_weights()
+        initial_epoch = state["epoch"] + 1
+        print(f"[{self.service}] retomando do checkpoint: época {initial_epoch + 1}/{self.epochs}")
+        self.log("resume", epoch=initial_epoch, best=self.best, best_epoch=self.best_epoch)
+        return model, initial_epoch
+
+    def checkpoint(self, epoch):
+        """Grava modelo, melhores pesos e estado de forma atômica (o state.json é o último a ser trocado)."""
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        started_at = time.perf_counter()
+        tmp_model = os.path.join(self.checkpoint_dir, 'last.tmp.keras')
+        self.model.save(tmp_model)
+        os.replace(tmp_model, os.path.join(self.checkpoint_dir, 'last.keras'))
+        if self._best_weights is not None:
+            current = self.model.get_weights()
+            self.model.set_weights(self._best_weights)
+            tmp_best = os.path.join(self.checkpoint_dir, 'best.tmp.weights.h5')
+            self.model.save_weights(tmp_best)
+            self.model.set_weights(current)
+            os.replace(tmp_best, os.path.join(self.checkpoint_dir, 'best.weights.h5'))
+        state = {"fingerprint": self.fingerprint, "epoch": epoch, "best": self.best,
+                 "best_epoch": self.best_epoch, "wait": self.wait}
+        tmp_state = f"{self._state_path}.tmp"
+        with open(tmp_state, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_state, self._state_path)
+        self._last_checkpoint_at = time.monotonic()
+        self.log("checkpoint", epoch=epoch + 1, save_s=round(time.perf_counter() - started_at, 3))
+
+    def finish(self):
+        """Treino concluído e artefatos salvos: os checkpoints não servem mais."""
+        shutil.rmtree(self.checkpoint_dir, ignore_errors=True)
+
+    # ------------------------------------------------
+    # Preempção (SIGTERM)
+    # ------------------------------------------------
+    def _on_sigterm(self, signum, frame):
+        print(f"[{self.service}] SIGTERM: checkpoint ao fim da época em andamento")
+        self._preempted = True
+
+    # ------------------------------------------------
+    # Callbacks do Keras
+    # ------------------------------------------------
+    def on_train_begin(self, logs=None):
+        try:
+            self._previous_handler = signal.signal(signal.SIGTERM, self._on_sigterm)
+        except ValueError: # Fora da thread principal
+            self._previous_handler = None
+        self.log("run_start", fingerprint=self.fingerprint, samples=self.samples, epochs=self.epochs,
+                 patience=self.patience if self.early_stopping else None, min_epochs=self.min_epochs,
+                 validation_samples=self.validation_samples, restore_best=self.restore_best)
+        if not self.restore_best:
+            print(f"[{self.service}] validação com {self.validation_samples} amostras (< {MIN_VALIDATION_SAMPLES}): "
+                  f"sem early stopping, o modelo final fica com os pesos da última época")
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._epoch_started_at = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        logs = logs or {}
+        epoch_s = time.perf_counter() - self._epoch_started_at
+        monitored = 'val_loss' if 'val_loss' in logs else 'loss'
+        current = float(logs[monitored])
+        if epoch + 1 < self.min_epochs:
+            pass # Aquecimento: a perda das primeiras épocas não vira referência
+        elif self.best is None or current < self.best - self.min_delta:
+            self.best, self.best_epoch, self.wait = current, epoch + 1, 0
+            if self.restore_best:
+                self._best_weights = self.model.get_weights()
+        else:
+            self.wait += 1
+
+        metrics = {k: round(float(v), 6) for k, v in logs.items()}
+        self.log("epoch", epoch=epoch + 1, epochs=self.epochs, epoch_s=round(epoch_s, 3),
+                 samples_per_s=round(self.samples / epoch_s, 1) if epoch_s > 0 else None,
+                 monitor=monitored, best=round(self.best, 6) if self.best is not None else None, wait=self.wait,
+                 **metrics)
+        print(f"[{self.service}] época {epoch + 1}/{self.epochs} "
+              + ' '.join(f"{k}={v:.4f}" for k, v in metrics.items())
+              + f" ({epoch_s:.2f}s, {self.samples / max(epoch_s, 1e-9):.0f} amostras/s)")
+
+        stop = self.early_stopping and self.wait >= self.patience
+        if stop:
+            self.stopped_epoch = epoch + 1
+            self.model.stop_training = True
+        last_epoch = stop or epoch + 1 >= self.epochs
+        if self._preempted or (not last_epoch and time.monotonic() - self._last_checkpoint_at >= self.checkpoint_interval_s):
+            self.checkpoint(epoch)
+        if self._preempted:
+            self.log("preempted", epoch=epoch + 1)
+            sys.exit(PREEMPTED_EXIT_CODE)
+
+    def on_train_end(self, logs=None):
+        if self._previous_handler is not None:
+            signal.signal(signal.SIGTERM, self._previous_handler)
+        restored = self._best_weights is not None and self.best_epoch != self.epochs_run
+        if restored:
+            self.model.set_weights(self._best_weights)
+        if self.stopped_epoch is not None:
+            print(f"[{self.service}] early stopping na época {self.stopped_epoch}: "
+                  f"sem melhora há {self.patience} épocas (melhor: época {self.best_epoch})")
+            self.log("early_stop", epoch=self.stopped_epoch, best_epoch=self.best_epoch, best=self.best)
+        self.log("run_end", epochs_run=self.epochs_run, best_epoch=self.best_epoch, best=self.best,
+                 restored_best_weights=restored)
+
+    @property
+    def epochs_run(self):
+        return self.stopped_epoch or self.epochs
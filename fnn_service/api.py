@@ -1,59 +1,113 @@
 import os
+import sys
+import io
 import csv
+import json
+import math
 import joblib 
 import numpy as np 
-from flask import Flask, request, jsonify
-from tensorflow.keras.models import load_model 
+from flask import Flask, request, jsonify, Response
+from fnn_engine import NumpyFNN, KerasFNN
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Raiz do projeto (pacote common)
+from common.startup import StartupState, register_ready_endpoint, warmup_batch_sizes
+from common.ingestion import create_writer
+from common.metrics import ServiceMetrics, register_metrics_endpoint
+from common.hot_reload import ModelBundle, ModelReloader, register_reload_endpoints
+from common.registry import ArtifactSource, blob_name
 
 # Configuração
 app = Flask(__name__)
-CSV_FILE = 'soil_database.csv'
+startup = StartupState('fnn')
+register_ready_endpoint(app, startup)
+metrics = ServiceMetrics('fnn') # Contagens e latência por etapa em GET /metrics (METRICS_ENABLED=0 desliga)
+register_metrics_endpoint(app)
+CSV_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'soil_database.csv') # Independe do diretório de trabalho
 HEADERS = ["temperatura", "umidade", "chuva", "ph", "rendimento_alto"] 
+ingestion_writer = create_writer(CSV_FILE, HEADERS) # Configurado pelas variáveis INGEST_*
 FEATURES = ['temperatura', 'umidade', 'chuva', 'ph'] 
 
-# Variáveis globais para armazenar o modelo e o pré-processador
-fnn_model = None
-scaler = None
-MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model_artifacts')
+# Preditor ativo (modelo + pré-processamento + versão), trocado por inteiro na recarga a quente
+fnn_bundle = None
+MODEL_DIR = os.environ.get('FNN_MODEL_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model_artifacts'))
+PREDICT_CHUNK_SIZE = int(os.environ.get('FNN_PREDICT_CHUNK_SIZE', '4096')) # Linhas por chamada ao predict no lote
+FNN_BACKEND = os.environ.get('FNN_BACKEND', 'auto') # auto | numpy | keras
+ARTIFACTS = ('fnn_model.npz', 'fnn_model.h5', 'scaler.pkl') # Compõem a versão do modelo
+# Versão do registro (common/registry.py): latest, vNNNN ou vazio (só MODEL_DIR); sem registro usa MODEL_DIR
+MODEL_VERSION = os.environ.get('FNN_MODEL_VERSION', 'latest')
+model_source = ArtifactSource('fnn', MODEL_VERSION, MODEL_DIR, ARTIFACTS)
 
 # ----------------------------------------------------
 # Função de Carga (Nova)
 # ----------------------------------------------------
-def load_fnn_artifacts():
-    """Carrega o modelo FNN e o scaler na memória."""
-    global fnn_model, scaler
-    try:
+def build_fnn_bundle(phase):
+    """Carrega o preditor FNN (registro ou MODEL_DIR) num bundle novo, sem tocar no que está servindo.
+
+    Com o backend NumPy (padrão quando `fnn_model.npz` existe) o scaler já está
+    incorporado aos pesos e o TensorFlow nunca é importado. Do registro, os pesos
+    são mapeados do bundle (mmap) e compartilhados entre os workers.
+    """
+    with phase('verify'):
+        entry, version = model_source.open()
+    engine_path = os.path.join(MODEL_DIR, 'fnn_model.npz')
+    if FNN_BACKEND == 'numpy' or (FNN_BACKEND == 'auto' and model_source.exists(entry, 'fnn_model.npz')):
+        with phase('load'):
+            if entry is not None:
+                predictor = NumpyFNN.from_arrays(entry.arrays('fnn_model.npz'))
+                engine_path = os.path.join(entry.path, blob_name('fnn_model.npz'))
+            else:
+                predictor = NumpyFNN.load(engine_path)
+        print(f"Motor NumPy da FNN carregado com sucesso de: {engine_path} (versão {version})")
+        return ModelBundle(predictor, version)
+
+    # Import tardio: só o backend Keras precisa do TensorFlow
+    with phase('import'):
+        from tensorflow.keras.models import load_model
+
+    with phase('load'):
         # Carrega o modelo
-        model_path = os.path.join(MODEL_DIR, 'fnn_model.h5')
-        fnn_model = load_model(model_path)
-        print(f"Modelo FNN carregado com sucesso de: {model_path}")
+        model_path = model_source.path(entry, 'fnn_model.h5')
+        keras_model = load_model(model_path)
+        print(f"Modelo FNN carregado com sucesso de: {model_path} (versão {version})")
         
         # Carrega o scaler (pré-processador)
-        scaler_path = os.path.join(MODEL_DIR, 'scaler.pkl')
+        scaler_path = model_source.path(entry, 'scaler.pkl')
         scaler = joblib.load(scaler_path)
         print(f"Scaler carregado com sucesso de: {scaler_path}")
+
+    return ModelBundle(KerasFNN(keras_model, scaler), version)
+
+def load_fnn_artifacts():
+    """Carrega o preditor FNN na memória (inicialização)."""
+    global fnn_bundle
+    try:
+        fnn_bundle = build_fnn_bundle(startup.phase)
+        return True
         
     except Exception as e:
         print(f"ERRO ao carregar artefatos FNN. Execute Etapa 3: {e}")
-        fnn_model = None
-        scaler = None
+        fnn_bundle = None
+        return False
+
+def warmup_fnn(batch_size, bundle=None):
+    """Roda um lote fictício para que a primeira requisição real não pague o tracing do grafo."""
+    (bundle or fnn_bundle).model.predict_proba(np.zeros((batch_size, len(FEATURES))))
+
+def swap_fnn_bundle(bundle):
+    global fnn_bundle
+    fnn_bundle = bundle
+
+reloader = ModelReloader(startup, MODEL_DIR, ARTIFACTS, build_fnn_bundle, warmup_fnn, warmup_batch_sizes('1'),
+                         swap_fnn_bundle, lambda: fnn_bundle,
+                         version_fn=model_source.version, signature_fn=model_source.signature)
+register_reload_endpoints(app, reloader)
 
 # ----------------------------------------------------
 # Função utilitária para salvar os dados no CSV
 # ----------------------------------------------------
 def append_to_csv(data):
-    file_exists = os.path.isfile(CSV_FILE)
-    
-    try:
-        with open(CSV_FILE, mode='a', newline='') as file:
-            writer = csv.DictWriter(file, fieldnames=HEADERS, delimiter=',')
-            if not file_exists:
-                writer.writeheader()
-            writer.writerow(data)
-        return True
-    except Exception as e:
-        print(f"Erro ao salvar CSV: {e}")
-        return False
+    """Anexa uma linha ao CSV pelo writer de ingestão (group commit, seguro entre workers)."""
+    return ingestion_writer.append(data)
 
 # ----------------------------------------------------
 # ENDPOINT DE INGESTÃO (/log)
@@ -82,15 +136,17 @@ def log_soil_data():
 # POST /predict/soil_data
 # ----------------------------------------------------
 @app.route('/predict/soil_data', methods=['POST'])
+@metrics.instrument('/predict/soil_data')
 def predict_soil_data():
     """Recebe novos dados de solo/clima e retorna uma predição de rendimento."""
-    global fnn_model, scaler
+    bundle = fnn_bundle # Referência única: uma recarga no meio da requisição não a afeta
     
-    if fnn_model is None or scaler is None:
-        return jsonify({"status": "error", "message": "Modelo ou pré-processador não carregado. Verifique os logs de inicialização."}), 503
+    if bundle is None:
+        return startup.unavailable_response("Modelo ou pré-processador não carregado. Verifique os logs de inicialização.")
 
     try:
-        data = request.get_json()
+        with metrics.stage('parse'):
+            data = request.get_json()
         if not data:
             return jsonify({"status": "error", "message": "Nenhum dado JSON fornecido"}), 400
     except Exception:
@@ -101,33 +157,165 @@ def predict_soil_data():
 
     try:
         # 1. Preparar a entrada de dados
-        input_data = [data[f] for f in FEATURES]
-        input_array = np.array(input_data).reshape(1, -1) 
+        with metrics.stage('preprocess'):
+            input_data = [data[f] for f in FEATURES]
+            input_array = np.array(input_data).reshape(1, -1) 
 
-        # 2. Pré-processamento
-        input_scaled = scaler.transform(input_array)
-        
-        # 3. Predição
-        prediction_proba = fnn_model.predict(input_scaled)[0][0]
+        # 2. Pré-processamento + 3. Predição (o scaler é aplicado pelo preditor)
+        with metrics.stage('predict'):
+            prediction_proba = bundle.model.predict_proba(input_array)[0]
         
         # 4. Decisão final (limite de 0.5)
         prediction_label = "Rendimento Alto" if prediction_proba >= 0.5 else "Rendimento Normal/Baixo"
         
-        return jsonify({
-            "status": "success",
-            "prediction_label": prediction_label,
-            "confidence_score": float(prediction_proba)
-        }), 200
+        with metrics.stage('serialize'):
+            response = jsonify({
+                "status": "success",
+                "prediction_label": prediction_label,
+                "confidence_score": float(prediction_proba),
+                "model_version": bundle.version
+            })
+        return response, 200
 
     except Exception as e:
         return jsonify({"status": "error", "message": f"Erro interno durante a predição: {e}"}), 500
 
+# ----------------------------------------------------
+# Funções utilitárias para predição em lote
+# ----------------------------------------------------
+def _to_float(value):
+    """Converte um valor para float finito; levanta ValueError caso contrário."""
+    if isinstance(value, bool):
+        raise ValueError("booleano")
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError("não finito")
+    return number
+
+def _read_batch_rows():
+    """Lê o payload do lote e retorna uma lista de linhas (dicts) na ordem de entrada.
+
+    Aceita um array JSON de objetos, um JSON colunar ({"temperatura": [...], ...})
+    ou um CSV (upload multipart no campo 'file' ou corpo text/csv).
+    """
+    upload = request.files.get('file')
+    if upload is not None or request.mimetype in ('text/csv', 'application/csv'):
+        raw = upload.read() if upload is not None else request.get_data()
+        reader = csv.DictReader(io.StringIO(raw.decode('utf-8-sig')))
+        missing = [f for f in FEATURES if f not in (reader.fieldnames or [])]
+        if missing:
+            raise ValueError(f"CSV sem as colunas: {missing}")
+        return list(reader)
+
+    data = request.get_json(silent=True)
+    if isinstance(data, list):
+        return data
+    if isinstance(data, dict):
+        if not all(isinstance(data.get(f), list) for f in FEATURES):
+            raise ValueError(f"JSON colunar requer listas para os campos: {FEATURES}")
+        lengths = {len(data[f]) for f in FEATURES}
+        if len(lengths) != 1:
+            raise ValueError("Colunas do JSON colunar com tamanhos diferentes.")
+        return [dict(zip(FEATURES, values)) for values in zip(*(data[f] for f in FEATURES))]
+    raise ValueError("Envie um array JSON, um JSON colunar ou um CSV.")
+
+def _rows_to_matrix(rows):
+    """Valida as linhas e monta a matriz (n, 4); linhas inválidas ficam com NaN."""
+    X = np.full((len(rows), len(FEATURES)), np.nan, dtype=np.float64)
+    errors = {}
+    for i, row in enumerate(rows):
+        if not isinstance(row, dict):
+            errors[i] = "Linha não é um objeto."
+            continue
+        missing = [f for f in FEATURES if row.get(f) in (None, '')]
+        if missing:
+            errors[i] = f"Dados incompletos. Faltam os campos: {missing}"
+            continue
+        try:
+            X[i] = [_to_float(row[f]) for f in FEATURES]
+        except (TypeError, ValueError):
+            errors[i] = f"Valores não numéricos. Requer números finitos em: {FEATURES}"
+    return X, errors
+
+# ----------------------------------------------------
+# ENDPOINT DE INFERÊNCIA EM LOTE
+# POST /predict/soil_data/batch
+# ----------------------------------------------------
+@app.route('/predict/soil_data/batch', methods=['POST'])
+@metrics.instrument('/predict/soil_data/batch') # Latência total até o início do streaming
+def predict_soil_data_batch():
+    """Prediz várias linhas de solo/clima e devolve NDJSON (uma linha por entrada, na ordem)."""
+    bundle = fnn_bundle
+    
+    if bundle is None:
+        return startup.unavailable_response("Modelo ou pré-processador não carregado. Verifique os logs de inicialização.")
+
+    try:
+        with metrics.stage('parse'):
+            rows = _read_batch_rows()
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({"status": "error", "message": f"Payload inválido: {e}"}), 400
+
+    with metrics.stage('preprocess'):
+        X, errors = _rows_to_matrix(rows)
+        valid_mask = ~np.isnan(X).any(axis=1)
+
+    endpoint = '/predict/soil_data/batch' # O gerador roda depois que a view retornou
+
+    def generate():
+        for start in range(0, len(rows), PREDICT_CHUNK_SIZE):
+            end = min(start + PREDICT_CHUNK_SIZE, len(rows))
+            chunk_mask = valid_mask[start:end]
+            probas = iter(())
+            if chunk_mask.any():
+                with metrics.stage('predict', endpoint): # Um registro por bloco de PREDICT_CHUNK_SIZE linhas
+                    probas = iter(bundle.model.predict_proba(X[start:end][chunk_mask]).tolist())
+
+            with metrics.stage('serialize', endpoint):
+                lines = []
+                for i in range(start, end):
+                    if i in errors:
+                        lines.append({"row": i, "status": "error", "message": errors[i]})
+                        continue
+                    proba = next(probas)
+                    lines.append({
+                        "row": i,
+                        "status": "success",
+                        "prediction_label": "Rendimento Alto" if proba >= 0.5 else "Rendimento Normal/Baixo",
+                        "confidence_score": float(proba)
+                    })
+                chunk = ''.join(json.dumps(line, ensure_ascii=False) + '\n' for line in lines)
+            yield chunk
+
+        yield json.dumps({"status": "complete", "rows": len(rows), "errors": len(errors),
+                          "model_version": bundle.version}) + '\n'
+
+    # A versão também vai no cabeçalho, disponível antes do corpo em streaming
+    return Response(generate(), status=200, mimetype='application/x-ndjson',
+                    headers={'X-Model-Version': bundle.version})
+
+# ----------------------------------------------------
+# Estatísticas da ingestão
+# GET /stats/ingestion
+# ----------------------------------------------------
+@app.route('/stats/ingestion', methods=['GET'])
+def ingestion_stats():
+    """Retorna linhas ingeridas, gravadas e descartadas pelo writer de ingestão."""
+    return jsonify({"status": "success", **ingestion_writer.stats()}), 200
+
+# ----------------------------------------------------
+# Inicialização (servidor de desenvolvimento e Gunicorn)
+# ----------------------------------------------------
+def init_service():
+    """Carrega os artefatos em background (STARTUP_MODE=blocking para carga síncrona) e monitora model_artifacts/."""
+    reloader.start(load_fnn_artifacts, warmup_fnn, warmup_batch_sizes('1')) # Carga inicial sob o lock das recargas + monitor
+
 # ----------------------------------------------------
 # Execução do Servidor
 # ----------------------------------------------------
 if __name__ == '__main__':
-    # Roda o servidor na porta 5001
-    load_fnn_artifacts() 
+    # Roda o servidor na porta 5001 (produção: python -m fnn_service.serve)
+    init_service()
     print(f"Serviço FNN rodando em http://127.0.0.1:5001")
     # use_reloader=False é importante para evitar que o modelo carregue duas vezes
     app.run(port=5001, debug=True, use_reloader=False)
\ No newline at end of file
@@ -0,0 +1,82 @@
+import os
+import sys
+import joblib
+import numpy as np
+import pandas as pd
+from fnn_engine import NumpyFNN, fold_scaler
+
+# ----------------------------------------------------
+# Exporta a FNN (Keras .h5 + scaler.pkl) para o motor NumPy (.npz)
+# ----------------------------------------------------
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ARTIFACTS_DIR = os.path.join(BASE_DIR, 'model_artifacts')
+DATA_PATH = os.path.join(BASE_DIR, 'soil_database.csv')
+FEATURES = ['temperatura', 'umidade', 'chuva', 'ph']
+PARITY_TOLERANCE = 1e-5
+
+
+def build_engine(model, scaler):
+    """Extrai os pesos das camadas Dense e incorpora o scaler à primeira delas."""
+    weights, biases, activations = [], [], []
+    for layer in model.layers:
+        params = layer.get_weights()
+        if not params:
+            continue
+        if layer.__class__.__name__ != 'Dense':
+            raise ValueError(f"Camada não suportada pelo motor NumPy: {layer.name} ({layer.__class__.__name__})")
+        W, b = params
+        weights.append(W)
+        biases.append(b)
+        activations.append(layer.get_config().get('activation', 'linear'))
+    weights, biases = fold_scaler(weights, biases, scaler)
+    return NumpyFNN(weights, biases, activations, FEATURES)
+
+
+def check_parity(engine, model, scaler, X):
+    """Compara o motor NumPy com o modelo Keras; retorna a maior diferença absoluta."""
+    expected = model.predict(scaler.transform(X), verbose=0)
+    actual = engine.predict(X)
+    return float(np.max(np.abs(expected - actual)))
+
+
+def parity_inputs(n_random=1000, seed=42):
+    """Linhas do dataset de solo + amostras aleatórias dentro (e um pouco fora) da faixa observada."""
+    rows = []
+    if os.path.isfile(DATA_PATH):
+        rows.append(pd.read_csv(DATA_PATH)[FEATURES].values.astype(np.float64))
+    rng = np.random.default_rng(seed)
+    low = np.array([10.0, 30.0, 0.0, 4.0])
+    high = np.array([40.0, 100.0, 250.0, 8.5])
+    rows.append(rng.uniform(low, high, size=(n_random, len(FEATURES))))
+    return np.vstack(rows)
+
+
+def export_numpy_engine(model, scaler, output_path=None):
+    """Gera `fnn_model.npz` e valida a paridade com o modelo Keras."""
+    output_path = output_path or os.path.join(ARTIFACTS_DIR, 'fnn_model.npz')
+    engine = build_engine(model, scaler)
+    max_diff = check_parity(engine, model, scaler, parity_inputs())
+    if max_diff > PARITY_TOLERANCE:
+        raise ValueError(f"Paridade falhou: diferença máxima {max_diff:.3e} > {PARITY_TOLERANCE:.0e}")
+    engine.save(output_path)
+    print(f"Motor NumPy salvo em: {output_path} (diferença máxima vs Keras: {max_diff:.3e})")
+    return engine
+
+
+if __name__ == '__main__':
+    from tensorflow.keras.models import load_model
+
+    model_path = os.path.join(ARTIFACTS_DIR, 'fnn_model.h5')
+    scaler_path = os.path.join(ARTIFACTS_DIR, 'scaler.pkl')
+    try:
+        keras_model = load_model(model_path)
+        fitted_scaler = joblib.load(scaler_path)
+    except Exception as e:
+        print(f"ERRO ao carregar artefatos FNN. Execute o treinamento primeiro: {e}")
+        sys.exit(1)
+
+    try:
+        export_numpy_engine(keras_model, fitted_scaler)
+    except ValueError as e:
+        print(f"ERRO na exportação: {e}")
+        sys.exit(1)
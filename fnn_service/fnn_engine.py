@@ -0,0 +1,124 @@
+import numpy as np
+
+# ----------------------------------------------------
+# Motor de inferência da FNN em NumPy puro
+# ----------------------------------------------------
+# O artefato `fnn_model.npz` é gerado por `export_fnn.py`: o MinMaxScaler já
+# vem "dobrado" nos pesos da primeira camada, então a entrada é a linha crua
+# (temperatura, umidade, chuva, ph) e nenhuma dependência do TensorFlow ou do
+# scikit-learn é necessária para servir o modelo.
+
+ENGINE_FORMAT_VERSION = 1
+
+
+def _relu(z):
+    return np.maximum(z, 0.0)
+
+
+def _sigmoid(z):
+    with np.errstate(over='ignore'):
+        return 1.0 / (1.0 + np.exp(-z))
+
+
+def _linear(z):
+    return z
+
+
+ACTIVATIONS = {
+    'relu': _relu,
+    'sigmoid': _sigmoid,
+    'tanh': np.tanh,
+    'linear': _linear,
+}
+
+
+class NumpyFNN:
+    """Rede densa (Dense → ... → Dense) avaliada com NumPy."""
+
+    def __init__(self, weights, biases, activations, features=None):
+        if not (len(weights) == len(biases) == len(activations)):
+            raise ValueError("weights, biases e activations devem ter o mesmo tamanho")
+        unknown = [a for a in activations if a not in ACTIVATIONS]
+        if unknown:
+            raise ValueError(f"Ativações não suportadas: {unknown}")
+        self.weights = [np.ascontiguousarray(w, dtype=np.float64) for w in weights]
+        self.biases = [np.ascontiguousarray(b, dtype=np.float64) for b in biases]
+        self.activations = list(activations)
+        self._fns = [ACTIVATIONS[a] for a in self.activations]
+        self.features = list(features) if features is not None else None
+
+    @classmethod
+    def load(cls, path):
+        """Carrega o motor a partir do `.npz` exportado (sem pickle)."""
+        with np.load(path, allow_pickle=False) as data:
+            return cls.from_arrays(data)
+
+    @classmethod
+    def from_arrays(cls, data):
+        """Monta o motor a partir dos arrays do `.npz` (ou de um mapeamento com as mesmas chaves).
+
+        Arrays float64 contíguos, como os mapeados do registro (common/registry.py),
+        são usados sem cópia: os workers compartilham os pesos pelo page cache.
+        """
+        version = int(data['format_version'])
+        if version != ENGINE_FORMAT_VERSION:
+            raise ValueError(f"Versão de formato não suportada: {version}")
+        n_layers = int(data['n_layers'])
+        weights = [data[f'W{i}'] for i in range(n_layers)]
+        biases = [data[f'b{i}'] for i in range(n_layers)]
+        activations = [str(a) for a in data['activations']]
+        features = [str(f) for f in data['features']]
+        return cls(weights, biases, activations, features)
+
+    def save(self, path):
+        arrays = {f'W{i}': w for i, w in enumerate(self.weights)}
+        arrays.update({f'b{i}': b for i, b in enumerate(self.biases)})
+        np.savez(
+            path,
+            format_version=np.int64(ENGINE_FORMAT_VERSION),
+            n_layers=np.int64(len(self.weights)),
+            activations=np.array(self.activations),
+            features=np.array(self.features or []),
+            **arrays
+        )
+
+    def predict(self, X):
+        """Retorna as saídas (n, unidades_da_última_camada) para entradas cruas (n, 4)."""
+        h = np.asarray(X, dtype=np.float64)
+        if h.ndim == 1:
+            h = h.reshape(1, -1)
+        for W, b, fn in zip(self.weights, self.biases, self._fns):
+            h = fn(h @ W + b)
+        return h
+
+    def predict_proba(self, X):
+        """Probabilidade de 'Rendimento Alto' por linha, shape (n,)."""
+        return self.predict(X)[:, 0]
+
+
+class KerasFNN:
+    """Adaptador do modelo Keras + scaler para a mesma interface do NumpyFNN."""
+
+    def __init__(self, model, scaler):
+        self.model = model
+        self.scaler = scaler
+
+    def predict_proba(self, X):
+        X_scaled = self.scaler.transform(np.asarray(X, dtype=np.float64))
+        return self.model.predict(X_scaled, batch_size=len(X_scaled), verbose=0)[:, 0]
+
+
+def fold_scaler(weights, biases, scaler):
+    """Incorpora um MinMaxScaler (x * scale_ + min_) à primeira camada densa.
+
+    (x * s + m) @ W + b == x @ (s[:, None] * W) + (m @ W + b)
+    """
+    if getattr(scaler, 'clip', False):
+        raise ValueError("MinMaxScaler com clip=True não pode ser incorporado aos pesos")
+    scale = np.asarray(scaler.scale_, dtype=np.float64)
+    offset = np.asarray(scaler.min_, dtype=np.float64)
+    W0 = np.asarray(weights[0], dtype=np.float64)
+    b0 = np.asarray(biases[0], dtype=np.float64)
+    folded_w = [scale[:, None] * W0] + [np.asarray(w, dtype=np.float64) for w in weights[1:]]
+    folded_b = [offset @ W0 + b0] + [np.asarray(b, dtype=np.float64) for b in biases[1:]]
+    return folded_w, folded_b
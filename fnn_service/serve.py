@@ -0,0 +1,10 @@
+import os
+import sys
+
+# Servidor de produção do serviço FNN
+# Uso: python -m fnn_service.serve --workers 4 --threads 2
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Raiz do projeto (pacote common)
+from common.serving import serve
+
+if __name__ == '__main__':
+    serve('fnn')
@@ -1,11 +1,12 @@
-import pandas as pd
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import MinMaxScaler
-from tensorflow.keras.models import Sequential
+from tensorflow.keras.models import Sequential, load_model
 from tensorflow.keras.layers import Dense
 import joblib
 import os
+import sys
 import numpy as np
+from export_fnn import export_numpy_engine
 
 # Definindo caminhos
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -14,48 +15,86 @@ MODEL_PATH = os.path.join(BASE_DIR, 'fnn_model.h5')
 SCALER_PATH = os.path.join(BASE_DIR, 'scaler.pkl')
 os.makedirs(os.path.join(BASE_DIR, 'model_artifacts'), exist_ok=True) # Cria pasta para artefatos
 
+sys.path.insert(0, os.path.dirname(BASE_DIR)) # Raiz do projeto (pacote common)
+from common.columnar import read_dataset
+from common.retrain import TrainingWatermark, epochs_for, fine_tune_optimizer, plan_retrain, row_keys
+from common.training import TrainingMonitor, run_fingerprint, split_validation
+from common.registry import publish_artifacts
+
+# Definir Features (X) e Target (y)
+features = ['temperatura', 'umidade', 'chuva', 'ph']
+target = 'rendimento_alto'
+
 print(f"Lendo dados de: {DATA_PATH}")
 
-# 1. Carregar e preparar os dados
+# 1. Carregar e preparar os dados: partições Parquet compactadas (só as colunas usadas,
+# filtradas por TRAIN_SINCE/TRAIN_UNTIL=AAAA-MM-DD) + CSVs ainda não compactados
 try:
-    df = pd.read_csv(DATA_PATH)
+    df = read_dataset('soil', features + [target],
+                      since=os.environ.get('TRAIN_SINCE'), until=os.environ.get('TRAIN_UNTIL'))
 except FileNotFoundError:
     print(f"Erro: Arquivo de dados não encontrado em {DATA_PATH}. Certifique-se de ter executado a Etapa 2.")
     exit()
 
-# Definir Features (X) e Target (y)
-features = ['temperatura', 'umidade', 'chuva', 'ph']
-target = 'rendimento_alto'
+if df.empty:
+    print("Erro: Nenhuma linha no intervalo TRAIN_SINCE/TRAIN_UNTIL informado.")
+    exit()
+
+# Retreino incremental (RETRAIN_MODE=incremental): só as linhas novas desde a marca d'água + replay
+keys = row_keys(df, features + [target])
+plan = plan_retrain('fnn', keys)
+print(f"Modo de treino: {plan}")
+if plan.mode == 'skip':
+    exit()
 
 X = df[features].values
 y = df[target].values
 
-# 2. Pré-processamento
-# Normaliza os dados de entrada
-scaler = MinMaxScaler()
-X_scaled = scaler.fit_transform(X)
+if plan.mode == 'incremental':
+    # Warm start: modelo e scaler atuais (o scaler fica fixo para não deslocar as entradas já aprendidas)
+    model = load_model(os.path.join(BASE_DIR, 'model_artifacts', 'fnn_model.h5'))
+    scaler = joblib.load(os.path.join(BASE_DIR, 'model_artifacts', 'scaler.pkl'))
+    X_scaled = scaler.transform(X[plan.indices])
+    y = y[plan.indices]
+    epochs = epochs_for('fnn')
+    optimizer = fine_tune_optimizer()
+else:
+    # 2. Pré-processamento
+    # Normaliza os dados de entrada
+    scaler = MinMaxScaler()
+    X_scaled = scaler.fit_transform(X)
+    epochs = 50
+    optimizer = 'adam'
 
 # Divide em treino e teste (necessário para avaliação, mesmo com dataset pequeno)
 X_train, X_test, y_train, y_test = train_test_split(X_scaled, y, test_size=0.3, random_state=42)
 
 # 3. Construção e Treinamento do Modelo FNN
-model = Sequential([
-    # Input layer com 4 neurônios (número de features)
-    Dense(16, activation='relu', input_shape=(X_train.shape[1],)), 
-    Dense(8, activation='relu'),
-    # Output layer: 1 neurônio e 'sigmoid' para classificação binária
-    Dense(1, activation='sigmoid') 
-])
+if plan.mode == 'full':
+    model = Sequential([
+        # Input layer com 4 neurônios (número de features)
+        Dense(16, activation='relu', input_shape=(X_train.shape[1],)), 
+        Dense(8, activation='relu'),
+        # Output layer: 1 neurônio e 'sigmoid' para classificação binária
+        Dense(1, activation='sigmoid') 
+    ])
 
 # Compilação
-model.compile(optimizer='adam',
+model.compile(optimizer=optimizer,
               loss='binary_crossentropy', # Perda para classificação binária
               metrics=['accuracy'])
 
 print("Iniciando o treinamento do Modelo FNN...")
 
-# Treinamento
-history = model.fit(X_train, y_train, epochs=50, batch_size=4, verbose=0)
+# Treinamento: early stopping pela perda de validação, checkpoints e log por época (common/training.py).
+# Validação sorteada e estratificada pelo rótulo (não as últimas linhas, como no validation_split do Keras)
+fit_indices, val_indices = split_validation(y_train)
+validation_data = (X_train[val_indices], y_train[val_indices]) if len(val_indices) else None
+monitor = TrainingMonitor('fnn', run_fingerprint('fnn', plan.mode, keys, plan.indices, epochs=epochs, batch_size=4),
+                          samples=len(fit_indices), epochs=epochs, validation_samples=len(val_indices))
+model, initial_epoch = monitor.resume(model)
+history = model.fit(X_train[fit_indices], y_train[fit_indices], epochs=epochs, initial_epoch=initial_epoch, batch_size=4,
+                    validation_data=validation_data, callbacks=[monitor], verbose=0)
 
 # 4. Avaliação (Opcional, mas útil)
 loss, accuracy = model.evaluate(X_test, y_test, verbose=0)
@@ -67,4 +106,15 @@ model.save(os.path.join(BASE_DIR, 'model_artifacts', 'fnn_model.h5'))
 joblib.dump(scaler, os.path.join(BASE_DIR, 'model_artifacts', 'scaler.pkl'))
 
 print(f"Modelo salvo em: {os.path.join(BASE_DIR, 'model_artifacts', 'fnn_model.h5')}")
-print(f"Scaler salvo em: {os.path.join(BASE_DIR, 'model_artifacts', 'scaler.pkl')}")
\ No newline at end of file
+print(f"Scaler salvo em: {os.path.join(BASE_DIR, 'model_artifacts', 'scaler.pkl')}")
+
+# 6. Exportar o motor NumPy (scaler incorporado aos pesos) para a API servir sem TensorFlow
+export_numpy_engine(model, scaler, os.path.join(BASE_DIR, 'model_artifacts', 'fnn_model.npz'))
+
+# 7. Marca d'água: tudo o que existe hoje no dataset já foi visto por este modelo
+TrainingWatermark.save('fnn', keys, plan.mode, new_samples=plan.n_new, replay_samples=plan.n_replay)
+monitor.finish()
+
+# 8. Registro: versão imutável dos artefatos (checksums + metadados); o alias latest aponta para ela
+publish_artifacts('fnn', metadata={"mode": plan.mode, "test_accuracy": round(float(accuracy), 4),
+                                   "samples": int(len(X_train)), "epochs_run": monitor.epochs_run})
\ No newline at end of file
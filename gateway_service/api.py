@@ -0,0 +1,180 @@
+import os
+import sys
+import json
+import time
+import base64
+import binascii
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from flask import Flask, request, jsonify
+from model_backends import HttpBackend, InProcessBackend
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Raiz do projeto (pacote common)
+from common.metrics import ServiceMetrics, register_metrics_endpoint
+
+# ----------------------------------------------------
+# Gateway de inferência: uma visita de campo -> FNN + CNN + RNN em paralelo
+# ----------------------------------------------------
+# GATEWAY_MODE=http      - repassa para os três serviços (pool keep-alive por serviço)
+# GATEWAY_MODE=inprocess - hospeda os três modelos neste processo, sem saltos HTTP
+app = Flask(__name__)
+metrics = ServiceMetrics('gateway') # No modo inprocess o /metrics inclui também os três serviços
+register_metrics_endpoint(app)
+
+GATEWAY_MODE = os.environ.get('GATEWAY_MODE', 'http')
+CONNECT_TIMEOUT = float(os.environ.get('GATEWAY_CONNECT_TIMEOUT_S', '1'))
+POOL_SIZE = int(os.environ.get('GATEWAY_POOL_SIZE', '16')) # Conexões keep-alive por serviço
+MAX_WORKERS = int(os.environ.get('GATEWAY_MAX_WORKERS', '32')) # Sub-requisições simultâneas no processo
+
+# Chave na resposta -> serviço, endpoint e timeout total da sub-requisição
+MODELS = {
+    'soil': {'service': 'fnn', 'url': os.environ.get('FNN_URL', 'http://127.0.0.1:5001'),
+             'path': '/predict/soil_data', 'timeout': float(os.environ.get('GATEWAY_TIMEOUT_FNN_S', '2'))},
+    'leaf': {'service': 'cnn', 'url': os.environ.get('CNN_URL', 'http://127.0.0.1:5002'),
+             'path': '/predict/leaf_image', 'timeout': float(os.environ.get('GATEWAY_TIMEOUT_CNN_S', '10'))},
+    'note': {'service': 'rnn', 'url': os.environ.get('RNN_URL', 'http://127.0.0.1:5003'),
+             'path': '/predict/note', 'timeout': float(os.environ.get('GATEWAY_TIMEOUT_RNN_S', '5'))},
+}
+
+backends = {}
+executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='gateway')
+
+# ----------------------------------------------------
+# Fan-out com timeout por backend e resultados parciais
+# ----------------------------------------------------
+def fan_out(calls, method='POST'):
+    """Dispara as sub-requisições em paralelo; retorna ({chave: corpo + http_status + latency_ms}, total_ms).
+
+    Cada backend tem o seu prazo; quem não responde a tempo entra como erro 504
+    sem atrasar os demais.
+    """
+    started_at = time.perf_counter()
+    futures = {name: executor.submit(backends[name].call, method, path, **kwargs)
+               for name, (path, kwargs) in calls.items()}
+    results = {}
+    for name, future in futures.items():
+        timeout = backends[name].timeout
+        try:
+            status, body, latency_ms = future.result(timeout=max(0.0, timeout - (time.perf_counter() - started_at)))
+        except FutureTimeout:
+            status, latency_ms = 504, (time.perf_counter() - started_at) * 1000
+            body = {"status": "error", "message": f"Serviço {backends[name].name} não respondeu em {timeout:g}s."}
+        results[name] = dict(body, http_status=status, latency_ms=round(latency_ms, 2))
+    return results, (time.perf_counter() - started_at) * 1000
+
+
+def _read_field_visit():
+    """Sub-requisições da visita (JSON ou multipart); levanta ValueError com a mensagem de erro."""
+    if request.files or request.form:
+        soil = request.form.get('soil')
+        try:
+            soil = json.loads(soil) if soil else None
+        except ValueError:
+            raise ValueError("Campo 'soil' deve ser um JSON.")
+        note = request.form.get('note')
+        upload = request.files.get('image')
+        image, image_type = (upload.read(), upload.mimetype) if upload is not None else (None, None)
+    else:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            raise ValueError("JSON inválido. Envie 'soil', 'image_base64' e/ou 'note'.")
+        soil, note = data.get('soil'), data.get('note')
+        image, image_type = None, None
+        if data.get('image_base64'):
+            try:
+                image = base64.b64decode(data['image_base64'], validate=True)
+            except (binascii.Error, TypeError):
+                raise ValueError("Falha na decodificação do Base64.")
+
+    calls = {}
+    if soil is not None:
+        if not isinstance(soil, dict):
+            raise ValueError("'soil' deve ser um objeto com temperatura, umidade, chuva e ph.")
+        calls['soil'] = (MODELS['soil']['path'], {"json": soil})
+    if image:
+        # A CNN recebe a imagem como corpo binário, sem Base64
+        content_type = image_type if image_type and image_type.startswith('image/') else 'image/jpeg'
+        calls['leaf'] = (MODELS['leaf']['path'], {"data": image, "content_type": content_type})
+    if note is not None:
+        if not isinstance(note, str):
+            raise ValueError("'note' deve ser um texto.")
+        calls['note'] = (MODELS['note']['path'], {"json": {"nota": note}})
+    if not calls:
+        raise ValueError("Nada a avaliar. Envie ao menos 'soil', 'image_base64' (ou 'image') ou 'note'.")
+    return calls
+
+def _failure_status(results):
+    """HTTP de uma visita sem nenhum sucesso: erro do cliente só se todos os serviços o apontaram."""
+    statuses = {r["http_status"] for r in results.values()}
+    if all(400 <= status < 500 for status in statuses):
+        return statuses.pop() if len(statuses) == 1 else 400
+    return 502 # Timeout (504) ou falha do serviço (5xx): a culpa não é de quem chamou
+
+# ----------------------------------------------------
+# ENDPOINT DA VISITA DE CAMPO
+# POST /predict/field_visit
+# ----------------------------------------------------
+@app.route('/predict/field_visit', methods=['POST'])
+@metrics.instrument('/predict/field_visit')
+def predict_field_visit():
+    """Avalia solo (FNN), imagem foliar (CNN) e nota (RNN) de uma visita numa única chamada.
+
+    status: 'success' (todos responderam), 'partial' (algum falhou; os demais
+    resultados vêm mesmo assim) ou 'error' (nenhum respondeu). No 'error', o HTTP
+    é o 4xx dos serviços quando todos rejeitaram a entrada (400 se os códigos
+    diferem) e 502 quando algum falhou por timeout ou erro 5xx.
+    """
+    try:
+        with metrics.stage('parse'):
+            calls = _read_field_visit()
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    with metrics.stage('fan_out'):
+        results, total_ms = fan_out(calls)
+    succeeded = [name for name, r in results.items() if r["http_status"] == 200 and r.get("status") == "success"]
+    status = 'success' if len(succeeded) == len(results) else ('partial' if succeeded else 'error')
+    latency_ms = {name: r["latency_ms"] for name, r in results.items()}
+    latency_ms["total"] = round(total_ms, 2)
+    return jsonify({"status": status, "mode": GATEWAY_MODE, "results": results, "latency_ms": latency_ms}), \
+        (200 if succeeded else _failure_status(results))
+
+# ----------------------------------------------------
+# Prontidão: /ready de cada backend
+# GET /ready
+# ----------------------------------------------------
+@app.route('/ready', methods=['GET'])
+def ready():
+    """200 quando os três serviços estão prontos; 503 com o estado de cada um caso contrário."""
+    results, _ = fan_out({name: ('/ready', {}) for name in backends}, method='GET')
+    all_ready = all(r["http_status"] == 200 for r in results.values())
+    return jsonify({"service": "gateway", "mode": GATEWAY_MODE, "ready": all_ready, "backends": results}), \
+        (200 if all_ready else 503)
+
+# ----------------------------------------------------
+# Inicialização (servidor de desenvolvimento e Gunicorn)
+# ----------------------------------------------------
+def init_service():
+    """Cria os backends; no modo inprocess importa os três serviços e dispara a carga dos modelos."""
+    if backends:
+        return
+    if GATEWAY_MODE == 'inprocess':
+        from common.serving import import_service_api
+        for name, config in MODELS.items():
+            service_api = import_service_api(config['service'])
+            service_api.init_service()
+            backends[name] = InProcessBackend(config['service'], service_api.app, config['timeout'])
+    elif GATEWAY_MODE == 'http':
+        for name, config in MODELS.items():
+            backends[name] = HttpBackend(config['service'], config['url'], config['timeout'], CONNECT_TIMEOUT, POOL_SIZE)
+    else:
+        raise ValueError(f"GATEWAY_MODE inválido: {GATEWAY_MODE} (use 'http' ou 'inprocess')")
+    print(f"Gateway no modo {GATEWAY_MODE}: " + ', '.join(f"{n} -> {b.name}" for n, b in backends.items()))
+
+# ----------------------------------------------------
+# Execução do Servidor
+# ----------------------------------------------------
+if __name__ == '__main__':
+    # Roda o servidor na porta 5000 (produção: python -m gateway_service.serve)
+    init_service()
+    print(f"Gateway rodando em http://127.0.0.1:5000")
+    app.run(port=5000, debug=True, use_reloader=False)
@@ -0,0 +1,67 @@
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+# ----------------------------------------------------
+# Backends do gateway: chamada HTTP (pool keep-alive) ou WSGI no próprio processo
+# ----------------------------------------------------
+# As duas classes expõem a mesma interface, `call(method, path, ...)`, que
+# devolve (status HTTP, corpo JSON, latência em ms) e nunca levanta exceção:
+# falhas viram status 502/504 com a mensagem no corpo.
+
+
+def _error_body(message):
+    return {"status": "error", "message": message}
+
+
+class HttpBackend:
+    """Serviço remoto acessado por uma sessão HTTP com pool de conexões keep-alive."""
+
+    def __init__(self, name, url, timeout, connect_timeout=1.0, pool_size=16):
+        self.name = name
+        self.url = url.rstrip('/')
+        self.timeout = float(timeout)
+        self.connect_timeout = float(connect_timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def call(self, method, path, json=None, data=None, content_type=None):
+        headers = {"Content-Type": content_type} if content_type else None
+        started_at = time.perf_counter()
+        try:
+            response = self.session.request(method, f"{self.url}{path}", json=json, data=data, headers=headers,
+                                            timeout=(self.connect_timeout, self.timeout))
+            try:
+                body = response.json()
+            except ValueError:
+                body = _error_body(f"Resposta inválida do serviço {self.name} (HTTP {response.status_code}).")
+            status = response.status_code
+        except requests.exceptions.Timeout:
+            status, body = 504, _error_body(f"Serviço {self.name} não respondeu em {self.timeout:g}s.")
+        except requests.exceptions.RequestException:
+            status, body = 502, _error_body(f"Serviço {self.name} indisponível em {self.url}.")
+        return status, body, (time.perf_counter() - started_at) * 1000
+
+
+class InProcessBackend:
+    """Serviço hospedado no mesmo processo: a requisição vai direto ao app WSGI, sem rede."""
+
+    def __init__(self, name, app, timeout):
+        from werkzeug.test import Client
+        self.name = name
+        self.app = app
+        self.timeout = float(timeout)
+        self._client = Client(app, use_cookies=False) # Sem estado entre requisições: seguro entre threads
+
+    def call(self, method, path, json=None, data=None, content_type=None):
+        started_at = time.perf_counter()
+        try:
+            response = self._client.open(path, method=method, json=json, data=data, content_type=content_type)
+            status, body = response.status_code, response.get_json(silent=True)
+            if body is None:
+                body = _error_body(f"Resposta inválida do serviço {self.name} (HTTP {status}).")
+        except Exception as e:
+            status, body = 502, _error_body(f"Erro no serviço {self.name}: {e}")
+        return status, body, (time.perf_counter() - started_at) * 1000
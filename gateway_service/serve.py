@@ -0,0 +1,10 @@
+import os
+import sys
+
+# Servidor de produção do gateway
+# Uso: python -m gateway_service.serve --workers 2 --threads 16 (GATEWAY_MODE=inprocess hospeda os modelos)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Raiz do projeto (pacote common)
+from common.serving import serve
+
+if __name__ == '__main__':
+    serve('gateway')
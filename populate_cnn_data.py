@@ -1,78 +1,276 @@
-import requests
-import base64
 import os
+import sys
+import json
 import time
+import random
+import hashlib
+import argparse
+import mimetypes
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests
+from requests.adapters import HTTPAdapter
 
 # URL do endpoint de ingestão da CNN
 CNN_URL = 'http://127.0.0.1:5002/log/leaf_image'
+LABELS = ('saudavel', 'doente')
+MANIFEST_NAME = '.upload_manifest.jsonl'
+
+# ----------------------------------------------------
+# Envio em massa das imagens rotuladas para /log/leaf_image
+# ----------------------------------------------------
+# Uso: python populate_cnn_data.py <pasta> [--concurrency 8] [--retries 5] [--url ...]
+# O rótulo vem da subpasta (saudavel/ ou doente/) ou do nome do arquivo
+# (*_saudavel.jpg, *_doente.jpg). Cada envio bem-sucedido é registrado no
+# manifesto (hash do conteúdo), então rodar de novo só envia o que falta.
+
+# ----------------------------------------------------
+# 1. Identificação das imagens e rótulos
+# ----------------------------------------------------
+def image_content_type(file_path):
+    """Retorna o Content-Type da imagem a partir da extensão do arquivo (None se não for imagem)."""
+    content_type, _ = mimetypes.guess_type(file_path)
+    return content_type if content_type and content_type.startswith('image/') else None
+
+
+def label_for(file_path, source_dir):
+    """Rótulo pela subpasta ou, na falta dela, pelo sufixo do nome do arquivo."""
+    parts = os.path.relpath(file_path, source_dir).lower().split(os.sep)
+    for part in reversed(parts[:-1]):
+        if part in LABELS:
+            return part
+    name = parts[-1]
+    for label in LABELS:
+        if f'_{label}' in name:
+            return label
+    return None
+
+
+def collect_images(source_dir, recursive=True):
+    """Lista (caminho, rótulo) das imagens; arquivos sem rótulo voltam com rótulo None."""
+    items = []
+    for dirpath, dirnames, filenames in os.walk(source_dir):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith('.')) if recursive else []
+        for filename in sorted(filenames):
+            path = os.path.join(dirpath, filename)
+            if filename.startswith('.') or image_content_type(path) is None:
+                continue
+            items.append((path, label_for(path, source_dir)))
+    return items
+
 
 # ----------------------------------------------------
-# 1. Função para converter imagem em Base64
+# 2. Manifesto de retomada (hashes já enviados)
 # ----------------------------------------------------
-def image_to_base64(file_path):
-    """Lê um arquivo de imagem e retorna seu conteúdo em string Base64."""
-    with open(file_path, "rb") as image_file:
-        encoded_string = base64.b64encode(image_file.read()).decode('utf-8')
-    return encoded_string
+class UploadManifest:
+    """JSONL com uma linha por imagem enviada; thread-safe."""
+
+    def __init__(self, path):
+        self.path = path
+        self.hashes = set()
+        self._lock = threading.Lock()
+        if os.path.isfile(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        self.hashes.add(json.loads(line)["hash"])
+                    except (ValueError, KeyError):
+                        continue # Linha truncada por uma interrupção: a imagem é reenviada
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def claim(self, digest):
+        """Reserva o hash para envio; False se já foi enviado (ou está sendo, por um arquivo idêntico)."""
+        with self._lock:
+            if digest in self.hashes:
+                return False
+            self.hashes.add(digest)
+            return True
+
+    def release(self, digest):
+        with self._lock:
+            self.hashes.discard(digest)
+
+    def record(self, digest, file_path, label, size):
+        line = json.dumps({"hash": digest, "file": file_path, "label": label, "bytes": size,
+                           "uploaded_at": time.strftime('%Y-%m-%dT%H:%M:%S')}, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
 
 # ----------------------------------------------------
-# 2. Função para enviar a imagem
+# 3. Envio com sessão compartilhada e retentativas
 # ----------------------------------------------------
-def send_image_to_cnn(image_path, label):
-    """Converte e envia a imagem para a API."""
-    base64_data = image_to_base64(image_path)
+class RetryableError(Exception):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
 
-    payload = {
-        "image_base64": base64_data,
-        "label": label
-    }
+def create_session(concurrency):
+    """Sessão com pool de conexões keep-alive dimensionado para a concorrência."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=concurrency, max_retries=0)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
 
+
+def send_image_to_cnn(session, url, payload, content_type, label, timeout):
+    """Envia a imagem como corpo binário (image/*), sem Base64. Levanta RetryableError em falhas transitórias."""
     try:
-        response = requests.post(CNN_URL, json=payload)
-        response.raise_for_status()
-        
-        result = response.json()
-        print(f"   -> SUCESSO ({label}). Mensagem: {result.get('message')}")
-        
-    except requests.exceptions.RequestException as e:
-        print(f"   -> ERRO ao enviar a imagem. Verifique se o serviço da CNN está rodando na porta 5002.")
-        print(f"   Detalhe do Erro: {e}")
+        response = session.post(url, params={"label": label}, data=payload,
+                                headers={"Content-Type": content_type}, timeout=timeout)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+        raise RetryableError(str(e))
+    if response.status_code == 429 or response.status_code >= 500:
+        # 503 + Retry-After: serviço ainda carregando o modelo (/ready)
+        retry_after = response.headers.get('Retry-After')
+        raise RetryableError(f"HTTP {response.status_code}",
+                             float(retry_after) if retry_after and retry_after.isdigit() else None)
+    response.raise_for_status()
+    return response.json()
+
+
+class Uploader:
+    def __init__(self, url, concurrency=8, retries=5, backoff=0.5, max_backoff=30.0, timeout=30.0, manifest=None):
+        self.url = url
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.manifest = manifest
+        self.session = create_session(concurrency)
+        self._lock = threading.Lock()
+        self.uploaded = self.skipped = self.failed = self.retried = 0
+        self.bytes_sent = 0
+        self.latencies = []
+
+    def _sleep_before_retry(self, attempt, retry_after):
+        # Backoff exponencial com jitter (evita que todos os workers voltem juntos)
+        delay = min(self.max_backoff, self.backoff * (2 ** attempt)) * random.uniform(0.5, 1.0)
+        time.sleep(max(delay, retry_after or 0.0))
+
+    def upload(self, file_path, label):
+        """Envia um arquivo; retorna 'uploaded', 'skipped' ou 'failed'."""
+        with open(file_path, 'rb') as f:
+            payload = f.read()
+        digest = hashlib.blake2b(payload, digest_size=16).hexdigest()
+        if self.manifest is not None and not self.manifest.claim(digest):
+            with self._lock:
+                self.skipped += 1
+            return 'skipped'
+
+        for attempt in range(self.retries + 1):
+            started_at = time.perf_counter()
+            try:
+                send_image_to_cnn(self.session, self.url, payload, image_content_type(file_path), label, self.timeout)
+            except RetryableError as e:
+                if attempt == self.retries:
+                    print(f"   -> ERRO ({file_path}): {e} após {self.retries + 1} tentativas")
+                    break
+                with self._lock:
+                    self.retried += 1
+                self._sleep_before_retry(attempt, e.retry_after)
+                continue
+            except (requests.exceptions.RequestException, ValueError) as e:
+                print(f"   -> ERRO ({file_path}): {e}") # 4xx ou resposta inválida: não adianta repetir
+                break
+            with self._lock:
+                self.uploaded += 1
+                self.bytes_sent += len(payload)
+                self.latencies.append(time.perf_counter() - started_at)
+            if self.manifest is not None:
+                self.manifest.record(digest, file_path, label, len(payload))
+            return 'uploaded'
+
+        if self.manifest is not None:
+            self.manifest.release(digest)
+        with self._lock:
+            self.failed += 1
+        return 'failed'
+
+    def run(self, items, progress_interval=5.0):
+        started_at = time.perf_counter()
+        last_report = started_at
+        executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        try:
+            futures = [executor.submit(self.upload, path, label) for path, label in items]
+            for done, future in enumerate(as_completed(futures), start=1):
+                future.result()
+                now = time.perf_counter()
+                if now - last_report >= progress_interval:
+                    last_report = now
+                    print(f"   {done}/{len(items)} | {self.throughput(now - started_at)}")
+        except KeyboardInterrupt:
+            # Descarta a fila e espera só os envios em andamento; o manifesto guarda o progresso
+            print("\nInterrompido: aguardando os envios em andamento...")
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+        executor.shutdown(wait=True)
+        return time.perf_counter() - started_at
+
+    def throughput(self, elapsed):
+        elapsed = max(elapsed, 1e-9)
+        return f"{self.uploaded / elapsed:.1f} imagens/s, {self.bytes_sent / elapsed / 1e6:.2f} MB/s"
+
+    def summary(self, elapsed):
+        latencies = sorted(self.latencies)
+        p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0.0
+        p95 = latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0.0
+        return (f"Enviadas: {self.uploaded} | Já enviadas (manifesto): {self.skipped} | Falhas: {self.failed} | "
+                f"Retentativas: {self.retried}\n"
+                f"Tempo: {elapsed:.1f}s | {self.throughput(elapsed)} | {self.bytes_sent / 1e6:.1f} MB | "
+                f"latência p50 {p50:.0f} ms, p95 {p95:.0f} ms")
+
 
 # ----------------------------------------------------
-# 3. Execução Principal
+# 4. Execução Principal
 # ----------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Envia imagens rotuladas para /log/leaf_image da CNN")
+    parser.add_argument('source_dir', help="Pasta com as imagens (subpastas saudavel/ e doente/ ou *_<rótulo>.jpg)")
+    parser.add_argument('--url', default=CNN_URL)
+    parser.add_argument('--concurrency', type=int, default=8, help="Envios simultâneos (conexões do pool)")
+    parser.add_argument('--retries', type=int, default=5, help="Retentativas por imagem em falhas transitórias")
+    parser.add_argument('--backoff', type=float, default=0.5, help="Espera base (s) do backoff exponencial")
+    parser.add_argument('--timeout', type=float, default=30.0, help="Timeout (s) de cada requisição")
+    parser.add_argument('--manifest', help=f"Manifesto de retomada (padrão: <pasta>/{MANIFEST_NAME})")
+    parser.add_argument('--no-resume', action='store_true', help="Ignora o manifesto e envia tudo de novo")
+    parser.add_argument('--no-recursive', action='store_true', help="Não percorre subpastas")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.source_dir):
+        print(f"ERRO: O diretório de origem '{args.source_dir}' não foi encontrado.")
+        sys.exit(1)
+
+    items = collect_images(args.source_dir, recursive=not args.no_recursive)
+    unlabeled = [path for path, label in items if label is None]
+    for path in unlabeled:
+        print(f"AVISO: Arquivo '{path}' ignorado. Não está em saudavel/ ou doente/ nem possui '_saudavel' ou '_doente' no nome.")
+    items = [(path, label) for path, label in items if label is not None]
+
+    manifest = None
+    if not args.no_resume:
+        manifest = UploadManifest(args.manifest or os.path.join(args.source_dir, MANIFEST_NAME))
+        print(f"Manifesto: {manifest.path} ({len(manifest.hashes)} imagens já enviadas)")
+
+    print(f"Iniciando ingestão de {len(items)} imagens de {args.source_dir} -> {args.url} "
+          f"(concorrência {args.concurrency})")
+    uploader = Uploader(args.url, args.concurrency, args.retries, args.backoff, timeout=args.timeout, manifest=manifest)
+    try:
+        elapsed = uploader.run(items)
+    finally:
+        if manifest is not None:
+            manifest.close()
+
+    print(f"\n--- Ingestão de imagens concluída. ---\n{uploader.summary(elapsed)}")
+    sys.exit(1 if uploader.failed else 0)
+
+
 if __name__ == '__main__':
-    SOURCE_DIR = r'C:/Users/Usuário/Desktop/Projeto agro/agrointeligencia/cnn_service/Imagens_Para_Enviar'
-    
-    if not os.path.isdir(SOURCE_DIR):
-        print(f"ERRO: O diretório de origem '{SOURCE_DIR}' não foi encontrado.")
-        exit()
-
-    print(f"Iniciando ingestão de imagens a partir de: {SOURCE_DIR}")
-    
-    ingested_count = 0
-    
-    # Percorre todos os arquivos na pasta
-    for filename in os.listdir(SOURCE_DIR):
-        file_path = os.path.join(SOURCE_DIR, filename)
-        
-        # Ignora subpastas
-        if os.path.isdir(file_path):
-            continue
-            
-        # 1. Determina o rótulo baseado no nome do arquivo
-        label = None
-        if '_saudavel' in filename.lower():
-            label = 'saudavel'
-        elif '_doente' in filename.lower():
-            label = 'doente'
-        
-        if label:
-            print(f"Processando arquivo: {filename}")
-            send_image_to_cnn(file_path, label)
-            ingested_count += 1
-            time.sleep(0.1)
-        else:
-            print(f"AVISO: Arquivo '{filename}' ignorado. Não possui '_saudavel' ou '_doente' no nome.")
-
-    print(f"\n--- Ingestão de imagens concluída. Total de {ingested_count} imagens enviadas. ---")
\ No newline at end of file
+    main()
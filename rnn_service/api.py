@@ -1,60 +1,120 @@
 import os
-import csv
+import sys
+import time
 import joblib # Novo: Para carregar o Tokenizer
 import numpy as np # Novo: Para manipular arrays
 from flask import Flask, request, jsonify
-from tensorflow.keras.models import load_model # Novo: Para carregar o modelo Keras
-from tensorflow.keras.preprocessing.sequence import pad_sequences # Novo: Para padronizar sequências
+from note_tokenizer import NoteTokenizer, KerasNoteTokenizer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # Raiz do projeto (pacote common)
+from common.startup import StartupState, register_ready_endpoint, warmup_batch_sizes
+from common.ingestion import create_writer
+from common.metrics import ServiceMetrics, register_metrics_endpoint
+from common.hot_reload import ModelBundle, ModelReloader, register_reload_endpoints
+from common.registry import ArtifactSource
 
 app = Flask(__name__)
-CSV_FILE = 'field_notes_database.csv'
+startup = StartupState('rnn')
+register_ready_endpoint(app, startup)
+metrics = ServiceMetrics('rnn') # Contagens e latência por etapa em GET /metrics (METRICS_ENABLED=0 desliga)
+register_metrics_endpoint(app)
+CSV_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'field_notes_database.csv') # Independe do diretório de trabalho
 HEADERS = ["nota", "rotulo"]
+ingestion_writer = create_writer(CSV_FILE, HEADERS) # Configurado pelas variáveis INGEST_*
 
-# Variáveis globais para armazenar o modelo e o pré-processador
-rnn_model = None
-tokenizer = None
+# Modelo + tokenizer + versão ativos, trocados juntos na recarga a quente
+rnn_bundle = None
 MAX_LEN = 50 # Comprimento máximo da sequência usado no treinamento
-MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model_artifacts')
+MODEL_DIR = os.environ.get('RNN_MODEL_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model_artifacts'))
+RNN_TOKENIZER = os.environ.get('RNN_TOKENIZER', 'auto') # auto | fast | keras
+ARTIFACTS = ('rnn_model.h5', 'tokenizer_vocab.json', 'tokenizer.pkl') # Compõem a versão do modelo
+# Versão do registro (common/registry.py): latest, vNNNN ou vazio (só MODEL_DIR); sem registro usa MODEL_DIR
+MODEL_VERSION = os.environ.get('RNN_MODEL_VERSION', 'latest')
+model_source = ArtifactSource('rnn', MODEL_VERSION, MODEL_DIR, ARTIFACTS)
+
+# Predição em lote: comprimentos dos buckets (em tokens) e tamanho máximo de cada predict
+BUCKET_LENGTHS = tuple(sorted(int(n) for n in os.environ.get('RNN_BUCKET_LENGTHS', '10,20,30,40,50').split(',') if n.strip()))
+PREDICT_BATCH_SIZE = int(os.environ.get('RNN_PREDICT_BATCH_SIZE', '256'))
 
 # ----------------------------------------------------
 # Função de Carga (Nova)
 # ----------------------------------------------------
-def load_rnn_artifacts():
-    """Carrega o modelo RNN (LSTM) e o Tokenizer na memória."""
-    global rnn_model, tokenizer
-    try:
+def build_rnn_bundle(phase):
+    """Carrega o modelo RNN (LSTM) e o Tokenizer (registro ou MODEL_DIR) num bundle novo."""
+    with phase('verify'):
+        entry, version = model_source.open()
+    # Import tardio do TensorFlow: o servidor HTTP sobe antes desta etapa
+    with phase('import'):
+        from tensorflow.keras.models import load_model
+
+    with phase('load'):
         # Carrega o modelo
-        model_path = os.path.join(MODEL_DIR, 'rnn_model.h5')
-        rnn_model = load_model(model_path)
-        print(f"Modelo RNN carregado com sucesso de: {model_path}")
+        model_path = model_source.path(entry, 'rnn_model.h5')
+        model = load_model(model_path)
+        print(f"Modelo RNN carregado com sucesso de: {model_path} (versão {version})")
         
-        # Carrega o tokenizer (pré-processador)
-        tokenizer_path = os.path.join(MODEL_DIR, 'tokenizer.pkl')
-        tokenizer = joblib.load(tokenizer_path)
-        print(f"Tokenizer carregado com sucesso de: {tokenizer_path}")
+        # Carrega o tokenizer (pré-processador): vocabulário JSON (rápido) ou pickle do Keras
+        vocab_path = model_source.path(entry, 'tokenizer_vocab.json')
+        if RNN_TOKENIZER == 'fast' or (RNN_TOKENIZER == 'auto' and model_source.exists(entry, 'tokenizer_vocab.json')):
+            tokenizer = NoteTokenizer.load(vocab_path)
+            print(f"Tokenizer rápido carregado com sucesso de: {vocab_path}")
+        else:
+            tokenizer_path = model_source.path(entry, 'tokenizer.pkl')
+            tokenizer = KerasNoteTokenizer(joblib.load(tokenizer_path), MAX_LEN)
+            print(f"Tokenizer carregado com sucesso de: {tokenizer_path}")
+    return ModelBundle(model, version, preprocessor=tokenizer)
+
+def load_rnn_artifacts():
+    """Carrega o modelo RNN (LSTM) e o Tokenizer na memória (inicialização)."""
+    global rnn_bundle
+    try:
+        rnn_bundle = build_rnn_bundle(startup.phase)
+        return True
         
     except Exception as e:
         print(f"ERRO ao carregar artefatos RNN. Execute Etapa 3: {e}")
-        rnn_model = None
-        tokenizer = None
+        rnn_bundle = None
+        return False
+
+def masks_padding(model):
+    """True se o modelo ignora o padding (Embedding com mask_zero=True).
+
+    Só nesse caso cortar os zeros do final da sequência preserva a predição;
+    sem máscara, a LSTM também processa os passos de padding.
+    """
+    return any(getattr(layer, 'mask_zero', False) for layer in model.layers)
+
+def bucket_length(n_tokens):
+    """Menor bucket que comporta a nota (limitado a MAX_LEN)."""
+    for length in BUCKET_LENGTHS:
+        if n_tokens <= length:
+            return min(length, MAX_LEN)
+    return MAX_LEN
+
+def warmup_rnn(batch_size, bundle=None):
+    """Roda um lote fictício para que a primeira requisição real não pague o tracing do grafo."""
+    model = (bundle or rnn_bundle).model
+    model.predict(np.zeros((batch_size, MAX_LEN), dtype=np.int32), verbose=0)
+    if masks_padding(model):
+        # Um traçado por comprimento de bucket usado em /predict/note/batch
+        for length in sorted({bucket_length(n) for n in BUCKET_LENGTHS}):
+            model.predict(np.ones((batch_size, length), dtype=np.int32), verbose=0)
+
+def swap_rnn_bundle(bundle):
+    global rnn_bundle
+    rnn_bundle = bundle
+
+reloader = ModelReloader(startup, MODEL_DIR, ARTIFACTS, build_rnn_bundle, warmup_rnn, warmup_batch_sizes('1'),
+                         swap_rnn_bundle, lambda: rnn_bundle,
+                         version_fn=model_source.version, signature_fn=model_source.signature)
+register_reload_endpoints(app, reloader)
 
 # ----------------------------------------------------
-# Função utilitária para salvar os dados (Sem Alteração na Lógica)
+# Função utilitária para salvar os dados
 # ----------------------------------------------------
 def append_to_csv(data):
-    file_exists = os.path.isfile(CSV_FILE)
-    
-    try:
-        with open(CSV_FILE, mode='a', newline='', encoding='utf-8') as file:
-            writer = csv.DictWriter(file, fieldnames=HEADERS, delimiter=',')
-            if not file_exists:
-                writer.writeheader()
-            writer.writerow(data)
-        
-        return True
-    except Exception as e:
-        print(f"Erro ao salvar CSV: {e}")
-        return False
+    """Anexa uma linha ao CSV pelo writer de ingestão (group commit, seguro entre workers)."""
+    return ingestion_writer.append(data)
 
 # ----------------------------------------------------
 # ENDPOINT DE INGESTÃO (/log) (Sem Alteração na Lógica)
@@ -88,15 +148,17 @@ def log_note():
 # POST /predict/note
 # ----------------------------------------------------
 @app.route('/predict/note', methods=['POST'])
+@metrics.instrument('/predict/note')
 def predict_note():
     """Recebe uma nota de texto e retorna a predição de urgência."""
-    global rnn_model, tokenizer
+    bundle = rnn_bundle # Referência única: uma recarga no meio da requisição não a afeta
     
-    if rnn_model is None or tokenizer is None:
-        return jsonify({"status": "error", "message": "Modelo ou pré-processador não carregado. Verifique os logs de inicialização."}), 503
+    if bundle is None:
+        return startup.unavailable_response("Modelo ou pré-processador não carregado. Verifique os logs de inicialização.")
 
     try:
-        data = request.get_json()
+        with metrics.stage('parse'):
+            data = request.get_json()
         if not data or 'nota' not in data:
             return jsonify({"status": "error", "message": "Dados incompletos. Requer 'nota'."}), 400
     except Exception:
@@ -106,29 +168,128 @@ def predict_note():
         input_note = data['nota']
         
         # 1. Pré-processamento: Tokenizar e Padronizar a sequência
-        sequence = tokenizer.texts_to_sequences([input_note])
-        padded_sequence = pad_sequences(sequence, maxlen=MAX_LEN, padding='post', truncating='post')
+        with metrics.stage('tokenize'):
+            padded_sequence = bundle.preprocessor.encode_batch([input_note], MAX_LEN)
         
         # 2. Predição
-        prediction_proba = rnn_model.predict(padded_sequence)[0][0]
+        with metrics.stage('predict'):
+            prediction_proba = bundle.model.predict(padded_sequence, verbose=0)[0][0]
         
         # 3. Decisão final (limite de 0.5)
         prediction_label = "Urgente" if prediction_proba >= 0.5 else "Rotina"
         
-        return jsonify({
-            "status": "success",
-            "prediction_label": prediction_label,
-            "confidence_score": float(prediction_proba)
-        }), 200
+        with metrics.stage('serialize'):
+            response = jsonify({
+                "status": "success",
+                "prediction_label": prediction_label,
+                "confidence_score": float(prediction_proba),
+                "model_version": bundle.version
+            })
+        return response, 200
+
+    except Exception as e:
+        return jsonify({"status": "error", "message": f"Erro interno durante a predição: {e}"}), 500
+
+# ----------------------------------------------------
+# ENDPOINT DE INFERÊNCIA EM LOTE
+# POST /predict/note/batch
+# ----------------------------------------------------
+@app.route('/predict/note/batch', methods=['POST'])
+@metrics.instrument('/predict/note/batch')
+def predict_note_batch():
+    """Recebe várias notas ({"notas": [...]} ou um array JSON) e retorna as predições na ordem original."""
+    bundle = rnn_bundle
+    
+    if bundle is None:
+        return startup.unavailable_response("Modelo ou pré-processador não carregado. Verifique os logs de inicialização.")
+
+    with metrics.stage('parse'):
+        data = request.get_json(silent=True)
+    notes = data.get('notas') if isinstance(data, dict) else data
+    if not isinstance(notes, list):
+        return jsonify({"status": "error", "message": "Dados incompletos. Requer 'notas' (lista de textos) ou um array JSON."}), 400
+
+    try:
+        model, tok = bundle.model, bundle.preprocessor
+        started_at = time.perf_counter()
+        valid = [i for i, note in enumerate(notes) if isinstance(note, str)]
+
+        # 1. Tokenização de todas as notas num único array (n, MAX_LEN)
+        with metrics.stage('tokenize'):
+            sequences = tok.encode_batch([notes[i] for i in valid], MAX_LEN)
+            lengths = np.count_nonzero(sequences, axis=1)
+        tokenized_at = time.perf_counter()
+
+        # 2. Buckets por comprimento: com máscara de padding, cada bucket roda só até o seu comprimento
+        if masks_padding(model):
+            bucket_of = np.array([bucket_length(n) for n in lengths], dtype=np.int32)
+        else:
+            bucket_of = np.full(len(valid), MAX_LEN, dtype=np.int32)
+        order = np.argsort(bucket_of, kind='stable')
+
+        probas = np.empty(len(valid), dtype=np.float64)
+        buckets = []
+        for length in np.unique(bucket_of):
+            idx = order[bucket_of[order] == length]
+            for start in range(0, len(idx), PREDICT_BATCH_SIZE):
+                chunk = idx[start:start + PREDICT_BATCH_SIZE]
+                with metrics.stage('predict'): # Um registro por lote de até PREDICT_BATCH_SIZE notas
+                    probas[chunk] = model.predict(sequences[chunk, :length], batch_size=len(chunk), verbose=0)[:, 0]
+            buckets.append({"length": int(length), "notes": int(len(idx))})
+        finished_at = time.perf_counter()
+
+        # 3. Resultados na ordem original (notas que não são texto viram erro individual)
+        results = [{"index": i, "status": "error", "message": "Nota deve ser um texto."} for i in range(len(notes))]
+        for position, i in enumerate(valid):
+            proba = float(probas[position])
+            results[i] = {
+                "index": i,
+                "status": "success",
+                "prediction_label": "Urgente" if proba >= 0.5 else "Rotina",
+                "confidence_score": proba
+            }
+
+        total_s = finished_at - started_at
+        with metrics.stage('serialize'):
+            response = jsonify({
+                "status": "success",
+                "results": results,
+                "model_version": bundle.version,
+                "buckets": buckets,
+                "timing": {
+                    "notes": len(valid),
+                    "tokenize_ms": round((tokenized_at - started_at) * 1000.0, 3),
+                    "predict_ms": round((finished_at - tokenized_at) * 1000.0, 3),
+                    "total_ms": round(total_s * 1000.0, 3),
+                    "notes_per_s": round(len(valid) / total_s, 1) if total_s > 0 else None
+                }
+            })
+        return response, 200
 
     except Exception as e:
         return jsonify({"status": "error", "message": f"Erro interno durante a predição: {e}"}), 500
 
+# ----------------------------------------------------
+# Estatísticas da ingestão
+# GET /stats/ingestion
+# ----------------------------------------------------
+@app.route('/stats/ingestion', methods=['GET'])
+def ingestion_stats():
+    """Retorna linhas ingeridas, gravadas e descartadas pelo writer de ingestão."""
+    return jsonify({"status": "success", **ingestion_writer.stats()}), 200
+
+# ----------------------------------------------------
+# Inicialização (servidor de desenvolvimento e Gunicorn)
+# ----------------------------------------------------
+def init_service():
+    """Carrega os artefatos em background (STARTUP_MODE=blocking para carga síncrona) e monitora model_artifacts/."""
+    reloader.start(load_rnn_artifacts, warmup_rnn, warmup_batch_sizes('1')) # Carga inicial sob o lock das recargas + monitor
+
 # ----------------------------------------------------
 # Execução do Servidor
 # ----------------------------------------------------
 if __name__ == '__main__':
-    # Roda o servidor na porta 5003
-    load_rnn_artifacts() # Novo: Carrega o modelo ao iniciar
+    # Roda o servidor na porta 5003 (produção: python -m rnn_service.serve)
+    init_service()
     print(f"Serviço RNN rodando em http://127.0.0.1:5003")
     app.run(port=5003, debug=True, use_reloader=False)
\ No newline at end of file
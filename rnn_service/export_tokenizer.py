@@ -0,0 +1,71 @@
+import os
+import sys
+import json
+import joblib
+import numpy as np
+import pandas as pd
+from note_tokenizer import NoteTokenizer, vocab_from_keras
+
+# ----------------------------------------------------
+# Exporta o Tokenizer do Keras (tokenizer.pkl) para o vocabulário JSON versionado
+# ----------------------------------------------------
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ARTIFACTS_DIR = os.path.join(BASE_DIR, 'model_artifacts')
+DATA_PATH = os.path.join(BASE_DIR, 'field_notes_database.csv')
+MAX_LEN = 50
+
+# Casos de borda da paridade: pontuação, maiúsculas, acentos, espaços repetidos, vazio e notas longas
+EDGE_CASES = [
+    "",
+    "   ",
+    "URGENTE!!! Praga detectada no setor norte.",
+    "Irrigação  concluída,sem\tanomalias;\nverificar amanhã?",
+    "palavra_desconhecida xyzzy <OOV> oov",
+    "ação, coração: pH=6.5 (ok) [rotina] {teste} ~fim~",
+    " ".join(["solo"] * (MAX_LEN + 25)),
+]
+
+
+def check_parity(fast_tokenizer, keras_tokenizer, texts, max_len=MAX_LEN):
+    """Compara com texts_to_sequences + pad_sequences; retorna os textos divergentes."""
+    from tensorflow.keras.preprocessing.sequence import pad_sequences
+    expected = pad_sequences(keras_tokenizer.texts_to_sequences(texts), maxlen=max_len,
+                             padding='post', truncating='post')
+    actual = fast_tokenizer.encode_batch(texts, max_len)
+    mismatched = np.flatnonzero((expected != actual).any(axis=1))
+    return [texts[i] for i in mismatched]
+
+
+def parity_texts():
+    texts = list(EDGE_CASES)
+    if os.path.isfile(DATA_PATH):
+        texts += pd.read_csv(DATA_PATH)['nota'].astype(str).tolist()
+    return texts
+
+
+def export_vocab(keras_tokenizer, output_path=None, max_len=MAX_LEN):
+    """Gera `tokenizer_vocab.json` e valida a paridade com o Tokenizer do Keras."""
+    output_path = output_path or os.path.join(ARTIFACTS_DIR, 'tokenizer_vocab.json')
+    spec = vocab_from_keras(keras_tokenizer, max_len)
+    mismatched = check_parity(NoteTokenizer(spec), keras_tokenizer, parity_texts(), max_len)
+    if mismatched:
+        raise ValueError(f"Paridade falhou em {len(mismatched)} nota(s), ex.: {mismatched[0]!r}")
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(spec, f, ensure_ascii=False, separators=(',', ':'))
+    print(f"Vocabulário salvo em: {output_path} ({len(spec['vocab'])} palavras, paridade com o Keras verificada)")
+    return spec
+
+
+if __name__ == '__main__':
+    tokenizer_path = os.path.join(ARTIFACTS_DIR, 'tokenizer.pkl')
+    try:
+        tokenizer = joblib.load(tokenizer_path)
+    except Exception as e:
+        print(f"ERRO ao carregar o Tokenizer. Execute o treinamento primeiro: {e}")
+        sys.exit(1)
+
+    try:
+        export_vocab(tokenizer)
+    except ValueError as e:
+        print(f"ERRO na exportação: {e}")
+        sys.exit(1)
@@ -0,0 +1,94 @@
+import json
+import numpy as np
+
+# ----------------------------------------------------
+# Tokenizer das notas de campo sem dependência do Keras
+# ----------------------------------------------------
+# Lê o vocabulário exportado por `export_tokenizer.py` (JSON versionado) e
+# reproduz `Tokenizer.texts_to_sequences` + `pad_sequences(padding='post',
+# truncating='post')`, escrevendo o lote inteiro num array int32 pré-alocado.
+
+VOCAB_FORMAT_VERSION = 1
+
+
+def vocab_from_keras(tokenizer, max_len):
+    """Extrai do Tokenizer do Keras o vocabulário efetivo (índices < num_words)."""
+    if tokenizer.char_level or getattr(tokenizer, 'analyzer', None) is not None:
+        raise ValueError("Somente tokenizers por palavra, sem analyzer customizado, são suportados")
+    limit = tokenizer.num_words or (len(tokenizer.word_index) + 1)
+    # vocab[i - 1] é a palavra de índice i; índices >= num_words viram <OOV> (ou são descartados)
+    vocab = [w for w, i in sorted(tokenizer.word_index.items(), key=lambda item: item[1]) if i < limit]
+    return {
+        "format_version": VOCAB_FORMAT_VERSION,
+        "num_words": tokenizer.num_words,
+        "oov_token": tokenizer.oov_token,
+        "filters": tokenizer.filters,
+        "lower": tokenizer.lower,
+        "split": tokenizer.split,
+        "max_len": max_len,
+        "vocab": vocab,
+    }
+
+
+class NoteTokenizer:
+    """Codifica lotes de notas em (batch, max_len) int32 com a semântica do Keras."""
+
+    def __init__(self, spec):
+        if spec.get("format_version") != VOCAB_FORMAT_VERSION:
+            raise ValueError(f"Versão de vocabulário não suportada: {spec.get('format_version')}")
+        self.lower = spec["lower"]
+        self.split = spec["split"]
+        self.max_len = spec["max_len"]
+        self.oov_token = spec["oov_token"]
+        self.word_index = {w: i for i, w in enumerate(spec["vocab"], start=1)}
+        self.oov_index = self.word_index.get(self.oov_token) if self.oov_token is not None else None
+        self._table = str.maketrans({c: self.split for c in spec["filters"]})
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def tokenize(self, text):
+        """Equivalente a `text_to_word_sequence` do Keras."""
+        if self.lower:
+            text = text.lower()
+        return [w for w in text.translate(self._table).split(self.split) if w]
+
+    def encode(self, text):
+        """Lista de índices da nota (sem padding), como `texts_to_sequences`."""
+        get = self.word_index.get
+        if self.oov_index is not None:
+            oov = self.oov_index
+            return [get(w, oov) for w in self.tokenize(text)]
+        return [i for i in map(get, self.tokenize(text)) if i is not None]
+
+    def encode_batch(self, texts, max_len=None, out=None):
+        """Codifica o lote num array (len(texts), max_len) int32 com padding/truncagem 'post'."""
+        max_len = max_len or self.max_len
+        if out is None:
+            out = np.zeros((len(texts), max_len), dtype=np.int32)
+        else:
+            out[:len(texts)] = 0
+        for row, text in enumerate(texts):
+            ids = self.encode(text)[:max_len]
+            out[row, :len(ids)] = ids
+        return out
+
+
+class KerasNoteTokenizer:
+    """Adaptador do Tokenizer do Keras (pickle) para a mesma interface do NoteTokenizer."""
+
+    def __init__(self, tokenizer, max_len):
+        self.tokenizer = tokenizer
+        self.max_len = max_len
+
+    def encode_batch(self, texts, max_len=None, out=None):
+        from tensorflow.keras.preprocessing.sequence import pad_sequences
+        max_len = max_len or self.max_len
+        sequences = self.tokenizer.texts_to_sequences(list(texts))
+        padded = pad_sequences(sequences, maxlen=max_len, padding='post', truncating='post').astype(np.int32)
+        if out is None:
+            return padded
+        out[:len(texts)] = padded
+        return out
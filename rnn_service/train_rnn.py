@@ -1,12 +1,13 @@
-import pandas as pd
 from sklearn.model_selection import train_test_split
 from tensorflow.keras.preprocessing.text import Tokenizer
 from tensorflow.keras.preprocessing.sequence import pad_sequences
-from tensorflow.keras.models import Sequential
+from tensorflow.keras.models import Sequential, load_model
 from tensorflow.keras.layers import Embedding, LSTM, Dense
 import joblib
 import os
+import sys
 import numpy as np
+from export_tokenizer import export_vocab
 
 # Definindo caminhos
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -15,33 +16,68 @@ MODEL_PATH = os.path.join(BASE_DIR, 'rnn_model.h5')
 TOKENIZER_PATH = os.path.join(BASE_DIR, 'tokenizer.pkl')
 os.makedirs(os.path.join(BASE_DIR, 'model_artifacts'), exist_ok=True) # Cria pasta para artefatos
 
+sys.path.insert(0, os.path.dirname(BASE_DIR)) # Raiz do projeto (pacote common)
+from common.columnar import read_dataset
+from common.retrain import TrainingWatermark, epochs_for, fine_tune_optimizer, plan_retrain, row_keys
+from common.training import TrainingMonitor, run_fingerprint, split_validation
+from common.registry import publish_artifacts
+
+# Retreino incremental: acima desta fração de palavras fora do vocabulário nas notas
+# novas o tokenizer atual não as representa bem, e o treino volta a ser completo
+MAX_NEW_OOV_RATE = float(os.environ.get('RNN_RETRAIN_MAX_OOV', '0.3'))
+
 print(f"Lendo dados de: {DATA_PATH}")
 
-# 1. Carregar e preparar os dados
+# 1. Carregar e preparar os dados: partições Parquet compactadas (só as colunas usadas,
+# filtradas por TRAIN_SINCE/TRAIN_UNTIL=AAAA-MM-DD) + CSVs ainda não compactados
 try:
-    df = pd.read_csv(DATA_PATH)
+    df = read_dataset('notes', ['nota', 'rotulo'],
+                      since=os.environ.get('TRAIN_SINCE'), until=os.environ.get('TRAIN_UNTIL'))
 except FileNotFoundError:
     print(f"Erro: Arquivo de dados não encontrado em {DATA_PATH}. Certifique-se de ter executado a Etapa 2.")
     exit()
 
+if df.empty:
+    print("Erro: Nenhuma linha no intervalo TRAIN_SINCE/TRAIN_UNTIL informado.")
+    exit()
+
 # Mapear rótulos de texto para valores numéricos (0 e 1)
 label_map = {'rotina': 0, 'urgente': 1}
 df['rotulo_encoded'] = df['rotulo'].map(label_map)
 
-X = df['nota'].astype(str).values
+X = df['nota'].astype(str).to_numpy(dtype=object) # NumPy mesmo com strings Arrow do pandas
 y = df['rotulo_encoded'].values
 
-# Divide em treino e teste
-X_train_text, X_test_text, y_train, y_test = train_test_split(X, y, test_size=0.3, random_state=42)
+# Retreino incremental (RETRAIN_MODE=incremental): só as notas novas desde a marca d'água + replay
+keys = row_keys(df, ['nota', 'rotulo'])
+plan = plan_retrain('rnn', keys)
 
 # 2. Pré-processamento de Texto
 # Configurações do Tokenizer
 vocab_size = 1000  # Tamanho máximo do vocabulário
 max_len = 50       # Comprimento máximo da sequência de tokens
 
-# Cria e ajusta o Tokenizer
-tokenizer = Tokenizer(num_words=vocab_size, oov_token="<OOV>")
-tokenizer.fit_on_texts(X_train_text)
+if plan.mode == 'incremental':
+    # Warm start: o vocabulário fica fixo (os índices do Embedding já treinado não podem mudar)
+    tokenizer = joblib.load(os.path.join(BASE_DIR, 'model_artifacts', 'tokenizer.pkl'))
+    new_tokens = [t for seq in tokenizer.texts_to_sequences(X[plan.indices[:plan.n_new]]) for t in seq]
+    oov_rate = float(np.mean(np.array(new_tokens) == 1)) if new_tokens else 0.0 # 1 = <OOV>
+    if oov_rate > MAX_NEW_OOV_RATE:
+        plan = plan.as_full(f"{oov_rate:.0%} de palavras novas fora do vocabulário > RNN_RETRAIN_MAX_OOV")
+print(f"Modo de treino: {plan}")
+if plan.mode == 'skip':
+    exit()
+
+if plan.mode == 'incremental':
+    X, y = X[plan.indices], y[plan.indices]
+
+# Divide em treino e teste
+X_train_text, X_test_text, y_train, y_test = train_test_split(X, y, test_size=0.3, random_state=42)
+
+if plan.mode == 'full':
+    # Cria e ajusta o Tokenizer
+    tokenizer = Tokenizer(num_words=vocab_size, oov_token="<OOV>")
+    tokenizer.fit_on_texts(X_train_text)
 
 # Converte o texto em sequências de números (tokens)
 train_sequences = tokenizer.texts_to_sequences(X_train_text)
@@ -53,26 +89,39 @@ X_test_padded = pad_sequences(test_sequences, maxlen=max_len, padding='post', tr
 
 
 # 3. Construção e Treinamento do Modelo LSTM (RNN)
-model = Sequential([
-    # Camada de Embedding: Converte tokens em vetores densos
-    Embedding(vocab_size, 16, input_length=max_len), 
-    
-    # Camada LSTM: captura dependências de sequência (memória)
-    LSTM(32),
-    
-    # Camada Densa de Saída: 1 neurônio e 'sigmoid' para classificação binária
-    Dense(1, activation='sigmoid') 
-])
+if plan.mode == 'incremental':
+    model = load_model(os.path.join(BASE_DIR, 'model_artifacts', 'rnn_model.h5'))
+    epochs, optimizer = epochs_for('rnn'), fine_tune_optimizer()
+else:
+    model = Sequential([
+        # Camada de Embedding: Converte tokens em vetores densos
+        # mask_zero=True: a LSTM ignora o padding, o que permite à API cortá-lo nos lotes
+        Embedding(vocab_size, 16, input_length=max_len, mask_zero=True), 
+        
+        # Camada LSTM: captura dependências de sequência (memória)
+        LSTM(32),
+        
+        # Camada Densa de Saída: 1 neurônio e 'sigmoid' para classificação binária
+        Dense(1, activation='sigmoid') 
+    ])
+    epochs, optimizer = 20, 'adam'
 
 # Compilação
-model.compile(optimizer='adam',
+model.compile(optimizer=optimizer,
               loss='binary_crossentropy',
               metrics=['accuracy'])
 
 print("Iniciando o treinamento do Modelo LSTM...")
 
-# Treinamento
-history = model.fit(X_train_padded, y_train, epochs=20, batch_size=4, verbose=0)
+# Treinamento: early stopping pela perda de validação, checkpoints e log por época (common/training.py).
+# Validação sorteada e estratificada pelo rótulo (não as últimas linhas, como no validation_split do Keras)
+fit_indices, val_indices = split_validation(y_train)
+validation_data = (X_train_padded[val_indices], y_train[val_indices]) if len(val_indices) else None
+monitor = TrainingMonitor('rnn', run_fingerprint('rnn', plan.mode, keys, plan.indices, epochs=epochs, batch_size=4),
+                          samples=len(fit_indices), epochs=epochs, validation_samples=len(val_indices))
+model, initial_epoch = monitor.resume(model)
+history = model.fit(X_train_padded[fit_indices], y_train[fit_indices], epochs=epochs, initial_epoch=initial_epoch, batch_size=4,
+                    validation_data=validation_data, callbacks=[monitor], verbose=0)
 
 # 4. Avaliação (Opcional, mas útil)
 loss, accuracy = model.evaluate(X_test_padded, y_test, verbose=0)
@@ -84,4 +133,15 @@ model.save(os.path.join(BASE_DIR, 'model_artifacts', 'rnn_model.h5'))
 joblib.dump(tokenizer, os.path.join(BASE_DIR, 'model_artifacts', 'tokenizer.pkl'))
 
 print(f"Modelo salvo em: {os.path.join(BASE_DIR, 'model_artifacts', 'rnn_model.h5')}")
-print(f"Tokenizer salvo em: {os.path.join(BASE_DIR, 'model_artifacts', 'tokenizer.pkl')}")
\ No newline at end of file
+print(f"Tokenizer salvo em: {os.path.join(BASE_DIR, 'model_artifacts', 'tokenizer.pkl')}")
+
+# 6. Exportar o vocabulário (JSON versionado) para o tokenizer rápido da API
+export_vocab(tokenizer, os.path.join(BASE_DIR, 'model_artifacts', 'tokenizer_vocab.json'), max_len)
+
+# 7. Marca d'água: tudo o que existe hoje no dataset já foi visto por este modelo
+TrainingWatermark.save('rnn', keys, plan.mode, new_samples=plan.n_new, replay_samples=plan.n_replay)
+monitor.finish()
+
+# 8. Registro: versão imutável dos artefatos (checksums + metadados); o alias latest aponta para ela
+publish_artifacts('rnn', metadata={"mode": plan.mode, "test_accuracy": round(float(accuracy), 4),
+                                   "samples": int(len(X_train_padded)), "epochs_run": monitor.epochs_run})
\ No newline at end of file